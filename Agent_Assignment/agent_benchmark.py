@@ -0,0 +1,431 @@
+# =========================================
+# End-to-End Load Benchmark
+# =========================================
+# Drive run_support_agent at increasing
+# concurrency against the local mock OpenAI
+# server and measure the agent's own overhead
+# (DataFrame lookups, JSON, logging)
+# =========================================
+#
+# Usage:
+#   python agent_benchmark.py run --out bench/base.json
+#   python agent_benchmark.py run --levels 1,4,16 --requests 300 --mock-latency-ms 80
+#   python agent_benchmark.py run --mock-url http://127.0.0.1:8089/v1   # external mock
+#   python agent_benchmark.py compare bench/base.json bench/new.json  # exit code 1 on regression
+# =========================================
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from agent_eval import _git_rev, load_questions
+from agent_observability import AgentObservability
+
+# The mock server lives with the other SDK examples
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "SDK_openai"))
+
+DEFAULT_LEVELS = (1, 2, 4, 8, 16)
+PERCENTILES = (50, 95, 99)
+
+# Share of traffic per expected tool (roughly what support sees in production)
+DEFAULT_MIX = {
+    "check_order_status": 0.45,
+    "get_tracking_info": 0.25,
+    "file_search": 0.30,
+}
+
+
+# =========================================
+# WORKLOAD
+# =========================================
+
+def build_workload(cases: List[Dict], n: int, mix: Dict[str, float] = None, seed: int = 0) -> List[Dict]:
+    """Sample n cases so that expected tools follow the traffic mix"""
+
+    mix = mix or DEFAULT_MIX
+    by_tool: Dict[str, List[Dict]] = {}
+    for case in cases:
+        by_tool.setdefault(case["expected_tool"], []).append(case)
+
+    tools = [tool for tool in mix if by_tool.get(tool)]
+    if not tools:
+        raise ValueError("No questions match the traffic mix")
+    weights = [mix[tool] for tool in tools]
+
+    rng = random.Random(seed)
+    return [rng.choice(by_tool[tool]) for tool in rng.choices(tools, weights=weights, k=n)]
+
+
+def _rss_bytes() -> Optional[int]:
+    """Current resident set size (Linux only, None elsewhere)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _timed(func: Callable, durations: List[float]) -> Callable:
+    """Wrap func so each call's duration is appended to durations"""
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - start)
+
+    return wrapper
+
+
+class _InteractionLog:
+    """Observer listener collecting every logged interaction"""
+
+    def __init__(self, interactions: List[Dict]):
+        self.interactions = interactions
+
+    def on_interaction(self, interaction: Dict):
+        self.interactions.append(interaction)
+
+
+def _percentiles_ms(values) -> Dict[str, float]:
+    if len(values) == 0:
+        return {}
+    points = np.percentile(np.asarray(values, dtype=float) * 1000, PERCENTILES)
+    return {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, points)}
+
+
+# =========================================
+# RUNNING ONE LEVEL
+# =========================================
+
+def run_level(
+    agent,
+    workload: List[Dict],
+    concurrency: int,
+    with_observer: bool = True,
+    trace_memory: bool = False,
+    log_dir: Optional[Path] = None,
+) -> Dict:
+    """
+    Push the workload through run_support_agent with `concurrency` threads
+
+    CPU per request is the worker thread's CPU time, i.e. the agent side
+    only - the in-process mock server runs on its own threads.
+    """
+
+    interactions: List[Dict] = []
+    log_durations: List[float] = []
+
+    if with_observer:
+        log_file = Path(log_dir or tempfile.mkdtemp()) / f"bench_c{concurrency}.jsonl"
+        log_file.unlink(missing_ok=True)
+        observer = AgentObservability(log_file=str(log_file))
+        observer.log_interaction = _timed(observer.log_interaction, log_durations)
+        observer.add_listener(_InteractionLog(interactions))
+        agent.observer = observer
+    else:
+        agent.observer = None
+
+    def one_request(case: Dict) -> Dict:
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        error = None
+        try:
+            agent.run_support_agent(case["question"], show_details=False, expected_tool=case["expected_tool"])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return {
+            "latency": time.perf_counter() - start,
+            "cpu": time.thread_time() - cpu_start,
+            "error": error,
+        }
+
+    rss_before = _rss_bytes()
+    if trace_memory:
+        tracemalloc.start()
+    heap_before = tracemalloc.get_traced_memory()[0] if trace_memory else None
+
+    process_cpu_start = time.process_time()
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):  # the agent prints every step
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one_request, workload))
+    wall_time = time.perf_counter() - started
+    process_cpu = time.process_time() - process_cpu_start
+
+    memory = {"rss_growth_bytes": None, "heap_growth_bytes": None, "heap_peak_bytes": None}
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory.update(heap_growth_bytes=current - heap_before, heap_peak_bytes=peak)
+    rss_after = _rss_bytes()
+    if rss_before is not None and rss_after is not None:
+        memory["rss_growth_bytes"] = rss_after - rss_before
+
+    latencies = [r["latency"] for r in results]
+    cpu_times = [r["cpu"] for r in results]
+    errors = [r["error"] for r in results if r["error"]]
+    tool_execution = [i["phase_timings"]["tool_execution"] for i in interactions
+                      if "tool_execution" in (i.get("phase_timings") or {})]
+
+    return {
+        "concurrency": concurrency,
+        "observer": with_observer,
+        "requests": len(results),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_time_seconds": round(wall_time, 3),
+        "throughput_rps": round(len(results) / wall_time, 2) if wall_time else None,
+        "latency_ms": _percentiles_ms(latencies),
+        "cpu_ms_per_request": {
+            "mean": round(float(np.mean(cpu_times)) * 1000, 3),
+            **_percentiles_ms(cpu_times),
+        },
+        "process_cpu_ms_per_request": round(process_cpu / len(results) * 1000, 3),
+        "log_interaction_ms": _percentiles_ms(log_durations) if with_observer else None,
+        "tool_execution_ms": _percentiles_ms(tool_execution) if with_observer else None,
+        **memory,
+    }
+
+
+# =========================================
+# FULL SUITE
+# =========================================
+
+def run_benchmark(
+    cases: List[Dict],
+    levels=DEFAULT_LEVELS,
+    requests_per_level: int = 200,
+    mix: Dict[str, float] = None,
+    mock_url: Optional[str] = None,
+    mock_latency_ms: float = 50.0,
+    mock_jitter_ms: float = 20.0,
+    compare_observer: bool = True,
+    trace_memory: bool = True,
+    seed: int = 0,
+) -> Dict:
+    """
+    Run every concurrency level (with and, optionally, without the observer)
+
+    Starts an in-process mock OpenAI server unless `mock_url` is given.
+    """
+
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    from openai import OpenAI
+    import httpx
+    import customer_support_agent as agent
+
+    server = None
+    if mock_url is None:
+        from mock_openai_server import MockOpenAIServer
+        server = MockOpenAIServer(latency_ms=mock_latency_ms, jitter_ms=mock_jitter_ms, seed=seed).start()
+        mock_url = server.base_url
+
+    # Pool sized for the highest level so connections are not the bottleneck
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    agent.client = OpenAI(
+        base_url=mock_url, api_key="mock", max_retries=0,
+        http_client=httpx.Client(limits=limits),
+    )
+    agent.vector_store_id = agent.vector_store_id or "vs_benchmark"
+
+    workload = build_workload(cases, requests_per_level, mix, seed)
+    log_dir = Path(tempfile.mkdtemp(prefix="agent_bench_"))
+
+    results = []
+    try:
+        # Warm up imports, connection pool and pandas code paths
+        run_level(agent, workload[: min(10, len(workload))], 1, with_observer=True, log_dir=log_dir)
+
+        for concurrency in levels:
+            modes = (True, False) if compare_observer else (True,)
+            for with_observer in modes:
+                print(f"⏱️ Concurrency {concurrency:>3} | observer {'on ' if with_observer else 'off'} ...",
+                      end=" ", flush=True)
+                level = run_level(agent, workload, concurrency, with_observer, trace_memory, log_dir)
+                results.append(level)
+                print(f"{level['throughput_rps']} req/s, p95 {level['latency_ms'].get('p95')} ms")
+    finally:
+        if server:
+            server.stop()
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests_per_level": requests_per_level,
+            "levels": list(levels),
+            "mix": mix or DEFAULT_MIX,
+            "mock": {
+                "url": None if server else mock_url,
+                "latency_ms": mock_latency_ms if server else None,
+                "jitter_ms": mock_jitter_ms if server else None,
+            },
+            "trace_memory": trace_memory,
+        },
+        "levels": results,
+        "observer_overhead": _observer_overhead(results),
+    }
+
+
+def _observer_overhead(results: List[Dict]) -> Dict[str, Dict]:
+    """Per-level difference between observer on and off"""
+
+    overhead = {}
+    for on in (r for r in results if r["observer"]):
+        off = next((r for r in results if not r["observer"] and r["concurrency"] == on["concurrency"]), None)
+        if off is None:
+            continue
+        overhead[str(on["concurrency"])] = {
+            "cpu_ms_per_request": round(on["cpu_ms_per_request"]["mean"] - off["cpu_ms_per_request"]["mean"], 3),
+            "latency_p50_ms": round(on["latency_ms"]["p50"] - off["latency_ms"]["p50"], 3),
+            "throughput_change_pct": round((on["throughput_rps"] / off["throughput_rps"] - 1) * 100, 2),
+        }
+    return overhead
+
+
+def print_benchmark(report: Dict):
+    """Print the benchmark as a table"""
+
+    print("\n" + "="*70)
+    print("🏁 LOAD BENCHMARK")
+    print("="*70)
+    meta = report["meta"]
+    print(f"\n⚙️ git {meta['git_rev']} | {meta['requests_per_level']} requests/level | mock {meta['mock']}")
+    print(f"\n{'conc':>4} {'obs':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'cpu ms':>7} {'log ms':>7} {'rss KB':>8} {'err':>4}")
+    for level in report["levels"]:
+        log_ms = (level["log_interaction_ms"] or {}).get("p50", "-")
+        rss = level["rss_growth_bytes"]
+        print(f"{level['concurrency']:>4} {'on' if level['observer'] else 'off':>4} "
+              f"{level['throughput_rps']:>8} {level['latency_ms']['p50']:>8} "
+              f"{level['latency_ms']['p95']:>8} {level['latency_ms']['p99']:>8} "
+              f"{level['cpu_ms_per_request']['mean']:>7} {log_ms:>7} "
+              f"{(rss // 1024) if rss is not None else '-':>8} {level['errors']:>4}")
+
+    if report["observer_overhead"]:
+        print("\n📊 Observer overhead (on - off):")
+        for concurrency, delta in report["observer_overhead"].items():
+            print(f"   concurrency {concurrency}: {delta}")
+    print("="*70 + "\n")
+
+
+# =========================================
+# COMPARING RUNS
+# =========================================
+
+def compare_benchmarks(base: Dict, new: Dict, tolerance: float = 0.15) -> Dict:
+    """
+    Compare two benchmark artifacts level by level
+
+    A regression is agent CPU per request or log_interaction p50 more
+    than `tolerance` (relative) above the base, or a throughput drop
+    larger than `tolerance`. Mock latency dominates wall-clock numbers,
+    so CPU is the primary signal for the agent's own overhead.
+    """
+
+    def key(level):
+        return (level["concurrency"], level["observer"])
+
+    base_levels = {key(level): level for level in base["levels"]}
+    regressions, deltas = [], []
+
+    for level in new["levels"]:
+        old = base_levels.get(key(level))
+        if old is None:
+            continue
+        label = f"c={level['concurrency']} observer={'on' if level['observer'] else 'off'}"
+        checks = [
+            ("cpu_ms_per_request", old["cpu_ms_per_request"]["mean"], level["cpu_ms_per_request"]["mean"], True),
+            ("throughput_rps", old["throughput_rps"], level["throughput_rps"], False),
+        ]
+        if old.get("log_interaction_ms") and level.get("log_interaction_ms"):
+            checks.append(("log_interaction_p50_ms", old["log_interaction_ms"]["p50"],
+                           level["log_interaction_ms"]["p50"], True))
+
+        for name, before, after, lower_is_better in checks:
+            if not before:
+                continue
+            change = after / before - 1
+            deltas.append({"level": label, "metric": name, "base": before, "new": after,
+                           "change_pct": round(change * 100, 2)})
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f"{label}: {name} {before} -> {after}")
+
+    return {"deltas": deltas, "regressions": regressions}
+
+
+# =========================================
+# CLI
+# =========================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load benchmark for the support agent")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the benchmark suite")
+    run.add_argument("--questions", default="eval_questions.jsonl")
+    run.add_argument("--out", default="benchmark_report.json")
+    run.add_argument("--levels", default=",".join(map(str, DEFAULT_LEVELS)))
+    run.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    run.add_argument("--mix", help='traffic mix as JSON, e.g. \'{"file_search": 0.5, ...}\'')
+    run.add_argument("--mock-url", help="use an already running mock server")
+    run.add_argument("--mock-latency-ms", type=float, default=50.0)
+    run.add_argument("--mock-jitter-ms", type=float, default=20.0)
+    run.add_argument("--no-observer-baseline", action="store_true", help="skip the observer-off runs")
+    run.add_argument("--no-tracemalloc", action="store_true", help="skip Python heap tracking (lower CPU noise)")
+    run.add_argument("--seed", type=int, default=0)
+
+    compare = sub.add_parser("compare", help="compare two benchmark artifacts")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--tolerance", type=float, default=0.15)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmark(
+            load_questions(args.questions),
+            levels=[int(level) for level in args.levels.split(",")],
+            requests_per_level=args.requests,
+            mix=json.loads(args.mix) if args.mix else None,
+            mock_url=args.mock_url,
+            mock_latency_ms=args.mock_latency_ms,
+            mock_jitter_ms=args.mock_jitter_ms,
+            compare_observer=not args.no_observer_baseline,
+            trace_memory=not args.no_tracemalloc,
+            seed=args.seed,
+        )
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print_benchmark(report)
+        print(f"✅ Benchmark written to {args.out}\n")
+        return 0
+
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+    result = compare_benchmarks(base, new, args.tolerance)
+    print(json.dumps(result, indent=2))
+    return 1 if result["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+# =========================================
+# Near-Duplicate Question Clustering
+# =========================================
+# Group paraphrased user questions from the
+# historical log (MinHash/LSH, or embeddings
+# with SimHash buckets) and report which
+# clusters carry the most traffic, latency
+# and token cost - i.e. what to cache
+# =========================================
+#
+# Usage:
+#   python agent_clusters.py                          # MinHash over agent_logs.jsonl
+#   python agent_clusters.py --since 2026-10-01 --top 20 --threshold 0.3   # looser, catches short paraphrases
+#   python agent_clusters.py --embeddings openai      # paraphrase-aware, needs the API
+# =========================================
+
+import argparse
+import hashlib
+import re
+import sys
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from agent_observability import AgentObservability
+
+CLUSTER_COLUMNS = ["user_question", "response_time_seconds", "token_usage", "sample_weight"]
+
+# Identifiers make otherwise identical questions look different
+_PLACEHOLDERS = [
+    (re.compile(r"\bord-\d+\b"), " order_id "),
+    (re.compile(r"\bmaeu\d{7}\b"), " container_number "),
+    (re.compile(r"\b\d+(\.\d+)?\b"), " number "),
+]
+_WORD = re.compile(r"[a-z_]+")
+_STOPWORDS = frozenset("""
+a an the is are was were be been am do does did can could would should will i me my we our
+you your it its of to in on for at by with from about how what when where which who why
+this that these there here please tell know need want any some have has had and or if so
+""".split())
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+# =========================================
+# NORMALIZATION
+# =========================================
+
+def _stem(word: str) -> str:
+    """Very light suffix stripping so returns/returned/returning match"""
+    if word.endswith(("ss", "us", "is")):  # class, status, analysis
+        return word
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, mask order/container ids and numbers, drop punctuation"""
+    text = str(question).lower()
+    for pattern, replacement in _PLACEHOLDERS:
+        text = pattern.sub(replacement, text)
+    return " ".join(_WORD.findall(text))
+
+
+def question_tokens(normalized: str) -> List[str]:
+    """Content words used as MinHash shingles"""
+    tokens = sorted({_stem(w) for w in normalized.split() if w not in _STOPWORDS})
+    return tokens or normalized.split() or [""]
+
+
+# =========================================
+# MINHASH / LSH
+# =========================================
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=7).digest(), "little")
+
+
+def minhash_signatures(token_lists: List[List[str]], num_perm: int = 64, seed: int = 0) -> np.ndarray:
+    """
+    MinHash signatures, shape (len(token_lists), num_perm)
+
+    All tokens are hashed once into a flat array; each permutation is a
+    universal hash (a*x + b) mod p and the per-question minimum is taken
+    with np.minimum.reduceat, so there is no Python loop per question.
+    """
+
+    lengths = np.fromiter((len(t) for t in token_lists), dtype=np.int64, count=len(token_lists))
+    flat = np.fromiter((_token_hash(tok) for tokens in token_lists for tok in tokens),
+                       dtype=np.uint64, count=int(lengths.sum()))
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    signatures = np.empty((len(token_lists), num_perm), dtype=np.uint64)
+    for i in range(num_perm):
+        # uint64 overflow wraps - still a valid (if not strictly universal) hash family
+        permuted = (a[i] * flat + b[i]) % np.uint64(_MERSENNE_PRIME)
+        signatures[:, i] = np.minimum.reduceat(permuted, starts)
+    return signatures
+
+
+def connected_components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Component label (smallest member index) per item for the edges left[k]-right[k]
+
+    Vectorized union-find: every round hooks the larger root of each edge
+    onto the smaller one, then compresses paths by pointer jumping, until
+    both ends of every edge share a root.
+    """
+
+    labels = np.arange(n)
+    while len(left):
+        roots_left, roots_right = labels[left], labels[right]
+        split = roots_left != roots_right
+        if not split.any():
+            break
+        lo = np.minimum(roots_left[split], roots_right[split])
+        hi = np.maximum(roots_left[split], roots_right[split])
+        np.minimum.at(labels, hi, lo)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+    return labels
+
+
+def _bucket_pairs(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """All (i, j) pairs of items with the same key, i before j in key order"""
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    run_start = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    run_length = np.diff(np.r_[run_start, len(keys)])
+    # Remaining members after each position within its bucket
+    remaining = np.repeat(run_start + run_length, run_length) - np.arange(len(keys)) - 1
+
+    left, right = [], []
+    positions = np.flatnonzero(remaining > 0)
+    offset = 1
+    while len(positions):
+        left.append(order[positions])
+        right.append(order[positions + offset])
+        offset += 1
+        positions = positions[remaining[positions] >= offset]
+    if not left:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+
+def _cluster_buckets(bucket_keys: np.ndarray, similar: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                     chunk_pairs: int = 1 << 16) -> np.ndarray:
+    """
+    Join items that share a bucket key (one column per band) and are similar enough
+
+    Every pair inside a bucket is checked, `chunk_pairs` pairs per
+    vectorized `similar(left, right)` call, then the accepted pairs are
+    merged by connected_components.
+    """
+
+    n, bands = bucket_keys.shape
+    edges_left, edges_right = [], []
+    for band in range(bands):
+        left, right = _bucket_pairs(bucket_keys[:, band])
+        for start in range(0, len(left), chunk_pairs):
+            l, r = left[start:start + chunk_pairs], right[start:start + chunk_pairs]
+            keep = similar(l, r)
+            edges_left.append(l[keep])
+            edges_right.append(r[keep])
+    if not edges_left:
+        return np.arange(n)
+    left, right = np.concatenate(edges_left), np.concatenate(edges_right)
+    if len(left):
+        # The same pair usually collides in several bands
+        left, right = np.unique(np.stack([left, right], axis=1), axis=0).T
+    return connected_components(n, left, right)
+
+
+def lsh_bands(num_perm: int, threshold: float) -> int:
+    """
+    Number of bands for `num_perm` MinHash rows so that pairs at `threshold`
+    Jaccard are likely to collide: the most rows per band whose S-curve
+    midpoint (1/bands) ** (1/rows) is still at or below the threshold
+    """
+
+    bands = num_perm
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows == 0 and (rows / num_perm) ** (1 / rows) <= threshold + 1e-9:
+            bands = num_perm // rows
+    return bands
+
+
+def cluster_minhash(token_lists: List[List[str]], threshold: float = 0.5,
+                    num_perm: int = 64, bands: Optional[int] = None, seed: int = 0) -> np.ndarray:
+    """
+    Cluster label per item; items with estimated Jaccard >= threshold are joined
+
+    bands defaults to lsh_bands(num_perm, threshold), so lowering the
+    threshold also widens the candidate search.
+    """
+
+    signatures = minhash_signatures(token_lists, num_perm, seed)
+    bands = bands or lsh_bands(num_perm, threshold)
+    rows = num_perm // bands
+    band_keys = np.stack([
+        np.bitwise_xor.reduce(signatures[:, band * rows:(band + 1) * rows] * np.uint64(0x9E3779B97F4A7C15 + band), axis=1)
+        for band in range(bands)
+    ], axis=1)
+
+    def similar(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        return (signatures[left] == signatures[right]).mean(axis=1) >= threshold
+
+    return _cluster_buckets(band_keys, similar)
+
+
+# =========================================
+# EMBEDDINGS / SIMHASH
+# =========================================
+
+def openai_embedder(model: str = "text-embedding-3-small", batch_size: int = 1000) -> Callable:
+    """Embedding function backed by the OpenAI embeddings endpoint"""
+    from openai import OpenAI
+    client = OpenAI()
+
+    def embed(texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            response = client.embeddings.create(model=model, input=texts[start:start + batch_size])
+            vectors.extend(item.embedding for item in response.data)
+        return np.asarray(vectors, dtype=np.float32)
+
+    return embed
+
+
+def cluster_embeddings(vectors: np.ndarray, threshold: float = 0.85,
+                       bits: int = 12, tables: int = 8, seed: int = 0) -> np.ndarray:
+    """
+    Cluster label per vector; cosine similarity >= threshold joins items
+
+    Candidates come from SimHash (random hyperplane) buckets, `tables`
+    independent tables of `bits` bits each.
+    """
+
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    rng = np.random.default_rng(seed)
+    planes = rng.standard_normal((vectors.shape[1], bits * tables)).astype(vectors.dtype)
+    signs = (vectors @ planes) > 0
+    weights = (1 << np.arange(bits)).astype(np.int64)
+    bucket_keys = np.stack(
+        [signs[:, t * bits:(t + 1) * bits] @ weights for t in range(tables)], axis=1
+    )
+
+    def similar(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        return np.einsum("ij,ij->i", vectors[left], vectors[right]) >= threshold
+
+    return _cluster_buckets(bucket_keys, similar)
+
+
+# =========================================
+# REPORT
+# =========================================
+
+def cluster_questions(
+    logs: pd.DataFrame,
+    threshold: Optional[float] = None,
+    embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Per-cluster traffic, latency and token cost, largest clusters first
+
+    Exact duplicates (after normalization) are collapsed first, so the
+    expensive step runs once per distinct question, not once per row.
+    threshold defaults to 0.5 Jaccard (MinHash) or 0.85 cosine (embed).
+    MinHash only sees shared words: short paraphrases such as "return
+    policy?" / "how do returns work" need ~0.3 (which also joins other
+    questions sharing one of two content words) or the embedding path.
+    """
+
+    logs = logs.reindex(columns=CLUSTER_COLUMNS).dropna(subset=["user_question"])
+    if logs.empty:
+        return pd.DataFrame()
+
+    frame = pd.DataFrame({
+        "question": logs["user_question"].astype(str),
+        "normalized": logs["user_question"].map(normalize_question),
+        "weight": logs["sample_weight"].fillna(1.0).astype(float),
+        "latency": logs["response_time_seconds"].astype(float),
+        "tokens": logs["token_usage"].map(lambda u: u.get("total_tokens") if isinstance(u, dict) else None),
+    })
+
+    distinct = frame["normalized"].drop_duplicates().reset_index(drop=True)
+    if embed is None:
+        labels = cluster_minhash([question_tokens(q) for q in distinct],
+                                 threshold if threshold is not None else 0.5, seed=seed)
+    else:
+        labels = cluster_embeddings(embed(distinct.tolist()),
+                                    threshold if threshold is not None else 0.85, seed=seed)
+    frame["cluster"] = frame["normalized"].map(pd.Series(labels, index=distinct.values))
+
+    total_weight = frame["weight"].sum()
+    frame["weighted_latency"] = frame["latency"] * frame["weight"]
+    frame["weighted_tokens"] = frame["tokens"].astype(float) * frame["weight"]
+
+    grouped = frame.groupby("cluster")
+    clusters = pd.DataFrame({
+        "requests": grouped["weight"].sum(),
+        "variants": grouped["normalized"].nunique(),
+        "avg_latency": grouped["weighted_latency"].sum() / grouped["weight"].sum(),
+        "p95_latency": grouped["latency"].quantile(0.95),
+        "total_tokens": grouped["weighted_tokens"].sum(min_count=1),
+    })
+    clusters["traffic_share"] = clusters["requests"] / total_weight * 100
+    clusters["avg_tokens"] = clusters["total_tokens"] / clusters["requests"]
+
+    # Most frequent original wording represents the cluster
+    representative = (
+        frame.groupby(["cluster", "question"])["weight"].sum()
+        .sort_values(ascending=False)
+        .reset_index()
+        .drop_duplicates("cluster")
+        .set_index("cluster")["question"]
+    )
+    clusters["representative"] = representative
+    clusters["examples"] = grouped["question"].agg(lambda q: list(dict.fromkeys(q))[:3])
+
+    clusters = clusters.sort_values("requests", ascending=False).reset_index(drop=True)
+    return clusters.round({"requests": 0, "avg_latency": 3, "p95_latency": 3, "total_tokens": 0,
+                           "traffic_share": 2, "avg_tokens": 1})
+
+
+def print_question_clusters(clusters: pd.DataFrame, top: int = 10):
+    """Print the largest clusters (candidates for caching/precomputing)"""
+
+    if clusters.empty:
+        print("⚠️ No questions found in the historical logs\n")
+        return
+
+    print("\n" + "="*70)
+    print("🧩 QUESTION CLUSTERS (CACHE CANDIDATES)")
+    print("="*70)
+    print(f"\n📊 {len(clusters)} clusters | top {min(top, len(clusters))} cover "
+          f"{clusters['traffic_share'].head(top).sum():.1f}% of traffic\n")
+
+    for rank, row in enumerate(clusters.head(top).itertuples(), 1):
+        tokens = "n/a" if pd.isna(row.total_tokens) else f"{int(row.total_tokens)} total, {row.avg_tokens} avg"
+        print(f"{rank:>2}. {row.representative[:60]}")
+        print(f"    📈 {int(row.requests)} requests ({row.traffic_share}%) | {row.variants} variants")
+        print(f"    ⏱️ avg {row.avg_latency}s, p95 {row.p95_latency}s | 🪙 tokens: {tokens}")
+        if row.variants > 1:
+            print(f"    e.g. {' | '.join(e[:40] for e in row.examples)}")
+    print("="*70 + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate user questions")
+    parser.add_argument("--log", default="agent_logs.jsonl")
+    parser.add_argument("--since", help="only consider interactions after this ISO time")
+    parser.add_argument("--threshold", type=float, help="Jaccard (MinHash) or cosine (embeddings)")
+    parser.add_argument("--embeddings", choices=["openai"], help="cluster embeddings instead of MinHash")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--out", help="write all clusters as CSV")
+    args = parser.parse_args(argv)
+
+    observer = AgentObservability(log_file=args.log)
+    logs = observer.load_historical_logs(since=args.since, columns=CLUSTER_COLUMNS)
+    embed = openai_embedder() if args.embeddings == "openai" else None
+
+    clusters = cluster_questions(logs, threshold=args.threshold, embed=embed)
+    print_question_clusters(clusters, args.top)
+    if args.out and not clusters.empty:
+        clusters.to_csv(args.out, index=False)
+        print(f"✅ Clusters written to {args.out}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+# =========================================
+# Live Agent Performance Dashboard
+# =========================================
+# Tails agent_logs.jsonl (only newly appended
+# bytes are read on each refresh) and shows
+# rolling request rate, latency percentiles,
+# error rate, cache hit rate and accuracy
+# =========================================
+#
+# Usage:
+#   python agent_dashboard.py                          # Gradio UI on http://127.0.0.1:7861
+#   python agent_dashboard.py --ui terminal --refresh 2
+#   python agent_dashboard.py --log eval_logs.jsonl --window 2000
+#
+# Memory is bounded: only the last `window` interactions are kept.
+# =========================================
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from agent_observability import log_segments
+
+try:
+    import gradio as gr
+except ImportError:  # terminal UI still works without gradio
+    gr = None
+
+PERCENTILES = (50, 95, 99)
+
+# Generous upper bound on the size of one logged interaction
+BACKFILL_BYTES_PER_RECORD = 4096
+
+
+# =========================================
+# INCREMENTAL LOG TAILING
+# =========================================
+
+class LogTailer:
+    """
+    Read complete lines appended to a file since the previous poll
+
+    backfill_bytes limits how much existing history is read on the first
+    poll (None reads the whole file, 0 starts at the end).
+    """
+
+    def __init__(self, path: Path, backfill_bytes: Optional[int] = None):
+        self.path = Path(path)
+        try:
+            stat = self.path.stat()
+            size, self._file_id = stat.st_size, (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            size, self._file_id = 0, None
+        self.offset = 0 if backfill_bytes is None else max(0, size - backfill_bytes)
+        self._skip_partial = self.offset > 0 and not self._at_line_start()
+        self._carry = b""
+
+    def _at_line_start(self) -> bool:
+        """True when the byte before offset ends a line"""
+        with self.path.open("rb") as f:
+            f.seek(self.offset - 1)
+            return f.read(1) == b"\n"
+
+    def poll(self) -> List[bytes]:
+        try:
+            f = self.path.open("rb")
+        except FileNotFoundError:
+            return []
+
+        with f:
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id != self._file_id or stat.st_size < self.offset:
+                # Replaced (e.g. a segment compacted and recreated), truncated or rotated - start over
+                self._file_id = file_id
+                self.offset, self._carry, self._skip_partial = 0, b"", False
+            if stat.st_size == self.offset:
+                return []
+
+            f.seek(self.offset)
+            data = self._carry + f.read(stat.st_size - self.offset)
+        self.offset = stat.st_size
+
+        lines = data.split(b"\n")
+        self._carry = lines.pop()  # partial line still being written
+        if self._skip_partial and lines:
+            lines.pop(0)
+            self._skip_partial = False
+        return [line for line in lines if line.strip()]
+
+
+class LogFollower:
+    """
+    Tail the main log and any per-process segments
+
+    Compaction moves segment lines into the main log verbatim, so a
+    bounded set of recent line hashes keeps them from being counted twice.
+    """
+
+    def __init__(self, log_file: str, backfill_bytes: Optional[int] = None, dedupe_window: int = 20000):
+        self.log_file = Path(log_file)
+        self.tailers: Dict[Path, LogTailer] = {self.log_file: LogTailer(self.log_file, backfill_bytes)}
+        self._seen_order = deque(maxlen=dedupe_window)
+        self._seen = set()
+
+    def poll(self) -> List[Dict]:
+        for path in log_segments(self.log_file):
+            if path not in self.tailers:
+                # Segments appearing later are read from their start
+                self.tailers[path] = LogTailer(path)
+
+        records = []
+        for path, tailer in list(self.tailers.items()):
+            for line in tailer.poll():
+                digest = hashlib.blake2b(line, digest_size=8).digest()
+                if digest in self._seen:
+                    continue
+                if len(self._seen_order) == self._seen_order.maxlen:
+                    self._seen.discard(self._seen_order[0])
+                self._seen_order.append(digest)
+                self._seen.add(digest)
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+            if path != self.log_file and not path.exists():
+                del self.tailers[path]  # compacted away
+        return records
+
+
+# =========================================
+# ROLLING WINDOW STATISTICS
+# =========================================
+
+class RollingStats:
+    """Fixed-size windows of recent interactions and the derived metrics"""
+
+    def __init__(self, window: int = 5000, rate_window_seconds: float = 60.0):
+        self.rate_window_seconds = rate_window_seconds
+        # (timestamp, weight, tool, latency, success, tool_match, cache_hit, phases)
+        # Phases ride along with their request so both cover the same window
+        self.requests = deque(maxlen=window)
+        self.total_seen = 0
+
+    def add(self, record: Dict):
+        try:
+            timestamp = datetime.fromisoformat(record["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return
+        weight = float(record.get("sample_weight") or 1.0)
+        cache_hit = record.get("cache_hit")
+        if cache_hit is None and isinstance(record.get("token_usage"), dict):
+            cached = record["token_usage"].get("cached_tokens")
+            cache_hit = None if cached is None else cached > 0
+
+        phases = tuple(
+            (phase, float(seconds))
+            for phase, seconds in (record.get("phase_timings") or {}).items()
+            if seconds is not None
+        )
+
+        self.requests.append((
+            timestamp, weight, record.get("tool_selected") or "none",
+            float(record.get("response_time_seconds") or 0.0),
+            bool(record.get("success")), record.get("tool_match"), cache_hit, phases,
+        ))
+        self.total_seen += 1
+
+    @staticmethod
+    def _percentiles(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {}
+        points = np.percentile(np.asarray(values, dtype=float), PERCENTILES)
+        return {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, points)}
+
+    def snapshot(self, now: Optional[float] = None) -> Dict:
+        """Metrics over the current windows"""
+
+        now = now or time.time()
+        if not self.requests:
+            return {"window": 0, "total_seen": self.total_seen}
+
+        timestamps, weights, tools, latencies, success, matches, cache, phases = zip(*self.requests)
+        weights = np.asarray(weights)
+        timestamps = np.asarray(timestamps)
+
+        recent = timestamps >= now - self.rate_window_seconds
+        labeled = [(m, w) for m, w in zip(matches, weights) if m is not None]
+        cache_known = [(c, w) for c, w in zip(cache, weights) if c is not None]
+
+        by_tool: Dict[str, List[float]] = {}
+        for tool, latency in zip(tools, latencies):
+            by_tool.setdefault(tool, []).append(latency)
+        by_phase: Dict[str, List[float]] = {}
+        for request_phases in phases:
+            for phase, seconds in request_phases:
+                by_phase.setdefault(phase, []).append(seconds)
+
+        return {
+            "window": len(self.requests),
+            "total_seen": self.total_seen,
+            "window_start": datetime.fromtimestamp(timestamps.min()).isoformat(timespec="seconds"),
+            "last_request": datetime.fromtimestamp(timestamps.max()).isoformat(timespec="seconds"),
+            "requests_per_minute": round(float(weights[recent].sum()) * 60 / self.rate_window_seconds, 2),
+            "error_rate": round(float(weights[~np.asarray(success)].sum() / weights.sum() * 100), 2),
+            "cache_hit_rate": (
+                round(sum(w for c, w in cache_known if c) / sum(w for _, w in cache_known) * 100, 2)
+                if cache_known else None
+            ),
+            "tool_accuracy": (
+                round(sum(w for m, w in labeled if m) / sum(w for _, w in labeled) * 100, 2)
+                if labeled else None
+            ),
+            "latency_overall": self._percentiles(list(latencies)),
+            "latency_by_tool": {tool: dict(self._percentiles(v), n=len(v)) for tool, v in sorted(by_tool.items())},
+            "latency_by_phase": {phase: dict(self._percentiles(v), n=len(v)) for phase, v in sorted(by_phase.items())},
+        }
+
+
+class Dashboard:
+    """Follower + rolling stats, safe to refresh from several UI threads"""
+
+    def __init__(self, log_file: str, window: int = 5000, rate_window_seconds: float = 60.0,
+                 from_end: bool = False):
+        # Only the tail of a large log is needed to fill the window
+        self.follower = LogFollower(log_file, 0 if from_end else window * BACKFILL_BYTES_PER_RECORD)
+        self.stats = RollingStats(window, rate_window_seconds)
+        self._lock = threading.Lock()
+
+    def refresh(self) -> Dict:
+        with self._lock:
+            for record in self.follower.poll():
+                self.stats.add(record)
+            return self.stats.snapshot()
+
+
+# =========================================
+# RENDERING
+# =========================================
+
+def _fmt(value, suffix: str = "") -> str:
+    return "n/a" if value is None else f"{value}{suffix}"
+
+
+def _latency_table(rows: Dict[str, Dict], label: str) -> str:
+    lines = [f"| {label} | n | p50 (s) | p95 (s) | p99 (s) |", "|---|---|---|---|---|"]
+    for name, stats in rows.items():
+        lines.append(f"| {name} | {stats['n']} | {stats['p50']} | {stats['p95']} | {stats['p99']} |")
+    return "\n".join(lines)
+
+
+def render_markdown(snapshot: Dict) -> tuple:
+    """(headline, tool table, phase table) as Markdown"""
+
+    if not snapshot.get("window"):
+        return "⏳ Waiting for interactions...", "", ""
+
+    overall = snapshot["latency_overall"]
+    headline = (
+        f"**📈 Rate:** {snapshot['requests_per_minute']} req/min &nbsp;|&nbsp; "
+        f"**⏱️ p50/p95/p99:** {overall['p50']}s / {overall['p95']}s / {overall['p99']}s &nbsp;|&nbsp; "
+        f"**❌ Errors:** {snapshot['error_rate']}% &nbsp;|&nbsp; "
+        f"**💾 Cache hits:** {_fmt(snapshot['cache_hit_rate'], '%')} &nbsp;|&nbsp; "
+        f"**🎯 Accuracy:** {_fmt(snapshot['tool_accuracy'], '%')}\n\n"
+        f"Window: last {snapshot['window']} interactions "
+        f"({snapshot['window_start']} → {snapshot['last_request']}), {snapshot['total_seen']} seen"
+    )
+    return (
+        headline,
+        _latency_table(snapshot["latency_by_tool"], "Tool"),
+        _latency_table(snapshot["latency_by_phase"], "Phase") if snapshot["latency_by_phase"] else "",
+    )
+
+
+def render_text(snapshot: Dict, log_file: str) -> str:
+    """Plain-text dashboard for the terminal UI"""
+
+    lines = ["=" * 70, f"📊 AGENT LIVE DASHBOARD - {log_file}", "=" * 70]
+    if not snapshot.get("window"):
+        lines.append("\n⏳ Waiting for interactions...")
+        return "\n".join(lines)
+
+    overall = snapshot["latency_overall"]
+    lines += [
+        f"\n📈 Request rate:   {snapshot['requests_per_minute']} req/min",
+        f"⏱️ Latency:        p50 {overall['p50']}s | p95 {overall['p95']}s | p99 {overall['p99']}s",
+        f"❌ Error rate:     {snapshot['error_rate']}%",
+        f"💾 Cache hit rate: {_fmt(snapshot['cache_hit_rate'], '%')}",
+        f"🎯 Tool accuracy:  {_fmt(snapshot['tool_accuracy'], '%')}",
+        f"\n{'':<2}{'name':<24}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}",
+    ]
+    for title, rows in (("🔧 Tools", snapshot["latency_by_tool"]), ("🧩 Phases", snapshot["latency_by_phase"])):
+        if rows:
+            lines.append(title)
+            for name, stats in rows.items():
+                lines.append(f"  {name:<24}{stats['n']:>7}{stats['p50']:>9}{stats['p95']:>9}{stats['p99']:>9}")
+    lines.append(f"\nWindow: {snapshot['window']} interactions ({snapshot['window_start']} → "
+                 f"{snapshot['last_request']}) | {snapshot['total_seen']} seen")
+    lines.append("=" * 70)
+    return "\n".join(lines)
+
+
+# =========================================
+# USER INTERFACES
+# =========================================
+
+def run_terminal(dashboard: Dashboard, log_file: str, refresh: float = 2.0):
+    """Redraw the text dashboard every `refresh` seconds until Ctrl+C"""
+    try:
+        while True:
+            text = render_text(dashboard.refresh(), log_file)
+            print("\033[2J\033[H" + text, flush=True)
+            time.sleep(refresh)
+    except KeyboardInterrupt:
+        print("\n👋 Dashboard stopped\n")
+
+
+def build_gradio_app(dashboard: Dashboard, log_file: str, refresh: float = 2.0):
+    """Gradio Blocks app polling the dashboard every `refresh` seconds"""
+
+    def update():
+        return render_markdown(dashboard.refresh())
+
+    with gr.Blocks(title="Agent Live Dashboard", theme=gr.themes.Soft()) as demo:
+        gr.Markdown(f"# 📊 Agent Live Dashboard\nTailing `{log_file}` every {refresh:g}s")
+        headline = gr.Markdown()
+        with gr.Row():
+            with gr.Column():
+                gr.Markdown("### 🔧 Latency by Tool")
+                tool_table = gr.Markdown()
+            with gr.Column():
+                gr.Markdown("### 🧩 Latency by Phase")
+                phase_table = gr.Markdown()
+
+        outputs = [headline, tool_table, phase_table]
+        if hasattr(gr, "Timer"):
+            gr.Timer(refresh).tick(update, outputs=outputs)
+            demo.load(update, outputs=outputs)
+        else:  # gradio < 4.40
+            demo.load(update, outputs=outputs, every=refresh)
+    return demo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live dashboard for agent_logs.jsonl")
+    parser.add_argument("--log", default="agent_logs.jsonl")
+    parser.add_argument("--ui", choices=["gradio", "terminal"], default="gradio")
+    parser.add_argument("--refresh", type=float, default=2.0, help="seconds between updates")
+    parser.add_argument("--window", type=int, default=5000, help="interactions kept in memory")
+    parser.add_argument("--rate-window", type=float, default=60.0, help="seconds used for request rate")
+    parser.add_argument("--from-end", action="store_true", help="ignore interactions logged before start")
+    parser.add_argument("--port", type=int, default=int(os.getenv("DASHBOARD_PORT", "7861")))
+    args = parser.parse_args()
+
+    dashboard = Dashboard(args.log, args.window, args.rate_window, args.from_end)
+
+    if args.ui == "gradio" and gr is None:
+        print("⚠️ Gradio is not installed - falling back to the terminal UI")
+        args.ui = "terminal"
+
+    if args.ui == "terminal":
+        run_terminal(dashboard, args.log, args.refresh)
+    else:
+        build_gradio_app(dashboard, args.log, args.refresh).launch(server_port=args.port)
+
+
+if __name__ == "__main__":
+    main()
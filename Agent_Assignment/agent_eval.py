@@ -0,0 +1,446 @@
+# =========================================
+# Offline Evaluation Harness
+# =========================================
+# Run a labeled question set through
+# run_support_agent (live API or local stub),
+# report tool-routing accuracy and latency,
+# and diff two runs to catch regressions
+# =========================================
+#
+# Usage:
+#   python agent_eval.py run --questions eval_questions.jsonl --out runs/base.json
+#   python agent_eval.py run --questions eval_questions.jsonl --out runs/new.json
+#   python agent_eval.py diff runs/base.json runs/new.json   # exit code 1 on regression
+#   python agent_eval.py run --stub                          # smoke-test the harness only
+# =========================================
+
+import argparse
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from agent_observability import AgentObservability
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+# =========================================
+# LABELED QUESTIONS
+# =========================================
+
+def load_questions(path: str) -> List[Dict]:
+    """
+    Load labeled cases from JSONL or CSV
+
+    Each case needs `question` and `expected_tool`; `id` is optional
+    (defaults to the row number) and is used to match cases across runs.
+    """
+
+    path = Path(path)
+    if path.suffix == ".csv":
+        cases = pd.read_csv(path).to_dict("records")
+    else:
+        with path.open("r", encoding="utf-8") as f:
+            cases = [json.loads(line) for line in f if line.strip()]
+
+    for i, case in enumerate(cases, 1):
+        case.setdefault("id", str(i))
+        case["id"] = str(case["id"])
+    return cases
+
+
+# =========================================
+# LOCAL STUB FOR THE RESPONSES API
+# =========================================
+
+class _StubResponses:
+    """
+    Deterministic stand-in for client.responses following the agent's routing rules
+
+    It routes with the same ORD-/MAEU patterns that label eval_questions.jsonl,
+    so stub accuracy is 100% by construction: stub runs smoke-test the
+    harness (agent loop, logging, reporting), not the router.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def _sleep(self):
+        if self.latency or self.jitter:
+            with self._lock:
+                delay = self.latency + self._rng.uniform(0, self.jitter)
+            time.sleep(delay)
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"{prefix}_stub_{self._counter}"
+
+    def create(self, **kwargs):
+        self._sleep()
+        usage = SimpleNamespace(input_tokens=0, output_tokens=0, total_tokens=0)
+
+        messages = [m for m in kwargs["input"] if isinstance(m, dict) and m.get("role") == "user"]
+        question = messages[-1]["content"] if messages else ""
+        usage.input_tokens = len(question.split()) + 50
+
+        # Call #2: summarize the tool output
+        if kwargs.get("tool_choice") == "none":
+            outputs = [m["output"] for m in kwargs["input"] if m.get("type") == "function_call_output"]
+            text = f"Here is what I found: {outputs[-1] if outputs else 'no data'}"
+            usage.output_tokens = len(text.split())
+            usage.total_tokens = usage.input_tokens + usage.output_tokens
+            return SimpleNamespace(id=self._next_id("resp"), output=[], output_text=text, usage=usage)
+
+        # Call #1: route like the instructions in run_support_agent
+        order = re.search(r"ORD-\d+", question, re.IGNORECASE)
+        container = re.search(r"MAEU\d{7}", question, re.IGNORECASE)
+        if order:
+            call = ("check_order_status", {"order_id": order.group(0).upper()})
+        elif container:
+            call = ("get_tracking_info", {"container_number": container.group(0).upper()})
+        else:
+            call = None
+
+        if call is None:
+            text = "According to our FAQ, please see the relevant policy section."
+            usage.output_tokens = len(text.split())
+            usage.total_tokens = usage.input_tokens + usage.output_tokens
+            search = SimpleNamespace(type="file_search_call", status="completed", queries=[question])
+            return SimpleNamespace(id=self._next_id("resp"), output=[search], output_text=text, usage=usage)
+
+        name, arguments = call
+        item = SimpleNamespace(
+            type="function_call", name=name, arguments=json.dumps(arguments),
+            call_id=self._next_id("call"),
+        )
+        usage.output_tokens = 20
+        usage.total_tokens = usage.input_tokens + usage.output_tokens
+        return SimpleNamespace(id=self._next_id("resp"), output=[item], output_text="", usage=usage)
+
+
+class StubOpenAIClient:
+    """Minimal OpenAI client replacement for offline evaluation"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.responses = _StubResponses(latency, jitter, seed)
+
+
+# =========================================
+# RUNNING CASES
+# =========================================
+
+class _InteractionCapture:
+    """Observer listener remembering the last interaction of each worker thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def on_interaction(self, interaction: Dict):
+        self._local.interaction = interaction
+
+    def pop(self) -> Optional[Dict]:
+        interaction = getattr(self._local, "interaction", None)
+        self._local.interaction = None
+        return interaction
+
+
+def _run_case(agent, capture: _InteractionCapture, case: Dict) -> Dict:
+    start = time.perf_counter()
+    error = None
+    try:
+        agent.run_support_agent(case["question"], show_details=False, expected_tool=case["expected_tool"])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    latency = time.perf_counter() - start
+
+    interaction = capture.pop() or {}
+    tool_selected = interaction.get("tool_selected") or "none"
+    return {
+        "id": case["id"],
+        "question": case["question"],
+        "expected_tool": case["expected_tool"],
+        "tool_selected": tool_selected,
+        "tool_match": tool_selected == case["expected_tool"],
+        "success": error is None and bool(interaction.get("success")),
+        "latency_seconds": round(latency, 4),
+        "phase_timings": interaction.get("phase_timings") or {},
+        "token_usage": interaction.get("token_usage") or {},
+        "error": error or interaction.get("error"),
+    }
+
+
+def run_evaluation(
+    cases: List[Dict],
+    stub: bool = True,
+    concurrency: int = 8,
+    stub_latency: float = 0.0,
+    stub_jitter: float = 0.0,
+    log_file: str = "eval_logs.jsonl",
+) -> Dict:
+    """
+    Run every case through run_support_agent and build the report artifact
+
+    stub=True swaps the OpenAI client for StubOpenAIClient (no network,
+    routing accuracy is not meaningful); stub=False uses the live API and
+    sets up the FAQ vector store.
+    """
+
+    if stub:
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+    import customer_support_agent as agent
+
+    if stub:
+        agent.client = StubOpenAIClient(stub_latency, stub_jitter)
+    elif agent.vector_store_id is None:
+        agent.vector_store_id = agent.setup_faq_knowledge_base()
+
+    capture = _InteractionCapture()
+    agent.observer = AgentObservability(log_file=log_file)
+    agent.observer.add_listener(capture)
+
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):  # the agent prints every step
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda case: _run_case(agent, capture, case), cases))
+    wall_time = time.perf_counter() - started
+
+    report = build_report(results)
+    report["meta"] = {
+        "created_at": datetime.now().isoformat(),
+        "mode": "stub" if stub else "live",
+        "git_rev": _git_rev(),
+        "cases": len(cases),
+        "concurrency": concurrency,
+        "wall_time_seconds": round(wall_time, 3),
+    }
+    return report
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# =========================================
+# REPORTING
+# =========================================
+
+def _percentiles(values: pd.Series) -> Dict[str, float]:
+    if values.empty:
+        return {}
+    return {f"p{p}": round(float(values.quantile(p / 100)), 4) for p in PERCENTILES}
+
+
+def build_report(results: List[Dict]) -> Dict:
+    """Accuracy, confusion matrix and latency percentiles for a list of case results"""
+
+    df = pd.DataFrame(results)
+
+    per_tool = (
+        df.groupby("expected_tool")
+        .agg(cases=("tool_match", "size"), correct=("tool_match", "sum"))
+        .assign(accuracy=lambda t: (t["correct"] / t["cases"] * 100).round(2))
+    )
+    confusion = pd.crosstab(df["expected_tool"], df["tool_selected"])
+
+    phases = pd.DataFrame(df["phase_timings"].tolist())
+    tokens = pd.DataFrame(df["token_usage"].tolist())
+
+    return {
+        "summary": {
+            "cases": len(df),
+            "accuracy": round(float(df["tool_match"].mean() * 100), 2),
+            "success_rate": round(float(df["success"].mean() * 100), 2),
+            "errors": int(df["error"].notna().sum()),
+            "total_tokens": int(tokens.get("total_tokens", pd.Series(dtype=float)).sum()),
+        },
+        "per_tool": {
+            tool: {k: (int(v) if k != "accuracy" else float(v)) for k, v in row.items()}
+            for tool, row in per_tool.iterrows()
+        },
+        "confusion_matrix": {
+            expected: {selected: int(n) for selected, n in row.items()}
+            for expected, row in confusion.iterrows()
+        },
+        "latency": {
+            "overall": _percentiles(df["latency_seconds"]),
+            "by_tool": {
+                tool: _percentiles(group["latency_seconds"])
+                for tool, group in df.groupby("expected_tool")
+            },
+            "by_phase": {phase: _percentiles(phases[phase].dropna()) for phase in phases.columns},
+        },
+        "cases": results,
+    }
+
+
+def print_report(report: Dict):
+    """Print a compact version of a report artifact"""
+
+    summary = report["summary"]
+    print("\n" + "="*70)
+    print("🧪 EVALUATION REPORT")
+    print("="*70)
+    meta = report.get("meta", {})
+    if meta:
+        print(f"\n⚙️ Mode: {meta['mode']} | Cases: {meta['cases']} | Concurrency: {meta['concurrency']}")
+    if meta.get("mode") == "stub":
+        print(f"\n🎯 Tool Routing Accuracy: {summary['accuracy']}% (stub routing - harness smoke test only)")
+    else:
+        print(f"\n🎯 Tool Routing Accuracy: {summary['accuracy']}%")
+    print(f"✅ Success Rate: {summary['success_rate']}%")
+    print(f"❌ Errors: {summary['errors']}")
+
+    print(f"\n⏱️ Latency (s): {report['latency']['overall']}")
+    for phase, stats in report["latency"]["by_phase"].items():
+        print(f"   {phase}: {stats}")
+
+    print(f"\n🔀 Confusion Matrix (rows = expected):")
+    print(pd.DataFrame(report["confusion_matrix"]).T.fillna(0).astype(int).to_string())
+    print("="*70 + "\n")
+
+
+# =========================================
+# DIFFING RUNS
+# =========================================
+
+def diff_runs(
+    base: Dict,
+    new: Dict,
+    accuracy_tolerance: float = 1.0,
+    latency_tolerance: float = 0.2,
+) -> Dict:
+    """
+    Compare two report artifacts
+
+    A regression is an accuracy drop above `accuracy_tolerance` percentage
+    points (overall or per tool), a latency percentile more than
+    `latency_tolerance` (relative) slower, or a case that used to be
+    routed correctly and no longer is.
+
+    Routing checks only apply to live runs: the stub routes with the same
+    rules that produced the labels. Stub runs are compared on latency only,
+    and a stub run cannot be diffed against a live one (ValueError).
+    """
+
+    modes = {base.get("meta", {}).get("mode"), new.get("meta", {}).get("mode")}
+    if "stub" in modes and len(modes) > 1:
+        raise ValueError("Cannot diff a stub run against a live run")
+    check_routing = "stub" not in modes
+
+    regressions = []
+
+    accuracy_delta = new["summary"]["accuracy"] - base["summary"]["accuracy"]
+    if check_routing and accuracy_delta < -accuracy_tolerance:
+        regressions.append(f"accuracy {base['summary']['accuracy']}% -> {new['summary']['accuracy']}%")
+
+    for tool, stats in base["per_tool"].items() if check_routing else ():
+        new_stats = new["per_tool"].get(tool)
+        if new_stats and new_stats["accuracy"] - stats["accuracy"] < -accuracy_tolerance:
+            regressions.append(f"{tool} accuracy {stats['accuracy']}% -> {new_stats['accuracy']}%")
+
+    for name, value in base["latency"]["overall"].items():
+        new_value = new["latency"]["overall"].get(name)
+        if new_value is not None and value > 0 and new_value > value * (1 + latency_tolerance):
+            regressions.append(f"latency {name} {value}s -> {new_value}s")
+
+    base_cases = {c["id"]: c for c in base["cases"]}
+    flipped = [
+        c["id"] for c in new["cases"]
+        if c["id"] in base_cases and base_cases[c["id"]]["tool_match"] and not c["tool_match"]
+    ]
+    fixed = [
+        c["id"] for c in new["cases"]
+        if c["id"] in base_cases and not base_cases[c["id"]]["tool_match"] and c["tool_match"]
+    ]
+    if check_routing and flipped:
+        regressions.append(f"{len(flipped)} case(s) now routed incorrectly: {', '.join(flipped[:10])}")
+
+    return {
+        "accuracy_delta": round(accuracy_delta, 2),
+        "latency_delta": {
+            name: round(new["latency"]["overall"].get(name, 0) - value, 4)
+            for name, value in base["latency"]["overall"].items()
+        },
+        "newly_incorrect": flipped,
+        "newly_correct": fixed,
+        "routing_checked": check_routing,
+        "regressions": regressions,
+    }
+
+
+# =========================================
+# CLI
+# =========================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Evaluate support agent tool routing")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run a labeled question set")
+    run.add_argument("--questions", default="eval_questions.jsonl")
+    run.add_argument("--out", default="eval_report.json")
+    run.add_argument("--stub", action="store_true", help="use the local stub instead of the live API")
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--stub-latency", type=float, default=0.0, help="seconds per stubbed API call")
+    run.add_argument("--stub-jitter", type=float, default=0.0)
+
+    diff = sub.add_parser("diff", help="compare two report artifacts")
+    diff.add_argument("base")
+    diff.add_argument("new")
+    diff.add_argument("--accuracy-tolerance", type=float, default=1.0)
+    diff.add_argument("--latency-tolerance", type=float, default=0.2)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_evaluation(
+            load_questions(args.questions),
+            stub=args.stub,
+            concurrency=args.concurrency,
+            stub_latency=args.stub_latency,
+            stub_jitter=args.stub_jitter,
+        )
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print_report(report)
+        print(f"✅ Report written to {args.out}\n")
+        return 0
+
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+    try:
+        result = diff_runs(base, new, args.accuracy_tolerance, args.latency_tolerance)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    print(json.dumps(result, indent=2))
+    return 1 if result["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# =========================================
+# Agent Metrics Exporter (Prometheus / OpenMetrics)
+# =========================================
+# Expose AgentObservability data on an HTTP
+# endpoint that Prometheus can scrape
+# =========================================
+#
+# Usage:
+#   observer = create_observer()
+#   start_metrics_server(observer, port=9108)
+#   # -> scrape http://localhost:9108/metrics
+# =========================================
+
+from typing import Dict, Optional
+
+try:
+    from prometheus_client import (
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        start_http_server,
+    )
+except ImportError:  # optional dependency
+    CollectorRegistry = None
+
+from agent_observability import AgentObservability
+
+# LLM round trips take seconds, not milliseconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+
+class AgentMetricsExporter:
+    """
+    Observer listener that turns logged interactions into Prometheus metrics
+
+    Metrics exposed:
+    - agent_requests_total{tool, outcome}
+    - agent_request_latency_seconds{tool}
+    - agent_phase_latency_seconds{phase}
+    - agent_tool_selection_accuracy{expected_tool}
+    - agent_tokens_total{type}
+    - agent_requests_in_flight
+    """
+
+    def __init__(self, registry: Optional["CollectorRegistry"] = None):
+        if CollectorRegistry is None:
+            raise ImportError(
+                "Metrics export requires prometheus_client (pip install prometheus-client)"
+            )
+
+        self.registry = registry or CollectorRegistry()
+
+        self.requests = Counter(
+            "agent_requests", "Agent requests by selected tool and outcome",
+            ["tool", "outcome"], registry=self.registry,
+        )
+        self.request_latency = Histogram(
+            "agent_request_latency_seconds", "End-to-end agent response time",
+            ["tool"], buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.phase_latency = Histogram(
+            "agent_phase_latency_seconds", "Time spent per agent phase",
+            ["phase"], buckets=LATENCY_BUCKETS, registry=self.registry,
+        )
+        self.tool_selections = Counter(
+            "agent_tool_selections", "Labeled tool selections by expected and selected tool",
+            ["expected_tool", "selected_tool"], registry=self.registry,
+        )
+        self.tool_accuracy = Gauge(
+            "agent_tool_selection_accuracy", "Share of labeled requests routed to the expected tool",
+            ["expected_tool"], registry=self.registry,
+        )
+        self.tokens = Counter(
+            "agent_tokens", "Tokens reported by the OpenAI API",
+            ["type"], registry=self.registry,
+        )
+        self.in_flight = Gauge(
+            "agent_requests_in_flight", "Agent requests currently being processed",
+            registry=self.registry,
+        )
+
+        # (correct, total) per expected tool, used for the accuracy gauge
+        self._accuracy_counts: Dict[str, list] = {}
+
+    # --- Observer listener hooks ---
+
+    def on_request_start(self):
+        self.in_flight.inc()
+
+    def on_request_end(self):
+        self.in_flight.dec()
+
+    def on_interaction(self, interaction: Dict):
+        tool = interaction.get("tool_selected") or "none"
+        outcome = "success" if interaction.get("success") else "failure"
+
+        self.requests.labels(tool=tool, outcome=outcome).inc()
+        self.request_latency.labels(tool=tool).observe(interaction["response_time_seconds"])
+
+        for phase, seconds in (interaction.get("phase_timings") or {}).items():
+            self.phase_latency.labels(phase=phase).observe(seconds)
+
+        for token_type, count in (interaction.get("token_usage") or {}).items():
+            if token_type != "total_tokens":
+                self.tokens.labels(type=token_type.removesuffix("_tokens")).inc(count)
+
+        expected = interaction.get("expected_tool")
+        if expected:
+            self.tool_selections.labels(expected_tool=expected, selected_tool=tool).inc()
+            counts = self._accuracy_counts.setdefault(expected, [0, 0])
+            counts[0] += 1 if interaction.get("tool_match") else 0
+            counts[1] += 1
+            self.tool_accuracy.labels(expected_tool=expected).set(counts[0] / counts[1])
+
+
+def start_metrics_server(
+    observer: AgentObservability,
+    port: int = 9108,
+    addr: str = "0.0.0.0",
+) -> AgentMetricsExporter:
+    """Attach a metrics exporter to the observer and serve /metrics in a background thread"""
+
+    exporter = observer.add_listener(AgentMetricsExporter())
+    start_http_server(port, addr=addr, registry=exporter.registry)
+    print(f"📈 Metrics available at http://{addr}:{port}/metrics\n")
+    return exporter
@@ -5,13 +5,673 @@
 # and agent performance metrics
 # =========================================
 
+import heapq
+import io
 import json
+import os
+import random
+import re
+import socket
 import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 import pandas as pd
 
+try:
+    import pyarrow as pa
+    import pyarrow.json as pa_json
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional - pandas is used as fallback
+    pa = None
+    pa_json = None
+    pq = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# =========================================
+# LOG INDEX (FAST FILTERED LOADING)
+# =========================================
+
+# json.dumps keeps insertion order, so every record starts with these keys
+_RECORD_PREFIX = re.compile(rb'"timestamp": "([^"]*)", "session_id": "([^"]*)"')
+
+
+def _to_iso(value: Union[str, datetime, None]) -> Optional[str]:
+    """Normalize a datetime filter to the ISO string stored in the log"""
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+class LogIndex:
+    """
+    Sidecar index of byte offsets for a JSONL interaction log
+
+    The log is split into blocks of `block_lines` records. Each block keeps
+    its byte range, timestamp range and the sessions it contains, so filters
+    like "last 24h" or "session X" only read the matching blocks.
+
+    The index lives next to the log (agent_logs.jsonl.idx) and is updated
+    incrementally: only bytes appended since the last update are scanned.
+    """
+
+    def __init__(self, log_file: Union[str, Path], block_lines: int = 5000):
+        self.log_file = Path(log_file)
+        self.index_file = self.log_file.with_name(self.log_file.name + ".idx")
+        self.block_lines = block_lines
+        self.blocks: List[Dict] = []
+        self.indexed_bytes = 0
+        self._load()
+
+    def _load(self):
+        if not self.index_file.exists():
+            return
+        try:
+            data = json.loads(self.index_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self.blocks = data.get("blocks", [])
+        self.indexed_bytes = data.get("indexed_bytes", 0)
+
+    def _save(self):
+        data = {
+            "block_lines": self.block_lines,
+            "indexed_bytes": self.indexed_bytes,
+            "blocks": self.blocks,
+        }
+        write_text_atomic(self.index_file, json.dumps(data))
+
+    def update(self) -> "LogIndex":
+        """Index any complete lines appended since the last update"""
+
+        if not self.log_file.exists():
+            self.blocks, self.indexed_bytes = [], 0
+            return self
+
+        size = self.log_file.stat().st_size
+        if size < self.indexed_bytes:
+            # Log was truncated or rotated - rebuild from scratch
+            self.blocks, self.indexed_bytes = [], 0
+        if size == self.indexed_bytes:
+            return self
+
+        # Keep filling the last block if it is not full yet
+        block = self.blocks.pop() if self.blocks and self.blocks[-1]["lines"] < self.block_lines else None
+        offset = self.indexed_bytes
+
+        with self.log_file.open("rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial line still being written
+
+                match = _RECORD_PREFIX.search(line, 0, 200)
+                if match:
+                    timestamp = match.group(1).decode("utf-8")
+                    session_id = match.group(2).decode("utf-8")
+                else:
+                    record = json.loads(line)
+                    timestamp = record.get("timestamp", "")
+                    session_id = record.get("session_id", "")
+
+                if block is None:
+                    block = {"start": offset, "end": offset, "lines": 0,
+                             "min_ts": timestamp, "max_ts": timestamp, "sessions": []}
+
+                block["end"] = offset + len(line)
+                block["lines"] += 1
+                block["min_ts"] = min(block["min_ts"], timestamp)
+                block["max_ts"] = max(block["max_ts"], timestamp)
+                if session_id not in block["sessions"]:
+                    block["sessions"].append(session_id)
+
+                offset += len(line)
+
+                if block["lines"] >= self.block_lines:
+                    self.blocks.append(block)
+                    block = None
+
+        if block is not None:
+            self.blocks.append(block)
+
+        self.indexed_bytes = offset
+        self._save()
+        return self
+
+    def find_ranges(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        session_id: Optional[str] = None,
+        start_offset: int = 0,
+    ) -> List[Tuple[int, int]]:
+        """Return merged (start, end) byte ranges of blocks matching the filters"""
+
+        ranges: List[Tuple[int, int]] = []
+        for block in self.blocks:
+            if block["end"] <= start_offset:
+                continue
+            if since and block["max_ts"] < since:
+                continue
+            if until and block["min_ts"] > until:
+                continue
+            if session_id and session_id not in block["sessions"]:
+                continue
+
+            start = max(block["start"], start_offset)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], block["end"])
+            else:
+                ranges.append((start, block["end"]))
+        return ranges
+
+
+# Nested dict fields. pyarrow.json infers one struct per column across the
+# chunk (missing keys become None, ints widen to float), so these always go
+# through the pandas parser to come back as the exact dicts that were logged.
+_PAYLOAD_COLUMNS = frozenset({"tool_args", "tool_result", "phase_timings", "token_usage"})
+
+
+_TEXT_FIELDS = ("timestamp", "session_id", "user_question", "tool_selected", "expected_tool",
+                "error", "sample_decision")
+
+
+def _arrow_parse_options(data: bytes):
+    """Text fields stay strings (pyarrow.json would turn ISO timestamps into datetimes)"""
+    # Only fields present in the chunk: explicit ones would otherwise appear as null columns
+    text = [name for name in _TEXT_FIELDS if f'"{name}": '.encode("utf-8") in data]
+    return pa_json.ParseOptions(explicit_schema=pa.schema([(name, pa.string()) for name in text]),
+                                unexpected_field_behavior="infer")
+
+
+def _nulls_to_none(df: pd.DataFrame) -> pd.DataFrame:
+    """Missing values in non-numeric columns as None (object dtype), whichever parser ran"""
+    for column in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[column]):
+            values = df[column].astype(object)
+            df[column] = values.where(values.notna(), None)
+    return df
+
+
+def _parse_jsonl_bytes(
+    data: bytes,
+    columns: Optional[List[str]] = None,
+    engine: str = "auto",
+) -> pd.DataFrame:
+    """
+    Parse a buffer of JSONL records in one vectorized call
+    
+    engine="auto" uses pyarrow.json when installed and the projection is
+    scalar-only; full reads and payload columns use the pandas parser.
+    Both return nulls in text/bool/dict columns as None and in numeric
+    columns as NaN.
+    """
+
+    use_arrow = columns and _PAYLOAD_COLUMNS.isdisjoint(columns)
+    if pa_json is not None and engine == "auto" and use_arrow:
+        try:
+            table = pa_json.read_json(io.BytesIO(data), parse_options=_arrow_parse_options(data))
+            # Column projection: only requested columns reach pandas
+            table = table.select([c for c in columns if c in table.column_names])
+            return _nulls_to_none(table.to_pandas())
+        except pa.ArrowException:
+            pass  # mixed types in nested payloads - let pandas handle it
+
+    df = pd.read_json(io.BytesIO(data), lines=True, dtype=False,
+                      convert_dates=False, keep_default_dates=False)
+    if columns:
+        df = df[[c for c in columns if c in df.columns]]
+    return _nulls_to_none(df)
+
+
+def iter_log_chunks(
+    log_file: Union[str, Path],
+    ranges: List[Tuple[int, int]],
+    columns: Optional[List[str]] = None,
+    chunk_bytes: int = 64 * 1024 * 1024,
+    engine: str = "auto",
+) -> Iterator[pd.DataFrame]:
+    """Yield DataFrames for the given byte ranges, `chunk_bytes` at a time"""
+
+    with Path(log_file).open("rb") as f:
+        for start, end in ranges:
+            f.seek(start)
+            remaining = end - start
+            carry = b""
+            while remaining > 0:
+                data = carry + f.read(min(chunk_bytes, remaining))
+                remaining = end - f.tell()
+                cut = data.rfind(b"\n") + 1 if remaining > 0 else len(data)
+                data, carry = data[:cut], data[cut:]
+                if data.strip():
+                    yield _parse_jsonl_bytes(data, columns, engine)
+            if carry.strip():
+                yield _parse_jsonl_bytes(carry, columns, engine)
+
+
+# =========================================
+# TOOL SELECTION COUNTS (VECTORIZED)
+# =========================================
+
+# Column label for labeled interactions where no tool was selected
+NO_TOOL = "none"
+
+_TOOL_COUNT_COLUMNS = ["expected_tool", "tool_selected", "sample_weight"]
+
+
+def tool_selection_counts(df: pd.DataFrame) -> pd.Series:
+    """Weighted (expected_tool, tool_selected) counts of the labeled records in df"""
+
+    df = df.reindex(columns=_TOOL_COUNT_COLUMNS)
+    labeled = df[df["expected_tool"].notna()]
+    weight = labeled["sample_weight"].fillna(1.0).astype(float)
+    selected = labeled["tool_selected"].fillna(NO_TOOL).rename("tool_selected")
+    return weight.groupby([labeled["expected_tool"], selected]).sum()
+
+
+def _empty_tool_counts() -> pd.Series:
+    index = pd.MultiIndex.from_tuples([], names=["expected_tool", "tool_selected"])
+    return pd.Series(dtype=float, index=index)
+
+
+class ToolSelectionCounts:
+    """
+    Running tool selection counts for a JSONL interaction log
+
+    Counts are kept in a sidecar (agent_logs.jsonl.toolstats) together with
+    the byte offset they cover, so update() only parses records appended
+    since the last call instead of re-reading millions of interactions.
+    """
+
+    def __init__(self, log_file: Union[str, Path]):
+        self.log_file = Path(log_file)
+        self.stats_file = self.log_file.with_name(self.log_file.name + ".toolstats")
+        self.counts = _empty_tool_counts()
+        self.counted_bytes = 0
+        self._load()
+
+    def _load(self):
+        if not self.stats_file.exists():
+            return
+        try:
+            data = json.loads(self.stats_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self.counted_bytes = data.get("counted_bytes", 0)
+        if data.get("counts"):
+            expected, selected, weight = zip(*data["counts"])
+            index = pd.MultiIndex.from_arrays([expected, selected], names=["expected_tool", "tool_selected"])
+            self.counts = pd.Series(weight, index=index, dtype=float)
+
+    def _save(self):
+        data = {
+            "counted_bytes": self.counted_bytes,
+            "counts": [[expected, selected, weight] for (expected, selected), weight in self.counts.items()],
+        }
+        write_text_atomic(self.stats_file, json.dumps(data))
+
+    def update(self) -> "ToolSelectionCounts":
+        """Add counts for records appended since the last update"""
+
+        index = LogIndex(self.log_file).update()
+        if index.indexed_bytes < self.counted_bytes:
+            # Log was truncated or rotated - count it again
+            self.counts, self.counted_bytes = _empty_tool_counts(), 0
+        if index.indexed_bytes == self.counted_bytes:
+            return self
+
+        ranges = index.find_ranges(start_offset=self.counted_bytes)
+        for chunk in iter_log_chunks(self.log_file, ranges, _TOOL_COUNT_COLUMNS):
+            self.counts = self.counts.add(tool_selection_counts(chunk), fill_value=0)
+
+        self.counted_bytes = index.indexed_bytes
+        self._save()
+        return self
+
+
+# =========================================
+# MULTI-PROCESS SAFE LOGGING
+# =========================================
+
+@contextmanager
+def _file_lock(f):
+    """Hold an exclusive advisory lock on an open file"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        # Lock the first byte as a mutex; appends still go to the end
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def append_jsonl(path: Path, records: List[Dict]):
+    """Append records as complete lines under a lock (safe across processes)"""
+    data = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+    while True:
+        with path.open("ab") as f:
+            with _file_lock(f):
+                # compact_log_segments may have renamed the file while we waited
+                # for the lock: appending to the claimed inode would lose the
+                # records, so reopen the path and try again
+                opened = os.fstat(f.fileno())
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if (opened.st_dev, opened.st_ino) != (current.st_dev, current.st_ino):
+                    continue
+                f.write(data)
+                f.flush()
+                return
+
+
+def write_text_atomic(path: Path, text: str):
+    """Replace path with text in one step (readers never see a half-written file)"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def segment_path(log_file: Path) -> Path:
+    """Per-process log segment, e.g. agent_logs.host-1234.jsonl"""
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    return log_file.with_name(f"{log_file.stem}.{worker}{log_file.suffix}")
+
+
+def _segment_name(log_file: Path, extension: str = "") -> re.Pattern:
+    """File names produced by segment_path (plus `extension`), nothing else"""
+    return re.compile(rf"{re.escape(log_file.stem)}\.[^/\\]+-\d+{re.escape(log_file.suffix + extension)}")
+
+
+def log_segments(log_file: Path, extension: str = "") -> List[Path]:
+    """All per-process segments written next to the main log"""
+    pattern = _segment_name(log_file, extension)
+    return sorted(p for p in log_file.parent.glob(f"{log_file.stem}.*{log_file.suffix}{extension}")
+                  if pattern.fullmatch(p.name))
+
+
+def _complete_lines(path: Path) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        for line in f:
+            if line.endswith(b"\n"):
+                yield line
+
+
+def _merged_lines(paths: List[Path]) -> Iterator[bytes]:
+    """Complete lines of all paths in timestamp order (same order on every call)"""
+
+    def timestamp(line: bytes) -> bytes:
+        match = _RECORD_PREFIX.search(line, 0, 200)
+        return match.group(1) if match else b""
+
+    return heapq.merge(*(_complete_lines(p) for p in paths), key=timestamp)
+
+
+def _merge_claimed(log_file: Path, out, claimed: List[Path], offset: Optional[int] = None) -> int:
+    """
+    Append the claimed segments to the main log (locked, opened as `out`)
+
+    A manifest (agent_logs.jsonl.compact) records where the merge starts
+    before anything is written. If a compaction dies mid-merge, the next
+    one finds the manifest and passes that `offset`: bytes already written
+    there must be a prefix of the same merged stream, and only the rest is
+    appended. The merge is never written twice.
+    """
+
+    manifest = log_file.with_name(log_file.name + ".compact")
+    size = os.fstat(out.fileno()).st_size
+    if offset is None:
+        offset = size
+        write_text_atomic(manifest, json.dumps({"offset": offset, "segments": [p.name for p in claimed]}))
+
+    merged = 0
+    with log_file.open("rb") as existing:
+        existing.seek(offset)
+        remaining = size - offset  # written by the interrupted merge
+        for line in _merged_lines(claimed):
+            written = existing.read(min(len(line), remaining))
+            remaining -= len(written)
+            if written != line[:len(written)]:
+                raise RuntimeError(f"{log_file} changed after byte {offset} during an interrupted "
+                                   f"compaction; merge {manifest} segments by hand")
+            out.write(line[len(written):])
+            merged += 1
+    out.flush()
+    os.fsync(out.fileno())
+
+    for path in claimed:
+        path.unlink(missing_ok=True)
+    manifest.unlink()
+    return merged
+
+
+def compact_log_segments(log_file: Union[str, Path]) -> int:
+    """
+    Merge per-process log segments into the main log
+    
+    Each segment is renamed (*.compacting) before merging, so workers that
+    keep logging simply start a fresh segment. Records are appended to the
+    main log in timestamp order. Work left by a compaction that died is
+    finished first: an interrupted merge is resumed from its manifest and
+    orphaned *.compacting files are merged again. Returns the number of
+    merged records.
+    """
+    
+    log_file = Path(log_file)
+    manifest = log_file.with_name(log_file.name + ".compact")
+    merged = 0
+    with log_file.open("ab") as out:
+        with _file_lock(out):  # one compaction at a time, no appends to the main log meanwhile
+            if manifest.exists():
+                pending = json.loads(manifest.read_text(encoding="utf-8"))
+                claimed = [log_file.with_name(name) for name in pending["segments"]]
+                if all(p.exists() for p in claimed):
+                    merged += _merge_claimed(log_file, out, claimed, pending["offset"])
+                else:  # died while deleting merged segments: the merge itself is complete
+                    for path in claimed:
+                        path.unlink(missing_ok=True)
+                    manifest.unlink()
+
+            # Claimed but never merged (died before writing the manifest)
+            orphans = log_segments(log_file, ".compacting")
+            if orphans:
+                merged += _merge_claimed(log_file, out, orphans)
+
+            claimed = []
+            for segment in log_segments(log_file):
+                target = segment.with_name(segment.name + ".compacting")
+                with segment.open("ab") as f:
+                    with _file_lock(f):  # wait for any in-progress append
+                        os.replace(segment, target)
+                LogIndex(segment).index_file.unlink(missing_ok=True)
+                claimed.append(target)
+            if claimed:
+                merged += _merge_claimed(log_file, out, claimed)
+    
+    return merged
+
+
+# =========================================
+# BOUNDED SESSION STORE
+# =========================================
+
+class InteractionRecord:
+    """Compact (slotted) in-memory form of one logged interaction, read like a dict"""
+
+    __slots__ = (
+        "timestamp", "session_id", "user_question", "tool_selected", "expected_tool",
+        "tool_match", "tool_args", "tool_result", "response_time_seconds", "success",
+        "response_length", "error", "phase_timings", "token_usage",
+        "sample_decision", "sample_weight",
+    )
+
+    def __init__(self, interaction: Dict):
+        for field in self.__slots__:
+            setattr(self, field, interaction.get(field))
+        if self.sample_weight is None:
+            self.sample_weight = 1.0
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class SessionStore:
+    """
+    Interactions of one session: a bounded ring buffer plus running aggregates
+
+    Only the most recent `capacity` interactions stay in memory. Older ones
+    are read back from the persisted log (located through the log index's
+    per-block session lists) when iterating, so memory no longer grows with
+    traffic. Aggregates cover the whole session, evicted records included.
+    """
+
+    def __init__(self, session_id: str, log_file: Path, capacity: int = 1000):
+        self.session_id = session_id
+        self.log_file = Path(log_file)
+        self.buffer = deque(maxlen=capacity)
+        self.logged = 0
+        
+        # Running aggregates (weighted by sample_weight)
+        self.total_weight = 0.0
+        self.success_weight = 0.0
+        self.tested_weight = 0.0
+        self.correct_weight = 0.0
+        self.response_time_weight = 0.0
+        self.min_response_time = None
+        self.max_response_time = None
+        self.failed = 0
+        self.tool_weights: Dict[str, float] = {}
+        # (expected_tool, tool_selected) -> weight, for accuracy reports
+        self.tool_selection_weights: Dict[Tuple[str, str], float] = {}
+
+    def append(self, interaction: Dict):
+        record = InteractionRecord(interaction)
+        self.buffer.append(record)
+        self.logged += 1
+
+        weight = record.sample_weight
+        response_time = record.response_time_seconds
+        self.total_weight += weight
+        self.response_time_weight += response_time * weight
+        self.min_response_time = response_time if self.min_response_time is None else min(self.min_response_time, response_time)
+        self.max_response_time = response_time if self.max_response_time is None else max(self.max_response_time, response_time)
+        if record.success:
+            self.success_weight += weight
+        else:
+            self.failed += 1
+        if record.tool_selected:
+            self.tool_weights[record.tool_selected] = self.tool_weights.get(record.tool_selected, 0.0) + weight
+        if record.expected_tool:
+            self.tested_weight += weight
+            if record.tool_match:
+                self.correct_weight += weight
+            key = (record.expected_tool, record.tool_selected or NO_TOOL)
+            self.tool_selection_weights[key] = self.tool_selection_weights.get(key, 0.0) + weight
+
+    def __len__(self) -> int:
+        return self.logged
+
+    @property
+    def evicted(self) -> int:
+        """Number of session interactions only available on disk"""
+        return self.logged - len(self.buffer)
+
+    def _iter_disk(self) -> Iterator[Dict]:
+        """Session records from the main log and per-process segments, in time order"""
+
+        marker = f'"session_id": "{self.session_id}"'.encode("utf-8")
+
+        def records(path: Path) -> Iterator[Dict]:
+            ranges = LogIndex(path).update().find_ranges(session_id=self.session_id)
+            with path.open("rb") as f:
+                for start, end in ranges:
+                    f.seek(start)
+                    for line in f.read(end - start).splitlines():
+                        if marker in line[:200]:
+                            yield json.loads(line)
+
+        paths = [p for p in [self.log_file, *log_segments(self.log_file)] if p.exists()]
+        return heapq.merge(*(records(p) for p in paths), key=lambda r: r["timestamp"])
+
+    def __iter__(self) -> Iterator:
+        """Every interaction of the session; evicted ones are paged in from disk"""
+        evicted = self.evicted
+        if evicted:
+            for i, record in enumerate(self._iter_disk()):
+                if i >= evicted:
+                    break
+                yield record
+        yield from self.buffer
+
+    def recent(self, n: Optional[int] = None) -> List[InteractionRecord]:
+        """The last n interactions held in memory (no disk access)"""
+        records = list(self.buffer)
+        return records if n is None else records[-n:]
+
+
+# =========================================
+# PARQUET EXPORT HELPERS
+# =========================================
+
+def _parquet_schema():
+    """Typed Arrow schema for exported interactions"""
+    payload = pa.map_(pa.string(), pa.string())
+    return pa.schema([
+        ("timestamp", pa.timestamp("us")),
+        ("session_id", pa.string()),
+        ("user_question", pa.string()),
+        ("tool_selected", pa.string()),
+        ("expected_tool", pa.string()),
+        ("tool_match", pa.bool_()),
+        ("tool_args", payload),
+        ("tool_result", payload),
+        ("response_time_seconds", pa.float64()),
+        ("success", pa.bool_()),
+        ("response_length", pa.int64()),
+        ("error", pa.string()),
+        ("phase_timings", pa.map_(pa.string(), pa.float64())),
+        ("token_usage", pa.map_(pa.string(), pa.int64())),
+        ("sample_decision", pa.string()),
+        ("sample_weight", pa.float64()),
+    ])
+
+
+def _to_map_items(payload) -> Optional[List[Tuple[str, str]]]:
+    """Convert a tool args/result dict to map entries (non-string values as JSON)"""
+    if not isinstance(payload, dict):
+        return None
+    return [
+        (str(k), v if isinstance(v, str) else json.dumps(v))
+        for k, v in payload.items()
+    ]
+
+
 class AgentObservability:
     """
     Track and analyze agent performance metrics
@@ -24,13 +684,71 @@ class AgentObservability:
     - User satisfaction (optional feedback)
     """
     
-    def __init__(self, log_file: str = "agent_logs.jsonl"):
+    def __init__(
+        self,
+        log_file: str = "agent_logs.jsonl",
+        per_process_segments: bool = False,
+        sample_rate: float = 1.0,
+        slow_threshold_seconds: Optional[float] = None,
+        seed: Optional[int] = None,
+        session_buffer_size: int = 1000,
+    ):
+        """
+        log_file: shared JSONL log (appends are locked, so several worker
+            processes can write to the same file)
+        per_process_segments: write to a private segment per process instead;
+            merge them into log_file later with compact_log_segments()
+        sample_rate: fraction of routine interactions (successful, correct
+            tool, not slow) that are recorded. Sampled ones keep metrics only
+            (no tool_args/tool_result) and carry sample_weight = 1/sample_rate.
+            Failures, tool mismatches and slow outliers are always kept in full.
+        slow_threshold_seconds: response time above which an interaction is
+            treated as a slow outlier and kept in full
+        session_buffer_size: interactions of the current session kept in
+            memory; older ones are paged back from the log when needed
+        """
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be in (0, 1]")
+        self.sample_rate = sample_rate
+        self.slow_threshold_seconds = slow_threshold_seconds
+        self._rng = random.Random(seed)
         self.log_file = Path(log_file)
+        self.write_file = segment_path(self.log_file) if per_process_segments else self.log_file
+        # pid keeps sessions of workers started in the same second apart
+        session_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
         self.current_session = {
-            "session_id": datetime.now().strftime("%Y%m%d_%H%M%S"),
+            "session_id": session_id,
             "start_time": time.time(),
-            "interactions": []
+            "interactions": SessionStore(session_id, self.log_file, session_buffer_size)
         }
+        self.listeners = []
+        self._history_tool_counts: Optional[ToolSelectionCounts] = None
+    
+    def add_listener(self, listener):
+        """
+        Register a listener notified about agent activity (e.g. a metrics exporter)
+        
+        Listeners may implement any of:
+        - on_request_start() / on_request_end(): around each agent request
+        - on_interaction(interaction): after an interaction is logged
+        """
+        self.listeners.append(listener)
+        return listener
+    
+    def _notify(self, event: str, *args):
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler:
+                handler(*args)
+    
+    @contextmanager
+    def track_request(self):
+        """Context manager marking one agent request as in flight"""
+        self._notify("on_request_start")
+        try:
+            yield
+        finally:
+            self._notify("on_request_end")
     
     def log_interaction(
         self,
@@ -42,9 +760,16 @@ class AgentObservability:
         response_text: str,
         tool_args: Optional[Dict] = None,
         tool_result: Optional[Dict] = None,
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        phase_timings: Optional[Dict[str, float]] = None,
+        token_usage: Optional[Dict[str, int]] = None
     ):
-        """Log a single interaction with the agent"""
+        """
+        Log a single interaction with the agent
+        
+        phase_timings: seconds spent per phase (e.g. tool_selection, tool_execution)
+        token_usage: token counts reported by the API (e.g. input_tokens, output_tokens)
+        """
         
         interaction = {
             "timestamp": datetime.now().isoformat(),
@@ -58,51 +783,73 @@ class AgentObservability:
             "response_time_seconds": round(response_time, 3),
             "success": success,
             "response_length": len(response_text),
-            "error": error
+            "error": error,
+            "phase_timings": {k: round(v, 3) for k, v in phase_timings.items()} if phase_timings else None,
+            "token_usage": token_usage
         }
+        interaction.update(self._sampling_decision(interaction))
         
-        self.current_session["interactions"].append(interaction)
+        if interaction["sample_decision"] != "dropped":
+            if interaction["sample_decision"] == "metrics":
+                interaction["tool_args"] = None
+                interaction["tool_result"] = None
+            
+            # Persist first - the session store pages evicted records from the log
+            append_jsonl(self.write_file, [interaction])
+            self.current_session["interactions"].append(interaction)
         
-        # Append to log file (JSONL format)
-        with self.log_file.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(interaction) + "\n")
+        # Listeners (e.g. metrics) still see every interaction
+        self._notify("on_interaction", interaction)
         
         return interaction
     
-    def get_session_summary(self) -> Dict:
-        """Get summary statistics for current session"""
+    def _sampling_decision(self, interaction: Dict) -> Dict:
+        """
+        Decide how an interaction is recorded
         
-        interactions = self.current_session["interactions"]
+        - "full": kept with payloads (failures, mismatches, slow outliers, or no sampling)
+        - "metrics": kept without payloads, weighted by 1/sample_rate
+        - "dropped": not recorded
+        """
         
-        if not interactions:
-            return {"message": "No interactions logged yet"}
+        slow = (
+            self.slow_threshold_seconds is not None
+            and interaction["response_time_seconds"] >= self.slow_threshold_seconds
+        )
+        if (
+            self.sample_rate >= 1
+            or not interaction["success"]
+            or interaction["tool_match"] is False
+            or slow
+        ):
+            return {"sample_decision": "full", "sample_weight": 1.0}
         
-        # Tool selection accuracy
-        tool_matches = [i for i in interactions if i["tool_match"] is not None]
-        accuracy = sum(1 for i in tool_matches if i["tool_match"]) / len(tool_matches) if tool_matches else 0
+        if self._rng.random() < self.sample_rate:
+            return {"sample_decision": "metrics", "sample_weight": round(1 / self.sample_rate, 6)}
+        return {"sample_decision": "dropped", "sample_weight": 0.0}
+    
+    def get_session_summary(self) -> Dict:
+        """Get summary statistics for current session"""
         
-        # Tool usage distribution
-        tools_used = [i["tool_selected"] for i in interactions if i["tool_selected"]]
-        tool_distribution = {}
-        for tool in tools_used:
-            tool_distribution[tool] = tool_distribution.get(tool, 0) + 1
+        store = self.current_session["interactions"]
         
-        # Response time stats
-        response_times = [i["response_time_seconds"] for i in interactions]
+        if not store:
+            return {"message": "No interactions logged yet"}
         
-        # Success rate
-        success_rate = sum(1 for i in interactions if i["success"]) / len(interactions)
+        # Running aggregates - sampled interactions stand for 1/sample_rate each
+        accuracy = store.correct_weight / store.tested_weight if store.tested_weight else 0
         
         return {
             "session_id": self.current_session["session_id"],
-            "total_interactions": len(interactions),
+            "total_interactions": round(store.total_weight),
+            "logged_interactions": len(store),
             "tool_selection_accuracy": round(accuracy * 100, 2),
-            "tool_distribution": tool_distribution,
-            "avg_response_time": round(sum(response_times) / len(response_times), 3),
-            "min_response_time": round(min(response_times), 3),
-            "max_response_time": round(max(response_times), 3),
-            "success_rate": round(success_rate * 100, 2),
-            "failed_interactions": sum(1 for i in interactions if not i["success"])
+            "tool_distribution": {tool: round(w) for tool, w in store.tool_weights.items()},
+            "avg_response_time": round(store.response_time_weight / store.total_weight, 3),
+            "min_response_time": round(store.min_response_time, 3),
+            "max_response_time": round(store.max_response_time, 3),
+            "success_rate": round(store.success_weight / store.total_weight * 100, 2),
+            "failed_interactions": store.failed
         }
     
     def print_session_summary(self):
@@ -119,6 +866,8 @@ class AgentObservability:
         print("="*70)
         print(f"\n🆔 Session ID: {summary['session_id']}")
         print(f"📈 Total Interactions: {summary['total_interactions']}")
+        if summary['logged_interactions'] != summary['total_interactions']:
+            print(f"   (estimated from {summary['logged_interactions']} sampled records)")
         print(f"\n🎯 Tool Selection Accuracy: {summary['tool_selection_accuracy']}%")
         print(f"✅ Success Rate: {summary['success_rate']}%")
         print(f"❌ Failed Interactions: {summary['failed_interactions']}")
@@ -135,53 +884,80 @@ class AgentObservability:
         
         print("="*70 + "\n")
     
-    def get_tool_accuracy_report(self) -> pd.DataFrame:
-        """Generate detailed tool accuracy report"""
+    def get_tool_selection_counts(self, source: str = "session") -> pd.Series:
+        """
+        Weighted counts per (expected_tool, tool_selected) for labeled interactions
         
-        interactions = self.current_session["interactions"]
+        source="session": running counts of the current session
+        source="history": the whole log, updated incrementally from the offset
+            reached last time, plus per-process segments not yet compacted
+        """
         
-        # Filter interactions with expected tool
-        tool_tests = [i for i in interactions if i["expected_tool"] is not None]
+        if source == "session":
+            weights = self.current_session["interactions"].tool_selection_weights
+            if not weights:
+                return _empty_tool_counts()
+            counts = pd.Series(weights, dtype=float)
+            counts.index.names = ["expected_tool", "tool_selected"]
+            return counts
         
-        if not tool_tests:
+        if source != "history":
+            raise ValueError('source must be "session" or "history"')
+        
+        if self._history_tool_counts is None:
+            self._history_tool_counts = ToolSelectionCounts(self.log_file)
+        counts = self._history_tool_counts.update().counts
+        
+        # Segments are merged into the main log on compaction - never cache them
+        for path in log_segments(self.log_file):
+            ranges = LogIndex(path).update().find_ranges()
+            for chunk in iter_log_chunks(path, ranges, _TOOL_COUNT_COLUMNS):
+                counts = counts.add(tool_selection_counts(chunk), fill_value=0)
+        return counts
+    
+    def get_tool_accuracy_report(self, source: str = "session") -> pd.DataFrame:
+        """Generate detailed tool accuracy report (source: "session" or "history")"""
+        
+        counts = self.get_tool_selection_counts(source)
+        
+        if counts.empty:
             print("⚠️ No tool accuracy tests logged (expected_tool was None)")
             return pd.DataFrame()
         
         # Group by expected tool
-        accuracy_data = []
-        for expected in set(i["expected_tool"] for i in tool_tests):
-            tests = [i for i in tool_tests if i["expected_tool"] == expected]
-            correct = sum(1 for i in tests if i["tool_match"])
-            
-            accuracy_data.append({
-                "Expected Tool": expected,
-                "Total Tests": len(tests),
-                "Correct Selections": correct,
-                "Accuracy (%)": round((correct / len(tests)) * 100, 2)
-            })
+        frame = counts.reset_index(name="weight")
+        frame["correct"] = frame["weight"].where(frame["expected_tool"] == frame["tool_selected"], 0.0)
+        per_tool = frame.groupby("expected_tool")[["weight", "correct"]].sum()
         
-        df = pd.DataFrame(accuracy_data)
+        df = pd.DataFrame({
+            "Expected Tool": per_tool.index,
+            "Total Tests": per_tool["weight"].round().astype(int).values,
+            "Correct Selections": per_tool["correct"].round().astype(int).values,
+            "Accuracy (%)": (per_tool["correct"] / per_tool["weight"] * 100).round(2).values,
+        })
         return df.sort_values("Accuracy (%)", ascending=False)
     
-    def print_tool_accuracy_report(self):
+    def print_tool_accuracy_report(self, source: str = "session"):
         """Print formatted tool accuracy report"""
         
-        df = self.get_tool_accuracy_report()
+        df = self.get_tool_accuracy_report(source)
         
         if df.empty:
             return
         
         print("\n" + "="*70)
-        print("🎯 TOOL SELECTION ACCURACY BY TOOL")
+        print("🎯 TOOL SELECTION ACCURACY BY TOOL" + (" (ALL HISTORY)" if source == "history" else ""))
         print("="*70)
         print(df.to_string(index=False))
         print("="*70 + "\n")
     
     def get_failed_interactions(self) -> List[Dict]:
-        """Get list of failed interactions for debugging"""
+        """Get list of failed interactions for debugging (older ones are read from the log)"""
         
-        interactions = self.current_session["interactions"]
-        return [i for i in interactions if not i["success"]]
+        store = self.current_session["interactions"]
+        if not store.failed:
+            return []
+        return [i if isinstance(i, dict) else i.to_dict() for i in store if not i["success"]]
     
     def print_failed_interactions(self):
         """Print details of failed interactions"""
@@ -205,47 +981,38 @@ class AgentObservability:
         
         print("="*70 + "\n")
     
-    def get_tool_confusion_matrix(self) -> pd.DataFrame:
-        """Generate confusion matrix for tool selection"""
+    def get_tool_confusion_matrix(self, source: str = "session") -> pd.DataFrame:
+        """
+        Generate confusion matrix for tool selection (source: "session" or "history")
         
-        interactions = self.current_session["interactions"]
-        tool_tests = [i for i in interactions if i["expected_tool"] is not None]
+        Labeled interactions where no tool was selected are counted in the
+        "none" column.
+        """
         
-        if not tool_tests:
+        counts = self.get_tool_selection_counts(source)
+        
+        if counts.empty:
             print("⚠️ No tool tests logged for confusion matrix")
             return pd.DataFrame()
         
-        # Get all unique tools
-        all_tools = set()
-        for i in tool_tests:
-            all_tools.add(i["expected_tool"])
-            if i["tool_selected"]:
-                all_tools.add(i["tool_selected"])
-        
-        all_tools = sorted(all_tools)
-        
-        # Build confusion matrix
-        matrix = {tool: {t: 0 for t in all_tools} for tool in all_tools}
-        
-        for interaction in tool_tests:
-            expected = interaction["expected_tool"]
-            actual = interaction["tool_selected"] or "none"
-            if actual in matrix.get(expected, {}):
-                matrix[expected][actual] += 1
+        matrix = counts.unstack(fill_value=0)
         
-        df = pd.DataFrame(matrix).T
-        return df
+        # Square over all tools seen, plus the "none" column if it occurred
+        all_tools = sorted((set(matrix.index) | set(matrix.columns)) - {NO_TOOL})
+        columns = all_tools + ([NO_TOOL] if NO_TOOL in matrix.columns else [])
+        matrix = matrix.reindex(index=all_tools, columns=columns, fill_value=0)
+        return matrix.round().astype(int)
     
-    def print_confusion_matrix(self):
+    def print_confusion_matrix(self, source: str = "session"):
         """Print tool selection confusion matrix"""
         
-        df = self.get_tool_confusion_matrix()
+        df = self.get_tool_confusion_matrix(source)
         
         if df.empty:
             return
         
         print("\n" + "="*70)
-        print("🔀 TOOL SELECTION CONFUSION MATRIX")
+        print("🔀 TOOL SELECTION CONFUSION MATRIX" + (" (ALL HISTORY)" if source == "history" else ""))
         print("="*70)
         print("Rows = Expected Tool | Columns = Actual Tool Selected\n")
         print(df.to_string())
@@ -280,24 +1047,139 @@ class AgentObservability:
         df.to_csv(filename, index=False)
         print(f"\n✅ Exported {len(interactions)} interactions to {filename}\n")
     
-    def load_historical_logs(self) -> pd.DataFrame:
-        """Load all historical logs from JSONL file"""
+    def export_to_parquet(self, output_dir: str = "agent_analytics") -> int:
+        """
+        Export all historical interactions to Parquet for analytics
+        
+        Layout: <output_dir>/day=YYYY-MM-DD/session_id=<id>/part-<offset>-<chunk>-<i>.parquet
+        (hive partitioning: day/session_id are not stored in the files, so
+        pd.read_parquet(output_dir) reads the export back as one dataset).
+        tool_args/tool_result are map<string, string>; values that are not
+        strings are stored JSON-encoded.
+        
+        The export is incremental: the byte offset reached in the log is kept
+        in <output_dir>/_export_state.json and only newer records are written
+        on the next call. Returns the number of exported records.
+        """
+        
+        if pa is None:
+            print("⚠️ Parquet export requires pyarrow (pip install pyarrow)")
+            return 0
         
         if not self.log_file.exists():
+            print(f"⚠️ Log file {self.log_file} does not exist yet")
+            return 0
+        
+        out = Path(output_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        state_file = out / "_export_state.json"
+        state = json.loads(state_file.read_text(encoding="utf-8")) if state_file.exists() else {}
+        
+        index = self.get_log_index()
+        start = state.get("exported_bytes", 0)
+        if start > index.indexed_bytes:
+            print("⚠️ Log file was truncated - exporting it again from the start")
+            start = 0
+        
+        schema = _parquet_schema()
+        # Partition columns live in the directory names only (hive layout)
+        table_schema = schema.append(pa.field("day", pa.string()))
+        exported = 0
+        
+        ranges = index.find_ranges(start_offset=start)
+        for n, chunk in enumerate(iter_log_chunks(self.log_file, ranges, engine="pandas")):
+            chunk = chunk.reindex(columns=schema.names)
+            chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], format="ISO8601")
+            chunk["tool_args"] = chunk["tool_args"].map(_to_map_items)
+            chunk["tool_result"] = chunk["tool_result"].map(_to_map_items)
+            for column in ("phase_timings", "token_usage"):
+                chunk[column] = chunk[column].map(
+                    lambda d: list(d.items()) if isinstance(d, dict) else None
+                )
+            
+            # One file per (day, session) partition and chunk of this export run
+            chunk["day"] = chunk["timestamp"].dt.strftime("%Y-%m-%d")
+            table = pa.Table.from_pandas(chunk, schema=table_schema, preserve_index=False)
+            pq.write_to_dataset(
+                table, out, partition_cols=["day", "session_id"],
+                basename_template=f"part-{start:012d}-{n:06d}-{{i}}.parquet",
+            )
+            exported += len(chunk)
+        
+        state = {"log_file": str(self.log_file), "exported_bytes": index.indexed_bytes}
+        write_text_atomic(state_file, json.dumps(state))
+        
+        print(f"\n✅ Exported {exported} new interactions to {out}/\n")
+        return exported
+    
+    def compact_log_segments(self) -> int:
+        """Merge per-process segments of all workers into the main log file"""
+        merged = compact_log_segments(self.log_file)
+        print(f"\n✅ Compacted {merged} interactions into {self.log_file}\n")
+        return merged
+    
+    def get_log_index(self) -> LogIndex:
+        """Get the sidecar offset index for the log file (updated incrementally)"""
+        return LogIndex(self.log_file).update()
+    
+    def load_historical_logs(
+        self,
+        since: Union[str, datetime, None] = None,
+        until: Union[str, datetime, None] = None,
+        session_id: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Load historical logs from JSONL file
+        
+        Uses the sidecar offset index to read only the blocks matching
+        `since`/`until`/`session_id`, parses them in vectorized chunks and
+        keeps only `columns` (all columns if None).
+        
+        Per-process segments that were not compacted yet are included, so
+        the result covers every worker writing to this log.
+        
+        Example: load_historical_logs(since=datetime.now() - timedelta(hours=24))
+        """
+        
+        log_files = [p for p in [self.log_file, *log_segments(self.log_file)] if p.exists()]
+        if not log_files:
             print(f"⚠️ Log file {self.log_file} does not exist yet")
             return pd.DataFrame()
         
-        logs = []
-        with self.log_file.open("r", encoding="utf-8") as f:
-            for line in f:
-                logs.append(json.loads(line))
+        since, until = _to_iso(since), _to_iso(until)
+        read_columns = None
+        if columns:
+            # Filter columns are always needed, even if not requested
+            read_columns = list(dict.fromkeys([*columns, "timestamp", "session_id"]))
+        
+        chunks = []
+        for path in log_files:
+            ranges = LogIndex(path).update().find_ranges(since, until, session_id)
+            for chunk in iter_log_chunks(path, ranges, read_columns):
+                # Blocks are coarse - apply the exact filters per row
+                if since:
+                    chunk = chunk[chunk["timestamp"] >= since]
+                if until:
+                    chunk = chunk[chunk["timestamp"] <= until]
+                if session_id:
+                    chunk = chunk[chunk["session_id"] == session_id]
+                if columns:
+                    chunk = chunk[[c for c in columns if c in chunk.columns]]
+                chunks.append(chunk)
         
-        return pd.DataFrame(logs)
+        if not chunks:
+            return pd.DataFrame(columns=columns or [])
+        return pd.concat(chunks, ignore_index=True)
     
-    def print_historical_summary(self):
-        """Print summary of all historical logs"""
+    def print_historical_summary(self, since: Union[str, datetime, None] = None):
+        """Print summary of all historical logs (optionally only since a given time)"""
         
-        df = self.load_historical_logs()
+        df = self.load_historical_logs(
+            since=since,
+            columns=["session_id", "user_question", "tool_match",
+                     "success", "response_time_seconds", "sample_weight"],
+        )
         
         if df.empty:
             print("⚠️ No historical logs available\n")
@@ -307,31 +1189,44 @@ class AgentObservability:
         print("📚 HISTORICAL PERFORMANCE (ALL SESSIONS)")
         print("="*70)
         
+        # Sampled records are reweighted (logs without sampling weigh 1)
+        weight = df['sample_weight'] if 'sample_weight' in df else pd.Series(1.0, index=df.index)
+        weight = weight.fillna(1.0).astype(float)
+        
         # Overall stats
-        total_interactions = len(df)
+        total_interactions = round(weight.sum())
         unique_sessions = df['session_id'].nunique()
         
         # Tool accuracy
-        tool_tests = df[df['tool_match'].notna()]
-        overall_accuracy = (tool_tests['tool_match'].sum() / len(tool_tests) * 100) if len(tool_tests) > 0 else 0
+        tested = df['tool_match'].notna()
+        tested_weight = weight[tested].sum()
+        correct_weight = weight[tested & (df['tool_match'] == True)].sum()
+        overall_accuracy = (correct_weight / tested_weight * 100) if tested_weight > 0 else 0
         
         # Success rate
-        success_rate = df['success'].sum() / len(df) * 100
+        success_rate = weight[df['success'] == True].sum() / weight.sum() * 100
         
-        # Avg response time
-        avg_response_time = df['response_time_seconds'].mean()
+        # Avg and P95 response time
+        avg_response_time = (df['response_time_seconds'] * weight).sum() / weight.sum()
+        from agent_regression import weighted_quantile  # agent_regression imports this module
+        timed = df['response_time_seconds'].notna()
+        p95_response_time = weighted_quantile(
+            df.loc[timed, 'response_time_seconds'].to_numpy(float), weight[timed].to_numpy(), 0.95
+        ) if timed.any() else float("nan")
         
         print(f"\n📊 Total Interactions: {total_interactions}")
         print(f"🔄 Total Sessions: {unique_sessions}")
         print(f"🎯 Overall Tool Accuracy: {overall_accuracy:.2f}%")
         print(f"✅ Overall Success Rate: {success_rate:.2f}%")
         print(f"⏱️ Average Response Time: {avg_response_time:.3f}s")
+        print(f"⏱️ P95 Response Time: {p95_response_time:.3f}s "
+              f"(per-hour baselines: python agent_regression.py)")
         
         # Most common questions
         print(f"\n📝 Most Common Questions:")
-        top_questions = df['user_question'].value_counts().head(5)
+        top_questions = weight.groupby(df['user_question']).sum().nlargest(5)
         for question, count in top_questions.items():
-            print(f"   • {question[:50]}... ({count} times)")
+            print(f"   • {question[:50]}... ({round(count)} times)")
         
         print("="*70 + "\n")
 
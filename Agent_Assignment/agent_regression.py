@@ -0,0 +1,334 @@
+# =========================================
+# Latency Regression Detection
+# =========================================
+# Per-session and per-hour latency baselines
+# from the historical log, plus change-point
+# detection on p95 per tool and phase
+# =========================================
+#
+# Usage:
+#   python agent_regression.py --deploy-time 2026-10-18T14:00     # before vs after a deploy
+#   python agent_regression.py --since 2026-10-01                 # locate the shift automatically
+#   python agent_regression.py --baselines hour --out latency.json
+#
+# Exit code 1 when a tool or phase p95 got significantly slower (rollout gate).
+# =========================================
+
+import argparse
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from agent_observability import AgentObservability
+
+LATENCY_COLUMNS = ["timestamp", "session_id", "tool_selected", "response_time_seconds",
+                   "phase_timings", "sample_weight"]
+
+
+# =========================================
+# LATENCY SAMPLES
+# =========================================
+
+def latency_samples(logs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reshape interaction logs into one row per latency sample
+
+    Columns: timestamp, session_id, hour, kind ("tool" or "phase"),
+    name, seconds, weight. Tool samples are end-to-end response times
+    by selected tool; phase samples come from phase_timings.
+    """
+
+    columns = ["timestamp", "session_id", "hour", "kind", "name", "seconds", "weight"]
+    if logs.empty:
+        return pd.DataFrame(columns=columns)
+
+    logs = logs.reindex(columns=LATENCY_COLUMNS)
+    base = pd.DataFrame({
+        "timestamp": pd.to_datetime(logs["timestamp"], format="ISO8601"),
+        "session_id": logs["session_id"],
+        "weight": logs["sample_weight"].fillna(1.0).astype(float),
+    })
+    base["hour"] = base["timestamp"].dt.floor("h")
+
+    tools = base.assign(
+        kind="tool",
+        name=logs["tool_selected"].fillna("none"),
+        seconds=logs["response_time_seconds"].astype(float),
+    )
+
+    phases = pd.DataFrame(
+        logs["phase_timings"].map(lambda d: d if isinstance(d, dict) else {}).tolist(),
+        index=logs.index,
+    )
+    if phases.empty:
+        return tools[columns]
+
+    phases = (
+        phases.join(base)
+        .melt(id_vars=list(base.columns), var_name="name", value_name="seconds")
+        .dropna(subset=["seconds"])
+        .assign(kind="phase")
+    )
+    return pd.concat([tools[columns], phases[columns]], ignore_index=True)
+
+
+def weighted_quantile(values: np.ndarray, weights: np.ndarray, q: float) -> float:
+    """Quantile of values where each sample counts `weight` times"""
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    position = np.searchsorted(cumulative, q * cumulative[-1])
+    return float(values[order][min(position, len(values) - 1)])
+
+
+# =========================================
+# BASELINES
+# =========================================
+
+def latency_baselines(samples: pd.DataFrame, by: str = "hour") -> pd.DataFrame:
+    """Weighted count, p50 and p95 per (session or hour, kind, name)"""
+
+    if by not in ("hour", "session_id"):
+        raise ValueError('by must be "hour" or "session_id"')
+    if samples.empty:
+        return pd.DataFrame(columns=[by, "kind", "name", "count", "p50", "p95"])
+
+    def stats(group: pd.DataFrame) -> pd.Series:
+        values, weights = group["seconds"].to_numpy(float), group["weight"].to_numpy(float)
+        return pd.Series({
+            "count": round(weights.sum()),
+            "p50": round(weighted_quantile(values, weights, 0.50), 3),
+            "p95": round(weighted_quantile(values, weights, 0.95), 3),
+        })
+
+    grouped = samples.groupby([by, "kind", "name"], sort=True)[["seconds", "weight"]]
+    return grouped.apply(stats).reset_index()
+
+
+# =========================================
+# CHANGE-POINT DETECTION
+# =========================================
+
+def _locate_change(hourly_p95: pd.Series, min_buckets: int = 2) -> Optional[pd.Timestamp]:
+    """
+    Most likely single shift in an hourly p95 series
+
+    Binary segmentation on log(p95): the split maximizing the scaled
+    difference of segment means (CUSUM statistic).
+    """
+
+    n = len(hourly_p95)
+    if n < 2 * min_buckets:
+        return None
+    values = np.log(np.maximum(hourly_p95.to_numpy(float), 1e-6))
+    splits = np.arange(min_buckets, n - min_buckets + 1)
+    prefix = np.concatenate([[0.0], np.cumsum(values)])
+    left_mean = prefix[splits] / splits
+    right_mean = (prefix[n] - prefix[splits]) / (n - splits)
+    score = np.abs(left_mean - right_mean) * np.sqrt(splits * (n - splits) / n)
+    return hourly_p95.index[splits[int(np.argmax(score))]]
+
+
+def _bootstrap_p95_ratio(
+    before: pd.DataFrame,
+    after: pd.DataFrame,
+    rng: np.random.Generator,
+    resamples: int = 300,
+    max_samples: int = 5000,
+) -> tuple:
+    """Point estimate and 90% bootstrap interval of p95(after) / p95(before)"""
+
+    def arrays(frame):
+        if len(frame) > max_samples:
+            frame = frame.sample(max_samples, random_state=0)
+        return frame["seconds"].to_numpy(float), frame["weight"].to_numpy(float)
+
+    (bv, bw), (av, aw) = arrays(before), arrays(after)
+    point = weighted_quantile(av, aw, 0.95) / max(weighted_quantile(bv, bw, 0.95), 1e-9)
+
+    ratios = np.empty(resamples)
+    for i in range(resamples):
+        b = rng.integers(0, len(bv), len(bv))
+        a = rng.integers(0, len(av), len(av))
+        ratios[i] = (weighted_quantile(av[a], aw[a], 0.95)
+                     / max(weighted_quantile(bv[b], bw[b], 0.95), 1e-9))
+    low, high = np.percentile(ratios, [5, 95])
+    return point, float(low), float(high)
+
+
+def detect_p95_shifts(
+    samples: pd.DataFrame,
+    deploy_time: Union[str, datetime, None] = None,
+    threshold: float = 0.2,
+    min_samples: int = 30,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Compare p95 before and after a change point for every tool and phase
+
+    deploy_time: split at this time; if None, the split is located per
+        series from its hourly p95 (see _locate_change).
+    threshold: relative p95 change that matters (0.2 = 20% slower).
+
+    A row is a regression when p95 rose by more than `threshold` and the
+    lower end of the bootstrap interval is above 1 (the shift is not noise).
+    """
+
+    rng = np.random.default_rng(seed)
+    deploy = pd.Timestamp(deploy_time) if deploy_time is not None else None
+    rows = []
+
+    for (kind, name), series in samples.groupby(["kind", "name"], sort=True):
+        split = deploy
+        if split is None:
+            hourly = series.groupby("hour").apply(
+                lambda g: weighted_quantile(g["seconds"].to_numpy(float), g["weight"].to_numpy(float), 0.95)
+            )
+            split = _locate_change(hourly)
+        if split is None:
+            continue
+
+        before = series[series["timestamp"] < split]
+        after = series[series["timestamp"] >= split]
+        if len(before) < min_samples or len(after) < min_samples:
+            continue
+
+        ratio, low, high = _bootstrap_p95_ratio(before, after, rng)
+        p95_before = weighted_quantile(before["seconds"].to_numpy(float), before["weight"].to_numpy(float), 0.95)
+        p95_after = weighted_quantile(after["seconds"].to_numpy(float), after["weight"].to_numpy(float), 0.95)
+
+        if ratio > 1 + threshold and low > 1:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold) and high < 1:
+            status = "improvement"
+        else:
+            status = "ok"
+
+        rows.append({
+            "kind": kind,
+            "name": name,
+            "change_at": split.isoformat(),
+            "n_before": len(before),
+            "n_after": len(after),
+            "p95_before": round(p95_before, 3),
+            "p95_after": round(p95_after, 3),
+            "change_pct": round((ratio - 1) * 100, 1),
+            "ci90_pct": [round((low - 1) * 100, 1), round((high - 1) * 100, 1)],
+            "status": status,
+        })
+
+    return pd.DataFrame(rows, columns=[
+        "kind", "name", "change_at", "n_before", "n_after",
+        "p95_before", "p95_after", "change_pct", "ci90_pct", "status",
+    ])
+
+
+# =========================================
+# REPORT
+# =========================================
+
+def build_latency_report(
+    observer: AgentObservability,
+    since: Union[str, datetime, None] = None,
+    deploy_time: Union[str, datetime, None] = None,
+    baselines_by: str = "hour",
+    threshold: float = 0.2,
+    min_samples: int = 30,
+) -> Dict:
+    """Baselines and p95 shifts for the observer's historical log"""
+
+    logs = observer.load_historical_logs(since=since, columns=LATENCY_COLUMNS)
+    samples = latency_samples(logs)
+    baselines = latency_baselines(samples, by=baselines_by)
+    shifts = detect_p95_shifts(samples, deploy_time, threshold, min_samples)
+
+    baselines[baselines_by] = baselines[baselines_by].astype(str)
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "log_file": str(observer.log_file),
+            "since": str(since) if since else None,
+            "deploy_time": str(deploy_time) if deploy_time else None,
+            "interactions": len(logs),
+            "threshold": threshold,
+            "min_samples": min_samples,
+        },
+        "baselines": baselines.to_dict("records"),
+        "shifts": shifts.to_dict("records"),
+        "regressions": [f"{r['kind']} {r['name']}" for r in shifts.to_dict("records")
+                        if r["status"] == "regression"],
+    }
+
+
+def print_latency_report(report: Dict, baselines_by: str = "hour", last: int = 6):
+    """Print the compact report: recent baselines and every detected shift"""
+
+    print("\n" + "="*70)
+    print("📉 LATENCY REGRESSION REPORT")
+    print("="*70)
+    meta = report["meta"]
+    print(f"\n📊 Interactions: {meta['interactions']} | Deploy: {meta['deploy_time'] or 'auto-detect'} "
+          f"| Threshold: +{meta['threshold'] * 100:.0f}% p95")
+
+    baselines = pd.DataFrame(report["baselines"])
+    if not baselines.empty:
+        recent = sorted(baselines[baselines_by].unique())[-last:]
+        pivot = (
+            baselines[baselines[baselines_by].isin(recent) & (baselines["kind"] == "tool")]
+            .pivot(index=baselines_by, columns="name", values="p95")
+        )
+        print(f"\n⏱️ p95 by tool (last {len(recent)} {baselines_by.replace('_id', '')}s):")
+        print(pivot.to_string())
+
+    shifts = pd.DataFrame(report["shifts"])
+    if shifts.empty:
+        print("\n⚠️ Not enough samples on both sides of a change point")
+    else:
+        print("\n🔍 p95 shifts:")
+        icons = {"regression": "❌", "improvement": "✅", "ok": "  "}
+        for row in shifts.to_dict("records"):
+            print(f"   {icons[row['status']]} {row['kind']:<5} {row['name']:<20} "
+                  f"{row['p95_before']:>7}s -> {row['p95_after']:>7}s "
+                  f"({row['change_pct']:+.1f}%, 90% CI {row['ci90_pct'][0]:+.1f}..{row['ci90_pct'][1]:+.1f}%) "
+                  f"at {row['change_at'][:16]}")
+
+    if report["regressions"]:
+        print(f"\n❌ Regressions: {', '.join(report['regressions'])}")
+    else:
+        print("\n✅ No latency regressions")
+    print("="*70 + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Detect latency regressions in agent logs")
+    parser.add_argument("--log", default="agent_logs.jsonl")
+    parser.add_argument("--since", help="only consider interactions after this ISO time")
+    parser.add_argument("--deploy-time", help="compare before/after this ISO time (default: auto-detect)")
+    parser.add_argument("--baselines", choices=["hour", "session"], default="hour")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative p95 increase to flag")
+    parser.add_argument("--min-samples", type=int, default=30)
+    parser.add_argument("--out", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    baselines_by = "session_id" if args.baselines == "session" else "hour"
+    report = build_latency_report(
+        AgentObservability(log_file=args.log),
+        since=args.since,
+        deploy_time=args.deploy_time,
+        baselines_by=baselines_by,
+        threshold=args.threshold,
+        min_samples=args.min_samples,
+    )
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print_latency_report(report, baselines_by)
+    return 1 if report["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
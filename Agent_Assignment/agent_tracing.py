@@ -0,0 +1,217 @@
+# =========================================
+# Agent Tracing (OpenTelemetry)
+# =========================================
+# One trace per run_support_agent call with
+# child spans for OpenAI requests, tool
+# execution and file_search retrieval
+# =========================================
+#
+# Usage:
+#   setup_tracing("file", path="agent_traces.jsonl")      # OTLP/JSON lines
+#   setup_tracing("otlp", endpoint="http://localhost:4318/v1/traces")
+#   provider, exporter = setup_tracing("memory")          # offline tests
+#   exporter.get_finished_spans()
+# =========================================
+
+import json
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        SimpleSpanProcessor,
+        SpanExporter,
+        SpanExportResult,
+    )
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:  # optional dependency - tracing becomes a no-op
+    trace = None
+    SpanExporter = object
+
+SERVICE_NAME = "maersk-support-agent"
+TRACER_NAME = "maersk.support_agent"
+
+
+# =========================================
+# NO-OP FALLBACK (opentelemetry not installed)
+# =========================================
+
+class _NoOpSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def set_status(self, *args, **kwargs):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self, end_time=None):
+        pass
+
+
+class _NoOpTracer:
+    @contextmanager
+    def start_as_current_span(self, name, **kwargs):
+        yield _NoOpSpan()
+
+    def start_span(self, name, **kwargs):
+        return _NoOpSpan()
+
+
+def get_tracer():
+    """Tracer for agent spans (no-op when opentelemetry is not installed)"""
+    if trace is None:
+        return _NoOpTracer()
+    return trace.get_tracer(TRACER_NAME)
+
+
+def current_span():
+    """Currently active span (no-op when opentelemetry is not installed)"""
+    if trace is None:
+        return _NoOpSpan()
+    return trace.get_current_span()
+
+
+def mark_error(span, description: str):
+    """Set ERROR status on a span"""
+    if trace is not None:
+        span.set_status(trace.Status(trace.StatusCode.ERROR, description))
+
+
+# =========================================
+# OTLP JSON FILE EXPORTER
+# =========================================
+
+def _otlp_value(value) -> Dict:
+    """Encode an attribute value as an OTLP/JSON AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes) -> List[Dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in (attributes or {}).items()]
+
+
+def _otlp_span(span: "ReadableSpan") -> Dict:
+    context = span.get_span_context()
+    encoded = {
+        "traceId": format(context.trace_id, "032x"),
+        "spanId": format(context.span_id, "016x"),
+        "name": span.name,
+        "kind": span.kind.value + 1,  # OTLP enum is offset by SPAN_KIND_UNSPECIFIED
+        "startTimeUnixNano": str(span.start_time),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": _otlp_attributes(span.attributes),
+        "events": [
+            {
+                "timeUnixNano": str(event.timestamp),
+                "name": event.name,
+                "attributes": _otlp_attributes(event.attributes),
+            }
+            for event in span.events
+        ],
+        "status": {"code": span.status.status_code.value},
+    }
+    if span.parent is not None:
+        encoded["parentSpanId"] = format(span.parent.span_id, "016x")
+    if span.status.description:
+        encoded["status"]["message"] = span.status.description
+    return encoded
+
+
+class OTLPJsonFileExporter(SpanExporter):
+    """
+    Write spans as OTLP/JSON (one ExportTraceServiceRequest per line)
+
+    The file can be replayed into any OTLP/HTTP collector, e.g.
+    `curl -H "Content-Type: application/json" --data @line http://collector:4318/v1/traces`
+    """
+
+    def __init__(self, path: str = "agent_traces.jsonl"):
+        self.path = Path(path)
+
+    def export(self, spans: Sequence["ReadableSpan"]) -> "SpanExportResult":
+        resource_spans = {}
+        for span in spans:
+            resource_key = json.dumps(dict(span.resource.attributes), sort_keys=True)
+            scope = span.instrumentation_scope
+            scope_name = scope.name if scope else ""
+            entry = resource_spans.setdefault(resource_key, {
+                "resource": {"attributes": _otlp_attributes(span.resource.attributes)},
+                "scopeSpans": {},
+            })
+            entry["scopeSpans"].setdefault(scope_name, {
+                "scope": {"name": scope_name, "version": (scope.version if scope else "") or ""},
+                "spans": [],
+            })["spans"].append(_otlp_span(span))
+
+        request = {"resourceSpans": [
+            {"resource": entry["resource"], "scopeSpans": list(entry["scopeSpans"].values())}
+            for entry in resource_spans.values()
+        ]}
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(request) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+# =========================================
+# SETUP
+# =========================================
+
+def setup_tracing(
+    exporter: str = "file",
+    path: str = "agent_traces.jsonl",
+    endpoint: Optional[str] = None,
+):
+    """
+    Install a global tracer provider for the agent
+
+    exporter:
+        "file"   - OTLP/JSON lines written to `path`
+        "otlp"   - OTLP/HTTP to a local collector (`endpoint`, default localhost:4318)
+        "memory" - keep spans in memory (offline tests)
+
+    Returns (provider, span_exporter).
+    """
+
+    if trace is None:
+        raise ImportError(
+            "Tracing requires opentelemetry-sdk (pip install opentelemetry-sdk)"
+        )
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+
+    if exporter == "memory":
+        span_exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    elif exporter == "file":
+        span_exporter = OTLPJsonFileExporter(path)
+        provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    elif exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        span_exporter = OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()
+        provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    else:
+        raise ValueError(f"Unknown trace exporter: {exporter}")
+
+    trace.set_tracer_provider(provider)
+    return provider, span_exporter
@@ -14,8 +14,11 @@ from dotenv import load_dotenv
 from pathlib import Path
 import pandas as pd
 import json
+import os
 import time
+from contextlib import nullcontext
 from agent_observability import create_observer
+from agent_tracing import current_span, get_tracer, mark_error, setup_tracing
 
 load_dotenv()
 client = OpenAI()
@@ -23,6 +26,9 @@ client = OpenAI()
 # Initialize observability tracker
 observer = None  # Will be initialized after setup
 
+# Spans are no-ops until setup_tracing() installs an exporter
+tracer = get_tracer()
+
 # =========================================
 # DATA SETUP
 # =========================================
@@ -186,6 +192,52 @@ def execute_tool(tool_name: str, arguments: dict) -> dict:
 # AGENT ORCHESTRATION (TWO-CALL PATTERN)
 # =========================================
 
+def add_token_usage(token_usage: dict, response) -> dict:
+    """Accumulate token counts reported on a Responses API result"""
+    usage = getattr(response, "usage", None)
+    if usage:
+        for field in ("input_tokens", "output_tokens", "total_tokens"):
+            token_usage[field] = token_usage.get(field, 0) + (getattr(usage, field, 0) or 0)
+        # Prompt-cache hits feed the dashboard's cache hit rate
+        cached = getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", None)
+        if cached is not None:
+            token_usage["cached_tokens"] = token_usage.get("cached_tokens", 0) + cached
+    return token_usage
+
+
+def create_response(phase: str, **kwargs):
+    """Call the Responses API inside an OpenAI request span"""
+    
+    with tracer.start_as_current_span(f"openai.responses.create {phase}") as span:
+        span.set_attributes({
+            "gen_ai.system": "openai",
+            "gen_ai.operation.name": "responses",
+            "gen_ai.request.model": kwargs["model"],
+            "agent.phase": phase,
+        })
+        request_start = time.time_ns()
+        response = client.responses.create(**kwargs)
+        
+        usage = add_token_usage({}, response)
+        span.set_attributes({
+            "gen_ai.response.id": response.id,
+            "gen_ai.usage.input_tokens": usage.get("input_tokens", 0),
+            "gen_ai.usage.output_tokens": usage.get("output_tokens", 0),
+        })
+        
+        # file_search runs server-side during this request
+        for item in response.output:
+            if getattr(item, "type", None) == "file_search_call":
+                retrieval = tracer.start_span("retrieval.file_search", start_time=request_start)
+                retrieval.set_attributes({
+                    "retrieval.status": item.status or "",
+                    "retrieval.queries": list(item.queries or []),
+                })
+                retrieval.end()
+    
+    return response
+
+
 def run_support_agent(user_question: str, show_details: bool = True, expected_tool: str = None):
     """
     Main agent function - handles tool calling with two-call pattern
@@ -199,8 +251,20 @@ def run_support_agent(user_question: str, show_details: bool = True, expected_to
         expected_tool: Expected tool for accuracy tracking (optional)
     """
     
+    # One trace per request; mark it as in flight for metrics listeners
+    with tracer.start_as_current_span("run_support_agent") as span:
+        span.set_attribute("agent.expected_tool", expected_tool or "")
+        with observer.track_request() if observer else nullcontext():
+            return _run_support_agent(user_question, show_details, expected_tool)
+
+
+def _run_support_agent(user_question: str, show_details: bool, expected_tool: str):
+    """Two-call pattern implementation (see run_support_agent)"""
+    
     # Start timing
     start_time = time.time()
+    phase_timings = {}
+    token_usage = {}
     
     # Initialize conversation
     input_list = [
@@ -231,7 +295,9 @@ def run_support_agent(user_question: str, show_details: bool = True, expected_to
         print(f"   - get_tracking_info (custom)")
         print(f"   - file_search (RAG)\n")
     
-    resp1 = client.responses.create(
+    phase_start = time.time()
+    resp1 = create_response(
+        "tool_selection",
         model="gpt-4o-mini",
         tools=all_tools,
         input=input_list,
@@ -244,6 +310,8 @@ Tool Selection Rules:
 - Be precise in tool selection based on the question type
 """
     )
+    phase_timings["tool_selection"] = time.time() - phase_start
+    add_token_usage(token_usage, resp1)
     
     # Check which tool was called
     tool_calls = [item for item in resp1.output if hasattr(item, 'type') and item.type == "function_call"]
@@ -257,6 +325,7 @@ Tool Selection Rules:
             print("📚 Searched FAQ knowledge base\n")
         
         response_time = time.time() - start_time
+        current_span().set_attributes({"agent.tool_selected": tool_selected, "agent.success": True})
         
         # Log to observer
         if observer:
@@ -266,7 +335,9 @@ Tool Selection Rules:
                 expected_tool=expected_tool,
                 response_time=response_time,
                 success=True,
-                response_text=resp1.output_text
+                response_text=resp1.output_text,
+                phase_timings=phase_timings,
+                token_usage=token_usage
             )
         
         print(f"\n💬 AGENT RESPONSE:\n{resp1.output_text}\n")
@@ -294,20 +365,33 @@ Tool Selection Rules:
         })
         
         # Execute the tool
-        try:
-            result = execute_tool(tool_name, args)
-            tool_result = result
-            
-            # Check if tool execution was successful
-            if isinstance(result, dict) and result.get("found") == False:
+        phase_start = time.time()
+        with tracer.start_as_current_span(f"tool.execute {tool_name}") as tool_span:
+            tool_span.set_attribute("tool.name", tool_name)
+            try:
+                result = execute_tool(tool_name, args)
+                tool_result = result
+                tool_span.set_attribute("tool.status", "ok")
+                
+                # Check if tool execution was successful
+                if isinstance(result, dict) and result.get("found") == False:
+                    success = False
+                    error_msg = result.get("message", "Tool returned no results")
+                    tool_span.set_attribute("tool.status", "not_found")
+                    mark_error(tool_span, error_msg)
+                
+            except Exception as e:
                 success = False
-                error_msg = result.get("message", "Tool returned no results")
-            
-        except Exception as e:
-            success = False
-            error_msg = str(e)
-            result = {"error": str(e)}
-            tool_result = result
+                error_msg = str(e)
+                result = {"error": str(e)}
+                tool_result = result
+                tool_span.set_attribute("tool.status", "error")
+                tool_span.record_exception(e)
+                mark_error(tool_span, error_msg)
+        
+        phase_timings["tool_execution"] = (
+            phase_timings.get("tool_execution", 0.0) + time.time() - phase_start
+        )
         
         if show_details:
             print(f"✅ TOOL RESULT: {json.dumps(result, indent=2)}\n")
@@ -320,15 +404,21 @@ Tool Selection Rules:
         })
     
     # --- CALL #2: Generate final natural language response ---
-    resp2 = client.responses.create(
+    phase_start = time.time()
+    resp2 = create_response(
+        "response_generation",
         model="gpt-4o-mini",
         tool_choice="none",  # No more tool calls
         input=input_list,
         instructions="Provide a helpful, natural response based on the tool results. Be friendly and professional."
     )
     
+    phase_timings["response_generation"] = time.time() - phase_start
+    add_token_usage(token_usage, resp2)
+    
     # Calculate total response time
     response_time = time.time() - start_time
+    current_span().set_attributes({"agent.tool_selected": tool_selected, "agent.success": success})
     
     # Log to observer
     if observer:
@@ -341,7 +431,9 @@ Tool Selection Rules:
             response_text=resp2.output_text,
             tool_args=tool_args,
             tool_result=tool_result,
-            error=error_msg
+            error=error_msg,
+            phase_timings=phase_timings,
+            token_usage=token_usage
         )
     
     print(f"💬 AGENT RESPONSE:\n{resp2.output_text}\n")
@@ -474,5 +566,17 @@ if __name__ == "__main__":
     observer = create_observer(log_file="agent_logs.jsonl")
     print("📊 Observability initialized - tracking all interactions\n")
     
+    # Optional: expose Prometheus metrics (e.g. AGENT_METRICS_PORT=9108)
+    metrics_port = os.getenv("AGENT_METRICS_PORT")
+    if metrics_port:
+        from agent_metrics import start_metrics_server
+        start_metrics_server(observer, port=int(metrics_port))
+    
+    # Optional: export traces (AGENT_TRACE_FILE=agent_traces.jsonl or an OTLP collector)
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        setup_tracing("otlp")
+    elif os.getenv("AGENT_TRACE_FILE"):
+        setup_tracing("file", path=os.getenv("AGENT_TRACE_FILE"))
+    
     # Start interactive mode
     interactive_mode()
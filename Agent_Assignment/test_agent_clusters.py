@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from agent_clusters import (_cluster_buckets, _stem, cluster_minhash, cluster_questions,
+                            connected_components, lsh_bands, normalize_question, question_tokens)
+
+
+def _logs(questions):
+    return pd.DataFrame({
+        "user_question": questions,
+        "response_time_seconds": [1.0] * len(questions),
+        "token_usage": [{"total_tokens": 100}] * len(questions),
+        "sample_weight": [1.0] * len(questions),
+    })
+
+
+def _tokens(questions):
+    return [question_tokens(normalize_question(q)) for q in questions]
+
+
+def test_return_policy_paraphrases_share_a_cluster_at_low_threshold():
+    clusters = cluster_questions(_logs([
+        "return policy?",
+        "how do returns work",
+        "What is your return policy?",
+        "Where is container MAEU1234567?",
+    ]), threshold=0.3)
+    assert clusters["requests"].iloc[0] == 3
+    assert clusters["traffic_share"].iloc[0] == 75.0
+
+
+def test_default_threshold_keeps_different_intents_apart():
+    labels = cluster_minhash(_tokens(["order details", "cancel my order", "return policy?",
+                                      "how do returns work"]))
+    assert len(set(labels)) == 4
+
+
+def test_stem_keeps_words_ending_in_s():
+    assert [_stem(w) for w in ("status", "class", "returns")] == ["status", "class", "return"]
+
+
+def test_lsh_bands_follow_threshold():
+    assert lsh_bands(64, 0.5) == 16
+    assert lsh_bands(64, 0.3) == 32
+
+
+def test_buckets_compare_all_pairs():
+    # 0 is similar to nobody, but 1 and 2 are similar to each other
+    keys = np.zeros((3, 1), dtype=np.uint64)
+    labels = _cluster_buckets(keys, lambda left, right: (left == 1) & (right == 2))
+    assert labels.tolist() == [0, 1, 1]
+
+
+def test_connected_components_matches_chain():
+    labels = connected_components(6, np.array([4, 3, 2, 0]), np.array([5, 4, 3, 1]))
+    assert labels.tolist() == [0, 0, 2, 2, 2, 2]
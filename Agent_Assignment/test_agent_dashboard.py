@@ -0,0 +1,36 @@
+import os
+
+from agent_dashboard import LogTailer, RollingStats
+
+
+def test_tailer_backfill_starting_on_a_line_boundary_keeps_the_line(tmp_path):
+    log = tmp_path / "agent_logs.jsonl"
+    log.write_bytes(b'{"a": 1}\n{"a": 2}\n')
+    assert LogTailer(log, backfill_bytes=9).poll() == [b'{"a": 2}']
+    assert LogTailer(log, backfill_bytes=12).poll() == [b'{"a": 2}']
+
+
+def test_tailer_restarts_when_the_file_is_replaced(tmp_path):
+    segment = tmp_path / "agent_logs.host-1.jsonl"
+    segment.write_bytes(b'{"a": 1}\n')
+    tailer = LogTailer(segment)
+    assert tailer.poll() == [b'{"a": 1}']
+
+    # Compaction claims the segment; the worker starts a new one that outgrows the old offset
+    os.replace(segment, tmp_path / "agent_logs.host-1.jsonl.compacting")
+    segment.write_bytes(b'{"b": 1}\n{"b": 2}\n')
+    assert tailer.poll() == [b'{"b": 1}', b'{"b": 2}']
+
+
+def test_phase_percentiles_cover_the_request_window():
+    stats = RollingStats(window=2)
+    for i in range(4):
+        phases = {"tool_execution": float(i)}
+        if i == 0:
+            phases["retrieval"] = 9.0
+        stats.add({"timestamp": f"2026-10-01T00:00:0{i}", "phase_timings": phases,
+                   "token_usage": {"cached_tokens": i % 2}})
+    snapshot = stats.snapshot()
+    assert set(snapshot["latency_by_phase"]) == {"tool_execution"}
+    assert snapshot["latency_by_phase"]["tool_execution"]["n"] == 2
+    assert snapshot["cache_hit_rate"] == 50.0
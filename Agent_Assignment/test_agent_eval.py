@@ -0,0 +1,34 @@
+import pytest
+
+from agent_eval import build_report, diff_runs
+
+
+def _report(mode, routed_ok, latency=1.0):
+    results = [
+        {"id": f"case-{i}", "question": "q", "expected_tool": "check_order_status",
+         "tool_selected": "check_order_status" if ok else "none", "tool_match": ok, "success": True,
+         "latency_seconds": latency, "phase_timings": {}, "token_usage": {}, "error": None}
+        for i, ok in enumerate(routed_ok)
+    ]
+    report = build_report(results)
+    report["meta"] = {"mode": mode}
+    return report
+
+
+def test_live_diff_flags_routing_regressions():
+    result = diff_runs(_report("live", [True, True]), _report("live", [True, False]))
+    assert result["routing_checked"]
+    assert result["newly_incorrect"] == ["case-1"]
+    assert any("accuracy" in r for r in result["regressions"])
+
+
+def test_stub_diff_only_checks_latency():
+    result = diff_runs(_report("stub", [True, True]), _report("stub", [True, False], latency=2.0))
+    assert not result["routing_checked"]
+    assert result["regressions"] == ["latency p50 1.0s -> 2.0s", "latency p90 1.0s -> 2.0s",
+                                     "latency p95 1.0s -> 2.0s", "latency p99 1.0s -> 2.0s"]
+
+
+def test_stub_and_live_runs_cannot_be_diffed():
+    with pytest.raises(ValueError):
+        diff_runs(_report("stub", [True]), _report("live", [True]))
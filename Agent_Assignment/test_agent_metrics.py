@@ -0,0 +1,50 @@
+import pytest
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+from agent_metrics import AgentMetricsExporter
+from agent_observability import AgentObservability
+
+
+@pytest.fixture
+def observed(tmp_path):
+    observer = AgentObservability(log_file=str(tmp_path / "agent_logs.jsonl"))
+    registry = prometheus_client.CollectorRegistry()
+    observer.add_listener(AgentMetricsExporter(registry))
+    return observer, registry
+
+
+def _log(observer, tool_selected, expected_tool, success=True, response_time=1.5):
+    observer.log_interaction(
+        user_question="Where is order ORD-1001?", tool_selected=tool_selected, expected_tool=expected_tool,
+        response_time=response_time, success=success, response_text="ok",
+        phase_timings={"tool_selection": 0.5, "tool_execution": 0.2},
+        token_usage={"input_tokens": 100, "output_tokens": 20, "total_tokens": 120},
+    )
+
+
+def test_request_hooks_track_in_flight(observed):
+    observer, registry = observed
+    with observer.track_request():
+        assert registry.get_sample_value("agent_requests_in_flight") == 1
+    assert registry.get_sample_value("agent_requests_in_flight") == 0
+
+
+def test_interactions_update_counters_and_histograms(observed):
+    observer, registry = observed
+    _log(observer, "check_order_status", "check_order_status")
+    _log(observer, "get_tracking_info", "check_order_status", success=False, response_time=3.0)
+
+    value = registry.get_sample_value
+    assert value("agent_requests_total", {"tool": "check_order_status", "outcome": "success"}) == 1
+    assert value("agent_requests_total", {"tool": "get_tracking_info", "outcome": "failure"}) == 1
+    assert value("agent_request_latency_seconds_count", {"tool": "get_tracking_info"}) == 1
+    assert value("agent_request_latency_seconds_sum", {"tool": "get_tracking_info"}) == 3.0
+    assert value("agent_request_latency_seconds_bucket", {"tool": "get_tracking_info", "le": "2.0"}) == 0
+    assert value("agent_phase_latency_seconds_count", {"phase": "tool_selection"}) == 2
+    assert value("agent_tokens_total", {"type": "input"}) == 200
+    assert value("agent_tokens_total", {"type": "output"}) == 40
+    assert value("agent_tokens_total", {"type": "total"}) is None
+    assert value("agent_tool_selections_total",
+                 {"expected_tool": "check_order_status", "selected_tool": "get_tracking_info"}) == 1
+    assert value("agent_tool_selection_accuracy", {"expected_tool": "check_order_status"}) == 0.5
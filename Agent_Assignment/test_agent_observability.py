@@ -0,0 +1,147 @@
+import json
+
+import pandas as pd
+import pytest
+
+from agent_observability import (AgentObservability, LogIndex, compact_log_segments, iter_log_chunks,
+                                  log_segments, segment_path)
+
+
+def _record(ts, n):
+    return json.dumps({"timestamp": ts, "session_id": "s", "n": n}) + "\n"
+
+
+def _lines(path):
+    return [json.loads(line)["n"] for line in path.read_text().splitlines()]
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    log = tmp_path / "agent_logs.jsonl"
+    log.write_text(_record("2026-10-01T00:00:00", 0))
+    return log
+
+
+def test_log_segments_only_match_segment_names(log_file):
+    segment = segment_path(log_file)
+    segment.write_text("")
+    (log_file.parent / "agent_logs.backup.jsonl").write_text("")
+    (log_file.parent / "agent_logs.host-1.jsonl.idx").write_text("")
+    assert log_segments(log_file) == [segment]
+
+
+def test_compaction_merges_segments_in_time_order(log_file):
+    (log_file.parent / "agent_logs.a-1.jsonl").write_text(_record("2026-10-01T00:00:03", 3))
+    (log_file.parent / "agent_logs.b-2.jsonl").write_text(_record("2026-10-01T00:00:01", 1)
+                                                          + _record("2026-10-01T00:00:05", 5))
+    assert compact_log_segments(log_file) == 3
+    assert _lines(log_file) == [0, 1, 3, 5]
+    assert not list(log_file.parent.glob("*.compacting")) and log_segments(log_file) == []
+
+
+def test_compaction_picks_up_orphaned_claims(log_file):
+    (log_file.parent / "agent_logs.a-1.jsonl.compacting").write_text(_record("2026-10-01T00:00:01", 1))
+    (log_file.parent / "agent_logs.a-1.jsonl").write_text(_record("2026-10-01T00:00:02", 2))
+    assert compact_log_segments(log_file) == 2
+    assert _lines(log_file) == [0, 1, 2]
+
+
+def test_compaction_resumes_interrupted_merge_without_duplicates(log_file):
+    claimed = log_file.parent / "agent_logs.a-1.jsonl.compacting"
+    claimed.write_text(_record("2026-10-01T00:00:01", 1) + _record("2026-10-01T00:00:02", 2))
+    offset = log_file.stat().st_size
+    manifest = log_file.parent / "agent_logs.jsonl.compact"
+    manifest.write_text(json.dumps({"offset": offset, "segments": [claimed.name]}))
+    with log_file.open("a") as f:  # died half way through the second record
+        f.write(_record("2026-10-01T00:00:01", 1) + _record("2026-10-01T00:00:02", 2)[:20])
+
+    assert compact_log_segments(log_file) == 2
+    assert _lines(log_file) == [0, 1, 2]
+    assert not manifest.exists() and not claimed.exists()
+
+
+def test_compaction_finishes_cleanup_after_complete_merge(log_file):
+    claimed = log_file.parent / "agent_logs.a-1.jsonl.compacting"
+    claimed.write_text(_record("2026-10-01T00:00:01", 1))
+    manifest = log_file.parent / "agent_logs.jsonl.compact"
+    manifest.write_text(json.dumps({"offset": log_file.stat().st_size,
+                                    "segments": [claimed.name, "agent_logs.b-2.jsonl.compacting"]}))
+    with log_file.open("a") as f:
+        f.write(_record("2026-10-01T00:00:01", 1))
+
+    assert compact_log_segments(log_file) == 0
+    assert _lines(log_file) == [0, 1]
+    assert not manifest.exists() and not claimed.exists()
+
+
+def test_interrupted_merge_followed_by_other_writes_is_left_alone(log_file):
+    claimed = log_file.parent / "agent_logs.a-1.jsonl.compacting"
+    claimed.write_text(_record("2026-10-01T00:00:01", 1))
+    manifest = log_file.parent / "agent_logs.jsonl.compact"
+    manifest.write_text(json.dumps({"offset": log_file.stat().st_size, "segments": [claimed.name]}))
+    with log_file.open("a") as f:
+        f.write(_record("2026-10-01T00:00:09", 9))
+
+    with pytest.raises(RuntimeError):
+        compact_log_segments(log_file)
+    assert claimed.exists() and manifest.exists()
+
+
+def test_historical_p95_uses_sample_weights(tmp_path, capsys):
+    log = tmp_path / "agent_logs.jsonl"
+    # 10 fast successes sampled at 1/100 stand for 1000 requests; 10 slow outliers are kept as is
+    records = [{"timestamp": f"2026-10-01T00:00:{i:02d}", "session_id": "s", "user_question": "q",
+                "tool_match": True, "success": True, "response_time_seconds": 1.0, "sample_weight": 100.0}
+               for i in range(10)]
+    records += [{"timestamp": f"2026-10-01T00:01:{i:02d}", "session_id": "s", "user_question": "q",
+                 "tool_match": True, "success": True, "response_time_seconds": 30.0, "sample_weight": 1.0}
+                for i in range(10)]
+    log.write_text("".join(json.dumps(r) + "\n" for r in records))
+
+    AgentObservability(log_file=str(log)).print_historical_summary()
+    assert "P95 Response Time: 1.000s" in capsys.readouterr().out
+
+
+def test_both_parsers_return_missing_values_as_none(tmp_path):
+    pytest.importorskip("pyarrow")
+    log = tmp_path / "agent_logs.jsonl"
+    records = [
+        {"timestamp": "2026-10-01T00:00:00", "session_id": "s", "tool_match": None, "error": None,
+         "response_time_seconds": 1.5, "sample_weight": 1.0},
+        {"timestamp": "2026-10-01T00:00:01", "session_id": "s", "tool_match": True, "error": "boom",
+         "response_time_seconds": None, "sample_weight": None},
+    ]
+    log.write_text("".join(json.dumps(r) + "\n" for r in records))
+    ranges = LogIndex(log).update().find_ranges()
+    columns = ["timestamp", "tool_match", "error", "response_time_seconds"]
+
+    arrow, = iter_log_chunks(log, ranges, columns, engine="auto")
+    exact, = iter_log_chunks(log, ranges, columns, engine="pandas")
+    pd.testing.assert_frame_equal(arrow, exact)
+    assert arrow["tool_match"].iloc[0] is None and arrow["error"].iloc[0] is None
+    assert arrow["response_time_seconds"].isna().iloc[1]
+
+
+@pytest.mark.parametrize("per_process_segments", [False, True])
+def test_session_store_pages_evicted_records_from_disk(tmp_path, per_process_segments):
+    log = tmp_path / "agent_logs.jsonl"
+    other = AgentObservability(log_file=str(log))
+    other.current_session["session_id"] = "other-session"
+    other.current_session["interactions"].session_id = "other-session"
+    observer = AgentObservability(log_file=str(log), per_process_segments=per_process_segments,
+                                  session_buffer_size=3)
+    for i in range(8):
+        observer.log_interaction(user_question=f"q{i}", tool_selected="file_search", expected_tool=None,
+                                 response_time=float(i), success=i != 2, response_text="ok")
+        other.log_interaction(user_question="other", tool_selected=None, expected_tool=None,
+                              response_time=1.0, success=True, response_text="ok")
+
+    store = observer.current_session["interactions"]
+    assert len(store) == 8 and len(store.buffer) == 3 and store.evicted == 5
+    assert [r["user_question"] for r in store] == [f"q{i}" for i in range(8)]
+    assert [r["user_question"] for r in store.recent(2)] == ["q6", "q7"]
+
+    summary = observer.get_session_summary()
+    assert summary["total_interactions"] == 8
+    assert summary["failed_interactions"] == 1
+    assert summary["max_response_time"] == 7.0
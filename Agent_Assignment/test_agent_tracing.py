@@ -0,0 +1,88 @@
+import importlib
+import sys
+
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from opentelemetry.trace import StatusCode
+
+from agent_eval import StubOpenAIClient
+from agent_tracing import setup_tracing
+
+ORDERS = (
+    "order_id,customer_name,container_number,status,origin_port,destination_port,shipped_date,estimated_delivery\n"
+    "ORD-1001,Ada,MAEU1234567,In Transit,Rotterdam,Shanghai,2026-10-01,2026-11-01\n"
+)
+
+
+@pytest.fixture(scope="module")
+def traced_agent(tmp_path_factory):
+    """customer_support_agent on the offline stub, spans kept in memory"""
+    workdir = tmp_path_factory.mktemp("agent")
+    (workdir / "orders_data.csv").write_text(ORDERS)
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.chdir(workdir)
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+
+    _, exporter = setup_tracing("memory")
+    sys.modules.pop("customer_support_agent", None)
+    agent = importlib.import_module("customer_support_agent")
+    monkeypatch.setattr(agent, "client", StubOpenAIClient())
+    monkeypatch.setattr(agent, "observer", None)
+    yield agent, exporter
+    monkeypatch.undo()
+
+
+def _run(traced_agent, question, expected_tool):
+    agent, exporter = traced_agent
+    exporter.clear()
+    agent.run_support_agent(question, show_details=False, expected_tool=expected_tool)
+    spans = exporter.get_finished_spans()
+    roots = [s for s in spans if s.parent is None]
+    assert len(roots) == 1 and roots[0].name == "run_support_agent"
+    assert {s.context.trace_id for s in spans} == {roots[0].context.trace_id}
+    return roots[0], {s.name: s for s in spans if s.parent is not None}
+
+
+def test_tool_request_spans(traced_agent):
+    root, children = _run(traced_agent, "Where is order ORD-1001?", "check_order_status")
+    assert set(children) == {"openai.responses.create tool_selection", "tool.execute check_order_status",
+                             "openai.responses.create response_generation"}
+    assert all(s.parent.span_id == root.context.span_id for s in children.values())
+
+    selection = children["openai.responses.create tool_selection"]
+    assert selection.attributes["gen_ai.request.model"] == "gpt-4o-mini"
+    assert selection.attributes["gen_ai.usage.input_tokens"] > 0
+    assert children["tool.execute check_order_status"].attributes["tool.status"] == "ok"
+    assert root.attributes["agent.tool_selected"] == "check_order_status"
+
+
+def test_file_search_span(traced_agent):
+    _, children = _run(traced_agent, "What is your return policy?", "file_search")
+    retrieval = children["retrieval.file_search"]
+    assert retrieval.attributes["retrieval.status"] == "completed"
+    assert retrieval.parent.span_id == children["openai.responses.create tool_selection"].context.span_id
+
+
+def test_failing_tool_span_has_error_status(traced_agent):
+    _, children = _run(traced_agent, "Where is order ORD-9999?", "check_order_status")
+    tool = children["tool.execute check_order_status"]
+    assert tool.attributes["tool.status"] == "not_found"
+    assert tool.status.status_code == StatusCode.ERROR
+
+
+def test_raising_tool_span_records_exception(traced_agent, monkeypatch):
+    agent, _ = traced_agent
+
+    def broken(tool_name, arguments):
+        raise RuntimeError("database offline")
+
+    monkeypatch.setattr(agent, "execute_tool", broken)
+    _, children = _run(traced_agent, "Where is order ORD-1001?", "check_order_status")
+    tool = children["tool.execute check_order_status"]
+    assert tool.status.status_code == StatusCode.ERROR
+    assert tool.status.description == "database offline"
+    assert [e.name for e in tool.events] == ["exception"]
@@ -0,0 +1,293 @@
+import sqlite3
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("IPython")
+pytest.importorskip("tabulate")
+
+import utils
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "products.db")
+    utils.create_transactions_db(path, n_products=20, n_txns_per_product=10)
+    yield path
+    utils.close_pools(path)
+
+
+def _events(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT id, {', '.join(utils.EVENT_COLUMNS)} FROM transactions ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_bulk_db_independent_of_workers_and_batch_size(tmp_path):
+    builds = {}
+    for workers, batch_size in ((1, 50_000), (1, 7), (3, 50_000)):
+        path = str(tmp_path / f"bulk_{workers}_{batch_size}.db")
+        utils.create_transactions_db(path, n_products=10, n_txns_per_product=12, mode="bulk",
+                                     workers=workers, batch_size=batch_size, seed=7)
+        builds[workers, batch_size] = _events(path)
+        assert not list(tmp_path.glob("*.shard*"))
+
+    reference = builds[1, 50_000]
+    assert len(reference) == 120
+    assert [row[0] for row in reference] == list(range(1, 121))
+    assert all(rows == reference for rows in builds.values())
+
+    other = str(tmp_path / "bulk_seed.db")
+    utils.create_transactions_db(other, n_products=10, n_txns_per_product=12, mode="bulk", seed=8)
+    assert _events(other) != reference
+
+
+def _concat_events(chunks):
+    chunks = list(chunks)
+    return {col: np.concatenate([chunk[col] for chunk in chunks]) for col in utils.EVENT_COLUMNS}, len(chunks)
+
+
+def test_numpy_events_reproducible_and_independent_of_chunk_size():
+    # More products than one RNG block, so several blocks and chunks are involved
+    n_products, n_txns = utils.RNG_BLOCK_PRODUCTS + 300, 6
+    whole, n_whole = _concat_events(utils.generate_transaction_events(n_products, n_txns, seed=3))
+    chunked, n_chunked = _concat_events(utils.generate_transaction_events(n_products, n_txns, seed=3,
+                                                                          chunk_rows=1))
+    again, _ = _concat_events(utils.generate_transaction_events(n_products, n_txns, seed=3))
+    other, _ = _concat_events(utils.generate_transaction_events(n_products, n_txns, seed=4))
+
+    assert (n_whole, n_chunked) == (1, 2)
+    assert len(whole["product_id"]) == n_products * n_txns
+    for col in utils.EVENT_COLUMNS:
+        assert pd.Series(chunked[col]).equals(pd.Series(whole[col])), col
+        assert pd.Series(again[col]).equals(pd.Series(whole[col])), col
+    assert not pd.Series(other["qty_delta"]).equals(pd.Series(whole["qty_delta"]))
+
+    priced = ~np.isnan(whole["unit_price"])
+    assert (whole["unit_price"][priced] >= 1.0).all()
+
+
+def test_numpy_db_matches_generated_events(tmp_path):
+    path = str(tmp_path / "numpy.db")
+    utils.create_transactions_db(path, n_products=30, n_txns_per_product=8, mode="numpy",
+                                 chunk_rows=50, seed=5)
+    events, _ = _concat_events(utils.generate_transaction_events(30, 8, seed=5))
+    rows = _events(path)
+    assert [row[0] for row in rows] == list(range(1, 241))
+    for i, col in enumerate(utils.EVENT_COLUMNS, start=1):
+        expected = [None if isinstance(v, float) and np.isnan(v) else v for v in events[col].tolist()]
+        assert [row[i] for row in rows] == expected, col
+
+
+def test_projections_stay_consistent_after_inserts(tmp_path):
+    path = str(tmp_path / "projections.db")
+    utils.create_transactions_db(path, n_products=10, n_txns_per_product=15, mode="bulk",
+                                 projections=True)
+    assert utils.check_projections(path).empty
+
+    insert = (f"INSERT INTO transactions ({', '.join(utils.EVENT_COLUMNS)}) "
+              f"VALUES ({', '.join('?' * len(utils.EVENT_COLUMNS))})")
+    conn = sqlite3.connect(path)
+    product = conn.execute("SELECT product_id, product_name, brand, category, color "
+                           "FROM transactions WHERE product_id = 3 LIMIT 1").fetchone()
+    with conn:
+        conn.executemany(insert, [
+            product + ("sale", -2, 19.99, "Sale 2 units at 19.99"),
+            product + ("price_update", 0, 24.5, "Price update to 24.5"),
+            product + ("restock", 10, None, "Restock +10 units"),
+            (11, "Nike shoes", "Nike", "shoes", "white", "insert", 7, 80.0, "Initial insert"),
+            (11, "Nike shoes", "Nike", "shoes", "white", "sale", -1, 80.0, "Sale 1 units at 80.0"),
+        ])
+    snapshot = dict(conn.execute("SELECT product_id, current_price FROM product_snapshot").fetchall())
+    conn.close()
+
+    assert snapshot[3] == 24.5 and snapshot[11] == 80.0
+    assert utils.check_projections(path).empty
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE sales_by_brand SET units_sold = units_sold + 1 WHERE brand = 'Nike'")
+    conn.close()
+    mismatches = utils.check_projections(path)
+    assert mismatches[["projection", "column"]].values.tolist() == [["sales_by_brand", "units_sold"]]
+    assert mismatches["key"].iloc[0] == ("Nike",)
+
+
+def test_rebuilding_db_drops_projections(tmp_path):
+    path = str(tmp_path / "projections.db")
+    utils.create_transactions_db(path, n_products=5, n_txns_per_product=5, projections=True)
+    utils.create_transactions_db(path, n_products=5, n_txns_per_product=5)
+    conn = sqlite3.connect(path)
+    objects = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    conn.close()
+    assert "transactions" in objects
+    assert not objects & {f"{prefix}{name}" for name in utils.PROJECTIONS for prefix in ("", "trg_")}
+
+
+def test_read_only_pool_rejects_writes_and_reuses_connections(db_path):
+    pool = utils.get_pool(db_path)
+    assert utils.get_pool(db_path) is pool
+    with pool.connection() as first:
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            first.execute("DELETE FROM transactions")
+    with pool.connection() as second:
+        assert second is first
+        assert second.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 200
+
+
+def test_pool_rolls_back_and_times_out_when_exhausted(tmp_path):
+    path = str(tmp_path / "pool.db")
+    utils.create_transactions_db(path, n_products=2, n_txns_per_product=2)
+    pool = utils.ConnectionPool(path, size=1, read_only=False)
+    with pool.connection() as conn:
+        conn.execute("DELETE FROM transactions")
+        with pytest.raises(TimeoutError):
+            with pool.connection(timeout=0.05):
+                pass
+    with pool.connection(timeout=0.05) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == 4
+    pool.close()
+
+
+def test_close_pools_closes_idle_connections(db_path):
+    pool = utils.get_pool(db_path)
+    with pool.connection() as conn:
+        pass
+    utils.close_pools(db_path)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert utils.get_pool(db_path) is not pool
+
+
+def test_format_sql_output_text_only_frame_over_max_rows(db_path):
+    df = utils.execute_sql("SELECT color FROM transactions LIMIT 50", db_path)
+    text = utils.format_sql_output(df, max_rows=20)
+    assert "(first 20 of 50 rows shown)" in text
+    assert "Numeric columns" not in text
+
+
+def test_paged_result_rejects_cartesian_plan(db_path):
+    result = utils.execute_sql_paged("SELECT a.id FROM transactions a, transactions b, transactions c, "
+                                     "transactions d", db_path, max_plan_rows=1e6)
+    assert result.first_page["error_type"].iloc[0] == "too_expensive"
+    assert "too_expensive" in utils.format_sql_output(result)
+
+
+def test_paged_result_count_times_out(db_path):
+    query = "SELECT a.id FROM transactions a, transactions b, transactions c, transactions d"
+    result = utils.execute_sql_paged(query, db_path, timeout_seconds=0.2, max_plan_rows=None)
+    assert result.error is None and len(result.first_page) == 500
+    assert result.total_rows is None
+    assert result.aggregate_error["error_type"].iloc[0] == "timeout"
+    assert "total unknown" in utils.format_sql_output(result)
+
+
+def _indexes(db_path):
+    with utils.get_pool(db_path).connection() as conn:
+        return sorted(r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+
+
+def test_advise_indexes_recommends_without_changing_db(db_path):
+    before = _indexes(db_path)
+    advice = utils.advise_indexes("SELECT brand, SUM(qty_delta) FROM transactions "
+                                  "WHERE category = 'hat' GROUP BY brand", db_path)
+    assert advice["full_scans"] == ["transactions"]
+    assert advice["recommendations"] == ["CREATE INDEX IF NOT EXISTS idx_transactions_category_brand_qty_delta "
+                                         "ON transactions(category, brand, qty_delta)"]
+    assert not any("SCAN" in line for line in advice["plan_after"])
+    assert _indexes(db_path) == before
+
+
+@pytest.mark.parametrize("query", ["DELETE FROM transactions",
+                                   "WITH t AS (SELECT 1) DELETE FROM transactions"])
+def test_advise_indexes_rejects_writes(db_path, query):
+    rows = utils.execute_sql("SELECT COUNT(*) AS n FROM transactions", db_path, use_cache=False)["n"].iloc[0]
+    with pytest.raises(ValueError):
+        utils.advise_indexes(query, db_path)
+    assert utils.execute_sql("SELECT COUNT(*) AS n FROM transactions", db_path, use_cache=False)["n"].iloc[0] == rows
+
+
+def test_advise_indexes_times_out(db_path):
+    with pytest.raises(TimeoutError):
+        utils.advise_indexes("SELECT COUNT(*) FROM transactions a, transactions b, transactions c",
+                             db_path, timeout_seconds=0.1)
+
+
+class _ScriptedClient:
+    """chat.completions.create stand-in: `reply(model, temperature, prompt)` -> content"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature):
+        content = self.reply(model, temperature, messages[0]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(total_tokens=100))
+
+
+def test_run_sql_candidates_evaluator_on_text_results(db_path):
+    drafts = {0.0: "SELECT color FROM transactions LIMIT 30",
+              0.5: "SELECT brand FROM transactions LIMIT 30",
+              1.0: "SELECT category FROM transactions LIMIT 30"}
+
+    def reply(model, temperature, prompt):
+        if "Pick the candidate" in prompt:
+            return '{"best": 1, "reason": "brands"}'
+        return drafts[temperature]
+
+    result = utils.run_sql_candidates("Which brands?", db_path, _ScriptedClient(reply),
+                                      candidates=(("m", 0.0), ("m", 0.5), ("m", 1.0)))
+    assert result["method"] == "evaluator" and result["selected"] == 1
+
+
+def _refine_reply(sql):
+    return '{"feedback": "looks fine", "refined_sql": "%s"}' % sql
+
+
+def test_run_sql_workflow_text_only_result_completes(db_path):
+    sql = "SELECT DISTINCT product_name, color FROM transactions"
+
+    def reply(model, temperature, prompt):
+        return _refine_reply(sql) if "SQL reviewer and refiner" in prompt else sql
+
+    result = utils.run_sql_workflow(db_path, "Which products?", _ScriptedClient(reply), verbose=False)
+    assert result["stop_reason"] == "sql_unchanged"
+    assert result["trace"]["feedback"].iloc[0] == "looks fine"
+
+
+def test_run_sql_workflow_records_round_errors(db_path):
+    def reply(model, temperature, prompt):
+        if "SQL reviewer and refiner" in prompt:
+            raise RuntimeError("provider down")
+        return "SELECT color FROM transactions"
+
+    result = utils.run_sql_workflow(db_path, "q", _ScriptedClient(reply), verbose=False)
+    assert result["stop_reason"] == "round_error"
+    assert "provider down" in result["trace"]["round_error"].iloc[0]
+    assert result["sql"] == "SELECT color FROM transactions"
+
+
+def test_run_sql_workflow_no_candidate(db_path):
+    def reply(model, temperature, prompt):
+        raise RuntimeError("provider down")
+
+    result = utils.run_sql_workflow(db_path, "q", _ScriptedClient(reply), verbose=False,
+                                    candidates=(("m", 0.0), ("m", 0.5)))
+    assert result["stop_reason"] == "no_candidate"
+    assert result["sql"] is None and result["trace"].empty
+
+
+def test_run_sql_workflow_stays_within_token_budget(db_path):
+    versions = iter(f"SELECT {n} AS n" for n in range(10))
+
+    def reply(model, temperature, prompt):
+        return _refine_reply(next(versions)) if "SQL reviewer and refiner" in prompt else next(versions)
+
+    result = utils.run_sql_workflow(db_path, "q", _ScriptedClient(reply), token_budget=250, verbose=False)
+    assert result["stop_reason"] == "token_budget"
+    assert result["tokens"] <= 250
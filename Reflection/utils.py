@@ -1,24 +1,31 @@
-import sqlite3
+# ================================
+# Standard library imports
+# ================================
+import base64
+import hashlib
+import json
+import os
 import random
-import pandas as pd
-
-def create_transactions_db(
-    db_name: str = "products.db",
-    n_products: int = 100,
-    n_txns_per_product: int = 50,
-) -> None:
-    """
-    Create an SQLite DB with a single 'transactions' table (event-sourced).
-    All analytics must be derived from this table (no views).
-    """
-    conn = sqlite3.connect(db_name)
-    cur = conn.cursor()
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from html import escape
+from typing import Any
+from urllib.request import pathname2url
 
-    # Reset
-    cur.execute("DROP TABLE IF EXISTS transactions")
+# ================================
+# Third-party imports
+# ================================
+import numpy as np
+import pandas as pd
+from IPython.display import display, HTML
 
-    # Event-sourced transactions table
-    cur.execute("""
+# Event-sourced transactions table
+TRANSACTIONS_DDL = """
     CREATE TABLE transactions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         product_id INTEGER NOT NULL,
@@ -33,21 +40,116 @@ def create_transactions_db(
         notes TEXT,                      -- optional
         ts DATETIME DEFAULT CURRENT_TIMESTAMP
     )
-    """)
+    """
+
+EVENT_COLUMNS = (
+    "product_id", "product_name", "brand", "category", "color",
+    "action", "qty_delta", "unit_price", "notes",
+)
 
-    brands = ["Nike", "Adidas", "Puma", "Reebok", "New Balance"]
-    categories = ["shoes", "hoodie", "t-shirt", "hat", "backpack"]
-    colors = ["black", "white", "red", "blue", "green"]
+BRANDS = ["Nike", "Adidas", "Puma", "Reebok", "New Balance"]
+CATEGORIES = ["shoes", "hoodie", "t-shirt", "hat", "backpack"]
+COLORS = ["black", "white", "red", "blue", "green"]
 
-    rng = random.Random(42)
+# Build-time PRAGMAs: no rollback journal or fsync while generating
+# (a crash mid-build just means re-running the build)
+BULK_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",   # 256 MB
+    "PRAGMA locking_mode = EXCLUSIVE",
+)
+
+# Composite indexes for the agent's workload (filter by action, group by color/brand;
+# per-product history ordered by time). Built after loading - cheaper than
+# maintaining them row by row.
+DEFAULT_INDEXES = (
+    ("idx_transactions_action_color", "transactions(action, color)"),
+    ("idx_transactions_product_ts", "transactions(product_id, ts)"),
+)
+
+
+def _product_catalog(n_products: int, rng: random.Random, first_pid: int = 1) -> list:
+    """(pid, name, brand, category, color, base_price) per product"""
     product_catalog = []
-    for pid in range(1, n_products + 1):
-        name = f"{rng.choice(brands)} {rng.choice(categories)}"
+    for pid in range(first_pid, first_pid + n_products):
+        name = f"{rng.choice(BRANDS)} {rng.choice(CATEGORIES)}"
         brand = name.split()[0]
         category = name.split()[1]
-        color = rng.choice(colors)
+        color = rng.choice(COLORS)
         base_price = round(rng.uniform(20.0, 150.0), 2)
         product_catalog.append((pid, name, brand, category, color, base_price))
+    return product_catalog
+
+
+def create_default_indexes(conn: sqlite3.Connection) -> None:
+    """Create DEFAULT_INDEXES (if missing) and refresh planner statistics"""
+    with conn:
+        for name, target in DEFAULT_INDEXES:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        conn.execute("ANALYZE transactions")
+
+
+def create_transactions_db(
+    db_name: str = "products.db",
+    n_products: int = 100,
+    n_txns_per_product: int = 50,
+    mode: str = "default",
+    workers: int = 1,
+    batch_size: int = 50_000,
+    seed: int = 42,
+    chunk_rows: int = 1_000_000,
+    indexes: bool = True,
+    projections: bool = False,
+) -> None:
+    """
+    Create an SQLite DB with a single 'transactions' table (event-sourced).
+    All analytics must be derived from this table (no views).
+
+    mode="default": the original demo generator (one INSERT per event).
+    mode="bulk": batched executemany inside explicit transactions with
+        build-time PRAGMAs; with workers > 1, product ranges are built as
+        shard files in parallel processes and attached/merged in order.
+        Every product draws from its own RNG seeded by (seed, product_id),
+        so the result is identical for any `workers`/`batch_size`.
+    mode="numpy": vectorized generation for all products at once (same
+        distributions, different random stream), streamed in chunks of
+        ~`chunk_rows` events; see generate_transaction_events.
+
+    With indexes=True (all modes) DEFAULT_INDEXES are built once the events
+    are loaded. With projections=True the projection tables are built from the
+    loaded events and kept current by triggers (see create_projections).
+    """
+    if mode not in ("default", "bulk", "numpy"):
+        raise ValueError(f"Unknown mode: {mode}")
+
+    close_pools(db_name)
+    drop_projections(db_name)  # never leave projections of a previous DB behind
+    if mode == "bulk":
+        _create_transactions_db_bulk(db_name, n_products, n_txns_per_product,
+                                     workers, batch_size, seed, indexes)
+    elif mode == "numpy":
+        _create_transactions_db_numpy(db_name, n_products, n_txns_per_product,
+                                      chunk_rows, seed, indexes)
+    else:
+        _create_transactions_db_default(db_name, n_products, n_txns_per_product, seed, indexes)
+
+    if projections:
+        create_projections(db_name)
+
+
+def _create_transactions_db_default(db_name: str, n_products: int, n_txns_per_product: int,
+                                    seed: int, indexes: bool = True) -> None:
+    conn = sqlite3.connect(db_name)
+    cur = conn.cursor()
+
+    # Reset
+    cur.execute("DROP TABLE IF EXISTS transactions")
+    cur.execute(TRANSACTIONS_DDL)
+
+    rng = random.Random(seed)
+    product_catalog = _product_catalog(n_products, rng)
 
     # Seed events per product
     for (pid, name, brand, category, color, base_price) in product_catalog:
@@ -103,72 +205,695 @@ def create_transactions_db(
                       f"Price update to {current_price}"))
 
     conn.commit()
+    if indexes:
+        create_default_indexes(conn)
     conn.close()
 
     print(f"SQLite database '{db_name}' created with a single 'transactions' table (event-sourced).")
 
 
-def get_schema(db_path: str) -> str:
+# ================================
+# Bulk generation
+# ================================
+def _product_events(product: tuple, n_txns_per_product: int, seed: int):
+    """Yield event rows for one product from its own seeded RNG"""
+    pid, name, brand, category, color, base_price = product
+    rng = random.Random(f"{seed}:{pid}")
+
+    initial_stock = rng.randint(5, 50)
+    yield (pid, name, brand, category, color, "insert", initial_stock, base_price,
+           f"Initial insert with stock={initial_stock}, price={base_price}")
+
+    current_price = base_price
+    for event_type in rng.choices(["restock", "sale", "price_update"],
+                                  weights=[0.25, 0.6, 0.15], k=n_txns_per_product - 1):
+        if event_type == "restock":
+            qty = rng.randint(1, 25)
+            yield (pid, name, brand, category, color, "restock", qty, None, f"Restock +{qty} units")
+        elif event_type == "sale":
+            qty = -rng.randint(1, 10)
+            yield (pid, name, brand, category, color, "sale", qty, current_price,
+                   f"Sale {-qty} units at {current_price}")
+        else:
+            current_price = max(1.0, round(current_price + round(rng.uniform(-5.0, 5.0), 2), 2))
+            yield (pid, name, brand, category, color, "price_update", 0, current_price,
+                   f"Price update to {current_price}")
+
+
+def _apply_bulk_pragmas(conn: sqlite3.Connection) -> None:
+    for pragma in BULK_PRAGMAS:
+        conn.execute(pragma)
+
+
+def _insert_events(conn: sqlite3.Connection, catalog: list, n_txns_per_product: int,
+                   batch_size: int, seed: int, schema: str = "main") -> int:
+    """executemany the events of `catalog` in batches, one transaction per batch"""
+    insert = (f"INSERT INTO {schema}.transactions ({', '.join(EVENT_COLUMNS)}) "
+              f"VALUES ({', '.join('?' * len(EVENT_COLUMNS))})")
+    rows, batch = 0, []
+    for product in catalog:
+        batch.extend(_product_events(product, n_txns_per_product, seed))
+        if len(batch) >= batch_size:
+            with conn:  # explicit transaction per batch
+                conn.executemany(insert, batch)
+            rows += len(batch)
+            batch = []
+    if batch:
+        with conn:
+            conn.executemany(insert, batch)
+        rows += len(batch)
+    return rows
+
+
+def _build_shard(shard_path: str, catalog: list, n_txns_per_product: int,
+                 batch_size: int, seed: int) -> str:
+    """Worker process: write the events of one product range to its own DB file"""
+    if os.path.exists(shard_path):
+        os.remove(shard_path)
+    conn = sqlite3.connect(shard_path)
+    _apply_bulk_pragmas(conn)
+    conn.execute(TRANSACTIONS_DDL)
+    _insert_events(conn, catalog, n_txns_per_product, batch_size, seed)
+    conn.close()
+    return shard_path
+
+
+def _create_transactions_db_bulk(db_name: str, n_products: int, n_txns_per_product: int,
+                                 workers: int, batch_size: int, seed: int,
+                                 indexes: bool = True) -> None:
+    catalog = _product_catalog(n_products, random.Random(seed))
+
+    conn = sqlite3.connect(db_name)
+    conn.execute("DROP TABLE IF EXISTS transactions")
+    conn.execute(TRANSACTIONS_DDL)
+    conn.commit()
+    _apply_bulk_pragmas(conn)
+
+    if workers <= 1:
+        rows = _insert_events(conn, catalog, n_txns_per_product, batch_size, seed)
+    else:
+        # Contiguous product ranges keep ids in product order after the merge
+        size = -(-len(catalog) // workers)
+        chunks = [catalog[i:i + size] for i in range(0, len(catalog), size)]
+        shard_paths = [f"{db_name}.shard{k}" for k in range(len(chunks))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_build_shard, path, chunk, n_txns_per_product, batch_size, seed)
+                       for path, chunk in zip(shard_paths, chunks)]
+            shard_paths = [f.result() for f in futures]
+
+        columns = ", ".join(EVENT_COLUMNS + ("ts",))
+        rows = 0
+        for path in shard_paths:
+            conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            with conn:
+                cur = conn.execute(f"INSERT INTO transactions ({columns}) "
+                                   f"SELECT {columns} FROM shard.transactions ORDER BY id")
+                rows += cur.rowcount
+            conn.execute("DETACH DATABASE shard")
+            os.remove(path)
+
+    if indexes:
+        create_default_indexes(conn)
+    conn.close()
+    print(f"SQLite database '{db_name}' created with {rows:,} events (bulk, {max(workers, 1)} worker(s)).")
+
+
+# ================================
+# Vectorized generation (NumPy)
+# ================================
+ACTIONS = np.array(["restock", "sale", "price_update", "insert"], dtype=object)
+RESTOCK, SALE, PRICE_UPDATE, INSERT = range(4)
+
+# Products drawn from one RNG stream; chunks are whole blocks, so the output
+# does not depend on the chunk size
+RNG_BLOCK_PRODUCTS = 1024
+
+
+def _price_path_cents(base_cents: np.ndarray, deltas: np.ndarray, floor_cents: int = 100) -> np.ndarray:
     """
-    Return only the schema that the agent should use: 'transactions' table.
+    Price after each event for all products at once (shape of `deltas`).
+
+    Vectorizes the sequential rule price = max(floor, price + delta): with
+    X = price - floor and S the running sum of deltas, the Lindley recursion
+    X_t = max(0, X_{t-1} + d_t) has the closed form
+    X_t = S_t + max(X_0, max_{k<=t} -S_k).
+    """
+    s = np.cumsum(deltas, axis=1)
+    lowest = np.maximum.accumulate(-s, axis=1)
+    return floor_cents + s + np.maximum((base_cents - floor_cents)[:, None], lowest)
+
+
+def _event_block(rng: np.random.Generator, first_pid: int, n_products: int,
+                 n_txns_per_product: int, include_notes: bool = True) -> dict:
+    """Columns (NumPy arrays, one row per event) for a block of products"""
+    p, t = n_products, n_txns_per_product - 1
+
+    # Catalog
+    brand = rng.integers(0, len(BRANDS), p)
+    category = rng.integers(0, len(CATEGORIES), p)
+    color = rng.integers(0, len(COLORS), p)
+    base_cents = rng.integers(2000, 15001, p)  # uniform(20, 150) rounded to cents
+    initial_stock = rng.integers(5, 51, p)
+
+    # Follow-up events, same mix and ranges as the default generator
+    actions = np.searchsorted(np.array([0.25, 0.85]), rng.random((p, t)), side="right")
+    restock_qty = rng.integers(1, 26, (p, t))
+    sale_qty = -rng.integers(1, 11, (p, t))
+    deltas = np.where(actions == PRICE_UPDATE, rng.integers(-500, 501, (p, t)), 0)
+    prices = _price_path_cents(base_cents, deltas)
+
+    qty = np.select([actions == RESTOCK, actions == SALE], [restock_qty, sale_qty], 0)
+    unit_price = np.where(actions == RESTOCK, np.nan, prices / 100)  # NaN is stored as NULL
+
+    # Prepend the 'insert' event of every product, then flatten row-major
+    action = np.hstack([np.full((p, 1), INSERT), actions]).ravel()
+    qty = np.hstack([initial_stock[:, None], qty]).ravel()
+    unit_price = np.hstack([(base_cents / 100)[:, None], unit_price]).ravel()
+    product = np.repeat(np.arange(p), t + 1)
+
+    brands = np.array(BRANDS, dtype=object)[brand][product]
+    categories = np.array(CATEGORIES, dtype=object)[category][product]
+    columns = {
+        "product_id": first_pid + product,
+        "product_name": brands + " " + categories,
+        "brand": brands,
+        "category": categories,
+        "color": np.array(COLORS, dtype=object)[color][product],
+        "action": ACTIONS[action],
+        "qty_delta": qty,
+        "unit_price": unit_price,
+        "notes": _event_notes(action, qty, unit_price) if include_notes else np.full(len(action), None),
+    }
+    return columns
+
+
+def _as_text(values: np.ndarray) -> np.ndarray:
+    """str() of every value, formatting each distinct value only once"""
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return distinct.astype(str).astype(object)[inverse.ravel()]  # shortest repr, like f"{x}"
+
+
+def _event_notes(action: np.ndarray, qty: np.ndarray, unit_price: np.ndarray) -> np.ndarray:
+    """Notes text in the default generator's wording, built column-wise"""
+    notes = np.empty(len(action), dtype=object)
+
+    insert, restock, sale, update = (action == code for code in (INSERT, RESTOCK, SALE, PRICE_UPDATE))
+    notes[insert] = ("Initial insert with stock=" + _as_text(qty[insert])
+                     + ", price=" + _as_text(unit_price[insert]))
+    notes[restock] = "Restock +" + _as_text(qty[restock]) + " units"
+    notes[sale] = "Sale " + _as_text(-qty[sale]) + " units at " + _as_text(unit_price[sale])
+    notes[update] = "Price update to " + _as_text(unit_price[update])
+    return notes
+
+
+def generate_transaction_events(
+    n_products: int,
+    n_txns_per_product: int,
+    seed: int = 42,
+    chunk_rows: int = 1_000_000,
+    include_notes: bool = True,
+):
+    """
+    Yield chunks of events as dicts of NumPy column arrays (EVENT_COLUMNS).
+
+    Event mix, quantity ranges, price deltas and the 1.00 price floor follow
+    the default generator; prices are simulated in integer cents. Output is
+    reproducible for a given seed, independent of `chunk_rows`.
+    """
+    block_rows = RNG_BLOCK_PRODUCTS * n_txns_per_product
+    blocks_per_chunk = max(1, chunk_rows // block_rows)
+    n_blocks = -(-n_products // RNG_BLOCK_PRODUCTS)
+
+    for first_block in range(0, n_blocks, blocks_per_chunk):
+        parts = []
+        for block in range(first_block, min(first_block + blocks_per_chunk, n_blocks)):
+            first_pid = block * RNG_BLOCK_PRODUCTS + 1
+            size = min(RNG_BLOCK_PRODUCTS, n_products - block * RNG_BLOCK_PRODUCTS)
+            rng = np.random.default_rng([seed, block])
+            parts.append(_event_block(rng, first_pid, size, n_txns_per_product, include_notes))
+        yield {col: np.concatenate([part[col] for part in parts]) for col in EVENT_COLUMNS}
+
+
+def _create_transactions_db_numpy(db_name: str, n_products: int, n_txns_per_product: int,
+                                  chunk_rows: int, seed: int, indexes: bool = True) -> None:
+    conn = sqlite3.connect(db_name)
+    conn.execute("DROP TABLE IF EXISTS transactions")
+    conn.execute(TRANSACTIONS_DDL)
+    conn.commit()
+    _apply_bulk_pragmas(conn)
+
+    insert = (f"INSERT INTO transactions ({', '.join(EVENT_COLUMNS)}) "
+              f"VALUES ({', '.join('?' * len(EVENT_COLUMNS))})")
+    rows = 0
+    for chunk in generate_transaction_events(n_products, n_txns_per_product, seed, chunk_rows):
+        # Column lists zipped lazily - no list of row tuples is built
+        with conn:
+            conn.executemany(insert, zip(*(chunk[col].tolist() for col in EVENT_COLUMNS)))
+        rows += len(chunk["product_id"])
+
+    if indexes:
+        create_default_indexes(conn)
+    conn.close()
+    print(f"SQLite database '{db_name}' created with {rows:,} events (numpy).")
+
+
+def write_transactions_parquet(
+    path: str,
+    n_products: int = 100,
+    n_txns_per_product: int = 50,
+    seed: int = 42,
+    chunk_rows: int = 1_000_000,
+    include_notes: bool = True,
+) -> int:
+    """
+    Stream generated events into one Parquet file (same columns as the table).
+    Requires pyarrow. Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    ts = pd.Timestamp.now().floor("s")
+    writer, rows = None, 0
+    try:
+        for chunk in generate_transaction_events(n_products, n_txns_per_product, seed,
+                                                 chunk_rows, include_notes):
+            n = len(chunk["product_id"])
+            arrays = {"id": pa.array(np.arange(rows + 1, rows + n + 1))}
+            for col in EVENT_COLUMNS:
+                values = chunk[col]
+                if col == "unit_price":
+                    arrays[col] = pa.array(values, mask=np.isnan(values))
+                else:
+                    arrays[col] = pa.array(values)
+            arrays["ts"] = pa.array(np.full(n, ts.to_datetime64()))
+            table = pa.table(arrays)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += n
+    finally:
+        if writer is not None:
+            writer.close()
+
+    print(f"Parquet file '{path}' written with {rows:,} events.")
+    return rows
+
+
+def benchmark_transactions_db(
+    n_products: int = 20_000,
+    n_txns_per_product: int = 50,
+    configs: tuple = (("default", 1), ("bulk", 1), ("bulk", 4), ("numpy", 1)),
+    db_name: str = "bench_products.db",
+) -> pd.DataFrame:
+    """
+    Time create_transactions_db for each (mode, workers) config and report rows/sec.
+    """
+    results = []
+    for mode, workers in configs:
+        start = time.perf_counter()
+        create_transactions_db(db_name, n_products, n_txns_per_product, mode=mode, workers=workers)
+        seconds = time.perf_counter() - start
+        rows = n_products * n_txns_per_product
+        results.append({
+            "mode": mode,
+            "workers": workers,
+            "rows": rows,
+            "seconds": round(seconds, 2),
+            "rows_per_sec": round(rows / seconds),
+        })
+    close_pools(db_name)
+    if os.path.exists(db_name):
+        os.remove(db_name)
+    return pd.DataFrame(results)
+
+
+# ================================
+# Projections
+# ================================
+# Read models derived from the event stream. Each entry: DDL, the query that
+# recomputes it from the full history (used for the backfill and the
+# consistency check) and the AFTER INSERT trigger that keeps it current.
+PROJECTIONS = {
+    "product_snapshot": {
+        "key": ["product_id"],
+        "ddl": """
+            CREATE TABLE product_snapshot (
+                product_id INTEGER PRIMARY KEY,
+                product_name TEXT NOT NULL,
+                brand TEXT NOT NULL,
+                category TEXT NOT NULL,
+                color TEXT NOT NULL,
+                stock INTEGER NOT NULL,          -- SUM(qty_delta)
+                current_price REAL,              -- latest insert/price_update price
+                units_sold INTEGER NOT NULL,
+                revenue REAL NOT NULL,           -- SUM(-qty_delta * unit_price) over sales
+                n_events INTEGER NOT NULL,
+                last_event_id INTEGER NOT NULL
+            )
+            """,
+        "recompute": """
+            SELECT a.product_id, a.product_name, a.brand, a.category, a.color, a.stock,
+                   p.unit_price AS current_price,
+                   a.units_sold, a.revenue, a.n_events, a.last_event_id
+            FROM (
+                SELECT product_id, product_name, brand, category, color,
+                       TOTAL(qty_delta) AS stock,
+                       MAX(CASE WHEN action IN ('insert', 'price_update') THEN id END) AS price_event_id,
+                       TOTAL(CASE WHEN action = 'sale' THEN -qty_delta END) AS units_sold,
+                       TOTAL(CASE WHEN action = 'sale' THEN -qty_delta * unit_price END) AS revenue,
+                       COUNT(*) AS n_events,
+                       MAX(id) AS last_event_id
+                FROM transactions
+                GROUP BY product_id
+            ) a
+            LEFT JOIN transactions p ON p.id = a.price_event_id
+            """,
+        "trigger": """
+            CREATE TRIGGER trg_product_snapshot AFTER INSERT ON transactions
+            BEGIN
+                INSERT INTO product_snapshot VALUES (
+                    NEW.product_id, NEW.product_name, NEW.brand, NEW.category, NEW.color,
+                    COALESCE(NEW.qty_delta, 0),
+                    CASE WHEN NEW.action IN ('insert', 'price_update') THEN NEW.unit_price END,
+                    CASE WHEN NEW.action = 'sale' THEN -COALESCE(NEW.qty_delta, 0) ELSE 0 END,
+                    CASE WHEN NEW.action = 'sale' THEN COALESCE(-NEW.qty_delta * NEW.unit_price, 0) ELSE 0 END,
+                    1, NEW.id
+                )
+                ON CONFLICT(product_id) DO UPDATE SET
+                    stock = stock + excluded.stock,
+                    current_price = CASE WHEN NEW.action IN ('insert', 'price_update')
+                                         THEN excluded.current_price ELSE current_price END,
+                    units_sold = units_sold + excluded.units_sold,
+                    revenue = revenue + excluded.revenue,
+                    n_events = n_events + 1,
+                    last_event_id = excluded.last_event_id;
+            END
+            """,
+    },
+}
+
+for _dim in ("brand", "color"):
+    PROJECTIONS[f"sales_by_{_dim}"] = {
+        "key": [_dim],
+        "ddl": f"""
+            CREATE TABLE sales_by_{_dim} (
+                {_dim} TEXT PRIMARY KEY,
+                units_sold INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                n_sales INTEGER NOT NULL
+            )
+            """,
+        "recompute": f"""
+            SELECT {_dim},
+                   TOTAL(-qty_delta) AS units_sold,
+                   TOTAL(-qty_delta * unit_price) AS revenue,
+                   COUNT(*) AS n_sales
+            FROM transactions
+            WHERE action = 'sale'
+            GROUP BY {_dim}
+            """,
+        "trigger": f"""
+            CREATE TRIGGER trg_sales_by_{_dim} AFTER INSERT ON transactions
+            WHEN NEW.action = 'sale'
+            BEGIN
+                INSERT INTO sales_by_{_dim} VALUES (
+                    NEW.{_dim}, -COALESCE(NEW.qty_delta, 0),
+                    COALESCE(-NEW.qty_delta * NEW.unit_price, 0), 1
+                )
+                ON CONFLICT({_dim}) DO UPDATE SET
+                    units_sold = units_sold + excluded.units_sold,
+                    revenue = revenue + excluded.revenue,
+                    n_sales = n_sales + 1;
+            END
+            """,
+    }
+del _dim
+
+
+def drop_projections(db_path: str) -> None:
+    """
+    Drop the projection tables and their triggers (if present).
     """
     conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(transactions)")
-    rows = cur.fetchall()
+    with conn:
+        for name in PROJECTIONS:
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{name}")
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
     conn.close()
-    return "table name: transactions\n" + "\n".join([f"{r[1]} ({r[2]})" for r in rows])
 
 
-def execute_sql(query: str, db_path: str) -> pd.DataFrame:
+def create_projections(db_path: str) -> None:
     """
-    Execute any SELECT over the event-sourced 'transactions' table.
+    (Re)build the projection tables from the full event history and install
+    the triggers that update them on every appended event. Done in a single
+    transaction, so no event is missed between the backfill and the triggers.
+    """
+    drop_projections(db_path)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        for name, projection in PROJECTIONS.items():
+            conn.execute(projection["ddl"])
+            conn.execute(f"INSERT INTO {name} {projection['recompute']}")
+            conn.execute(projection["trigger"])
+    conn.close()
+    print(f"Projections built in '{db_path}': {', '.join(PROJECTIONS)}.")
+
+
+def check_projections(db_path: str, rtol: float = 1e-9) -> pd.DataFrame:
+    """
+    Compare every projection with a full recomputation from 'transactions'.
+    Returns one row per mismatch (empty DataFrame = consistent).
     """
-    q = query.strip().removeprefix("```sql").removesuffix("```").strip()
     conn = sqlite3.connect(db_path)
     try:
-        return pd.read_sql_query(q, conn)
-    except Exception as e:
-        return pd.DataFrame({"error": [str(e)]})
+        mismatches = []
+        for name, projection in PROJECTIONS.items():
+            key = projection["key"]
+            stored = pd.read_sql_query(f"SELECT * FROM {name}", conn)
+            expected = pd.read_sql_query(projection["recompute"], conn)
+            merged = stored.merge(expected, on=key, how="outer",
+                                  suffixes=("_stored", "_expected"), indicator=True)
+            for col in stored.columns.difference(key):
+                a, b = merged[f"{col}_stored"], merged[f"{col}_expected"]
+                if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+                    same = np.isclose(a.astype(float), b.astype(float), rtol=rtol, equal_nan=True)
+                else:
+                    same = (a == b) | (a.isna() & b.isna())
+                for _, row in merged[~same].iterrows():
+                    mismatches.append({
+                        "projection": name,
+                        "key": tuple(row[k] for k in key),
+                        "column": col,
+                        "stored": row[f"{col}_stored"],
+                        "expected": row[f"{col}_expected"],
+                    })
     finally:
         conn.close()
+    return pd.DataFrame(mismatches, columns=["projection", "key", "column", "stored", "expected"])
 
 
 # ================================
-# Standard library imports
+# Connection pool
 # ================================
-import base64
-import json
-import re
-from html import escape
-from typing import Any, Optional
+# Per-connection settings for query connections: 64 MB page cache, 256 MB
+# memory-mapped I/O, temp B-trees (GROUP BY / ORDER BY) in memory
+POOL_PRAGMAS = (
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
 
-# ================================
-# Third-party imports
-# ================================
-import pandas as pd
-from IPython.display import display, HTML
 
-# ================================
-# Personal / local imports
-# ================================
-# 
+class ConnectionPool:
+    """
+    Thread-safe pool of up to `size` connections to one SQLite file.
+    Connections are reused, so their page cache and prepared-statement cache
+    (`cached_statements`) stay warm across queries. read_only=True opens them
+    with a `mode=ro` URI: agent SQL cannot modify the database.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, read_only: bool = True,
+                 cached_statements: int = 256):
+        self.db_path = os.path.abspath(db_path)
+        self.read_only = read_only
+        self.cached_statements = cached_statements
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.read_only:
+            target, uri = f"file:{pathname2url(self.db_path)}?mode=ro", True
+        else:
+            target, uri = self.db_path, False
+        conn = sqlite3.connect(target, uri=uri, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for pragma in POOL_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self, timeout: float | None = None):
+        """Borrow a connection (blocks while all `size` are in use)"""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No free connection to '{self.db_path}' after {timeout}s")
+        conn = None
+        try:
+            with self._lock:
+                if self._idle:
+                    conn = self._idle.pop()
+            if conn is None:
+                conn = self._connect()
+            yield conn
+        finally:
+            if conn is not None:
+                if conn.in_transaction:
+                    conn.rollback()
+                with self._lock:
+                    if self._closed:
+                        conn.close()
+                    else:
+                        self._idle.append(conn)
+            self._slots.release()
+
+    def close(self) -> None:
+        """Close idle connections; borrowed ones are closed when returned"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(db_path: str, read_only: bool = True) -> ConnectionPool:
+    """
+    Shared ConnectionPool for (db_path, read_only), created on first use.
+    """
+    key = (os.path.abspath(db_path), read_only)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = ConnectionPool(db_path, read_only=read_only)
+        return pool
+
+
+def close_pools(db_path: str | None = None) -> None:
+    """
+    Close the pools of `db_path` (all pools if None), e.g. before the file
+    is deleted or rebuilt.
+    """
+    path = None if db_path is None else os.path.abspath(db_path)
+    with _POOLS_LOCK:
+        keys = [key for key in _POOLS if path is None or key[0] == path]
+        pools = [_POOLS.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
 
 # ================================
-# Utility function
+# Agent helpers
 # ================================
+def _strip_sql_fence(query: str) -> str:
+    return query.strip().removeprefix("```sql").removesuffix("```").strip()
+
+
+def get_schema(db_path: str, include_projections: bool = False) -> str:
+    """
+    Return only the schema that the agent should use: 'transactions' table.
+    With include_projections=True, also list the projection tables present in
+    the DB as a fast path for current stock/price and cumulative sales.
+    """
+    with get_pool(db_path).connection() as conn:
+        cur = conn.cursor()
+        cur.execute("PRAGMA table_info(transactions)")
+        rows = cur.fetchall()
+        schema = "table name: transactions\n" + "\n".join([f"{r[1]} ({r[2]})" for r in rows])
+
+        if include_projections:
+            existing = {r[0] for r in cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            tables = [name for name in PROJECTIONS if name in existing]
+            if tables:
+                schema += ("\n\n-- Projections: read-only tables kept in sync with 'transactions' on every insert.\n"
+                           "-- Prefer them for current stock, current price and total units sold/revenue.")
+            for name in tables:
+                cols = cur.execute(f"PRAGMA table_info({name})").fetchall()
+                schema += f"\n\ntable name: {name}\n" + "\n".join([f"{r[1]} ({r[2]})" for r in cols])
+    return schema
+
+
+def execute_sql(
+    query: str,
+    db_path: str,
+    read_only: bool = True,
+    timeout_seconds: float | None = 30.0,
+    max_rows: int | None = 100_000,
+    max_plan_rows: float | None = 1e9,
+    reject_expensive: bool = True,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """
+    Execute any SELECT over the event-sourced 'transactions' table.
+    Runs on a pooled connection (read-only unless read_only=False) behind
+    the query guard:
+    - plans estimated above `max_plan_rows` row visits are rejected
+      (only reported in attrs["warnings"] with reject_expensive=False);
+    - execution is interrupted after `timeout_seconds`;
+    - at most `max_rows` rows are returned (attrs["truncated"]).
+    Errors come back as a one-row (error, error_type, hint) frame.
+    The wall-clock time is in df.attrs["execution_time_seconds"].
+    None disables a limit.
+    Read-only results are served from SQL_CACHE when the same normalized
+    query already ran against the same version of the file
+    (attrs["cache_hit"]).
+    """
+    q = _strip_sql_fence(query)
+    start = time.perf_counter()
+    key = None
+    if use_cache and read_only:
+        key = (os.path.abspath(db_path), sql_fingerprint(q), max_rows, _db_version(db_path))
+        cached = SQL_CACHE.get(key)
+        if cached is not None:
+            cached.attrs["execution_time_seconds"] = round(time.perf_counter() - start, 6)
+            cached.attrs["cache_hit"] = True
+            return cached
+
+    truncated, warnings = False, []
+    try:
+        with get_pool(db_path, read_only).connection() as conn:
+            cost = None if max_plan_rows is None else _query_cost(conn, q)
+            if cost is not None and cost > max_plan_rows and reject_expensive:
+                df = sql_error_frame("too_expensive", f"Rejected: estimated {cost:,.0f} row visits "
+                                     f"(limit {max_plan_rows:,.0f})", cost=cost)
+            else:
+                if cost is not None and cost > max_plan_rows:
+                    warnings.append(f"Expensive plan: estimated {cost:,.0f} row visits")
+                df, truncated = _fetch_with_timeout(conn, q, timeout_seconds, max_rows)
+                if truncated:
+                    warnings.append(f"Result truncated to {max_rows:,} rows")
+    except Exception as e:
+        df = sql_error_frame(_error_type(str(e)), str(e), timeout=timeout_seconds)
+    df.attrs["execution_time_seconds"] = round(time.perf_counter() - start, 6)
+    df.attrs["truncated"] = truncated
+    df.attrs["warnings"] = warnings
+    df.attrs["cache_hit"] = False
+    if key is not None and "error_type" not in df.columns:
+        SQL_CACHE.put(key, df)
+    return df
+
+
 def print_html(content: Any, title: str | None = None, is_image: bool = False):
     """
     Pretty-print inside a styled card.
     - If is_image=True and content is a string: treat as image path/URL and render <img>.
     - If content is a pandas DataFrame/Series: render as an HTML table.
+    - If content is a PagedResult: render its first page and the total row count.
     - Otherwise (strings/otros): show as code/text in <pre><code>.
     """
-    try:
-        from html import escape as _escape
-    except ImportError:
-        _escape = lambda x: x
-
     def image_to_base64(image_path: str) -> str:
         with open(image_path, "rb") as img_file:
             return base64.b64encode(img_file.read()).decode("utf-8")
@@ -177,14 +902,22 @@ def print_html(content: Any, title: str | None = None, is_image: bool = False):
     if is_image and isinstance(content, str):
         b64 = image_to_base64(content)
         rendered = f'<img src="data:image/png;base64,{b64}" alt="Image" style="max-width:100%; height:auto; border-radius:8px;">'
+    elif isinstance(content, PagedResult):
+        # First page only, plus how much more there is
+        rendered = content.first_page.to_html(classes="pretty-table", index=False, border=0, escape=False)
+        if not content.error:
+            total = content.total_rows
+            total = "an unknown number of" if total is None else f"{total:,}"
+            rendered += (f'<p style="font-size:12px; color:#555;">Showing {len(content.first_page):,} '
+                         f'of {total} rows</p>')
     elif isinstance(content, pd.DataFrame):
         rendered = content.to_html(classes="pretty-table", index=False, border=0, escape=False)
     elif isinstance(content, pd.Series):
         rendered = content.to_frame().to_html(classes="pretty-table", border=0, escape=False)
     elif isinstance(content, str):
-        rendered = f"<pre><code>{_escape(content)}</code></pre>"
+        rendered = f"<pre><code>{escape(content)}</code></pre>"
     else:
-        rendered = f"<pre><code>{_escape(str(content))}</code></pre>"
+        rendered = f"<pre><code>{escape(str(content))}</code></pre>"
 
     css = """
     <style>
@@ -236,4 +969,986 @@ def print_html(content: Any, title: str | None = None, is_image: bool = False):
 
     title_html = f'<div class="pretty-title">{title}</div>' if title else ""
     card = f'<div class="pretty-card">{title_html}{rendered}</div>'
-    display(HTML(css + card))
\ No newline at end of file
+    display(HTML(css + card))
+
+
+# ================================
+# Result cache
+# ================================
+_SQL_LITERAL = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_SQL_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Canonical text of a query: no fence, comments or trailing ';', keywords and
+    identifiers lower-cased, whitespace collapsed. String literals and quoted
+    identifiers are kept as written.
+    """
+    parts = _SQL_LITERAL.split(_strip_sql_fence(query).rstrip(";"))
+    for i in range(0, len(parts), 2):  # even parts are outside quotes
+        code = _SQL_COMMENT.sub(" ", parts[i]).lower()
+        code = re.sub(r"\s+", " ", code)
+        parts[i] = re.sub(r" ?([(),=<>+*/]) ?", r"\1", code)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def sql_fingerprint(query: str) -> str:
+    return hashlib.blake2b(normalize_sql(query).encode(), digest_size=16).hexdigest()
+
+
+def _db_version(db_path: str) -> tuple:
+    """Changes whenever the database (or its WAL) is written"""
+    version = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            version.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+
+class QueryCache:
+    """
+    Thread-safe LRU of query results, bounded by entry count and by the
+    DataFrames' memory footprint. Callers get copies, so cached frames
+    cannot be modified.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (DataFrame, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key) -> pd.DataFrame | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry[0].copy()
+
+    def put(self, key, df: pd.DataFrame) -> None:
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (df.copy(), nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+SQL_CACHE = QueryCache()
+
+
+# ================================
+# Paged results
+# ================================
+class PagedResult:
+    """
+    Result of one query, fetched page by page. Only `first_page` is read up
+    front; iterating re-runs the query on one pooled cursor and yields
+    DataFrames of `page_size` rows, stopping after `max_rows`. `total_rows`
+    and summary() aggregate over the query in SQLite without fetching it.
+    Same guard as execute_sql: the plan cost is checked before anything
+    runs, and every statement (each page, each aggregate) is interrupted
+    after `timeout_seconds`. Failures become (error, error_type, hint) frames.
+    """
+
+    def __init__(self, query: str, db_path: str, page_size: int = 500,
+                 max_rows: int = 100_000, read_only: bool = True,
+                 timeout_seconds: float | None = 30.0, max_plan_rows: float | None = 1e9):
+        self.query = _strip_sql_fence(query).rstrip(";").strip()
+        self.db_path = db_path
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.read_only = read_only
+        self.timeout_seconds = timeout_seconds
+        self.error = None
+        self.aggregate_error = None  # error frame of a failed COUNT / summary
+        self._total_rows = None
+        self._summary = None
+
+        start = time.perf_counter()
+        try:
+            with get_pool(db_path, read_only).connection() as conn:
+                cost = None if max_plan_rows is None else _query_cost(conn, self.query)
+            if cost is not None and cost > max_plan_rows:
+                self.error = f"Rejected: estimated {cost:,.0f} row visits (limit {max_plan_rows:,.0f})"
+                self.first_page = sql_error_frame("too_expensive", self.error, cost=cost)
+            else:
+                pages = self._pages()
+                try:
+                    self.first_page = next(pages)
+                finally:
+                    pages.close()
+        except Exception as e:
+            self.error = str(e)
+            self.first_page = sql_error_frame(_error_type(self.error), self.error, timeout=timeout_seconds)
+        self.attrs = {"execution_time_seconds": round(time.perf_counter() - start, 6)}
+
+    def _pages(self):
+        with get_pool(self.db_path, self.read_only).connection() as conn:
+            with _deadline(conn, self.timeout_seconds):
+                cur = conn.execute(self.query)
+            columns = [d[0] for d in cur.description or ()]
+            fetched = 0
+            try:
+                while True:
+                    with _deadline(conn, self.timeout_seconds):
+                        rows = cur.fetchmany(min(self.page_size, self.max_rows - fetched))
+                    fetched += len(rows)
+                    if rows or fetched == 0:  # an empty result still yields its columns
+                        yield pd.DataFrame.from_records(rows, columns=columns)
+                    if not rows or fetched >= self.max_rows:
+                        break
+            finally:
+                cur.close()
+
+    def __iter__(self):
+        if self.error:
+            return iter([self.first_page])
+        return self._pages()
+
+    def _aggregate(self, select: str) -> tuple | None:
+        """One aggregate row over the query; None (and aggregate_error) on failure"""
+        try:
+            with get_pool(self.db_path, self.read_only).connection() as conn:
+                with _deadline(conn, self.timeout_seconds):
+                    return conn.execute(f"SELECT {select} FROM ({self.query})").fetchone()
+        except Exception as e:
+            self.aggregate_error = sql_error_frame(_error_type(str(e)), str(e), timeout=self.timeout_seconds)
+            return None
+
+    @property
+    def total_rows(self) -> int | None:
+        """Rows the query returns in total (ignoring max_rows); None if counting failed"""
+        if self.error:
+            return 0
+        if self._total_rows is None and self.aggregate_error is None:
+            values = self._aggregate("COUNT(*)")
+            self._total_rows = values[0] if values else None
+        return self._total_rows
+
+    @property
+    def truncated(self) -> bool:
+        total = self.total_rows
+        return total is None or total > self.max_rows
+
+    def summary(self) -> pd.DataFrame:
+        """
+        min / max / mean of every numeric column over the whole result
+        (empty if the aggregate failed; see aggregate_error).
+        """
+        if self._summary is None:
+            numeric = [] if self.error else [
+                c for c in self.first_page.columns
+                if pd.api.types.is_numeric_dtype(self.first_page[c])
+            ]
+            stats = []
+            if numeric:
+                quoted = ['"' + c.replace('"', '""') + '"' for c in numeric]
+                values = self._aggregate(", ".join(
+                    f"MIN({q}), MAX({q}), AVG({q})" for q in quoted
+                ) + ", COUNT(*)")
+                if values:
+                    self._total_rows = values[-1]
+                    stats = [(c, *values[3 * i:3 * i + 3]) for i, c in enumerate(numeric)]
+            self._summary = pd.DataFrame(stats, columns=["column", "min", "max", "mean"])
+        return self._summary
+
+    def to_frame(self) -> pd.DataFrame:
+        """All pages (up to max_rows) in one DataFrame"""
+        return pd.concat(list(self), ignore_index=True)
+
+
+def execute_sql_paged(query: str, db_path: str, page_size: int = 500,
+                      max_rows: int = 100_000, read_only: bool = True,
+                      timeout_seconds: float | None = 30.0,
+                      max_plan_rows: float | None = 1e9) -> PagedResult:
+    """
+    Paged variant of execute_sql for queries that may return many rows.
+    """
+    return PagedResult(query, db_path, page_size, max_rows, read_only,
+                       timeout_seconds, max_plan_rows)
+
+
+def _numeric_summary(df: pd.DataFrame) -> pd.DataFrame:
+    """min / max / mean per numeric column (empty if there are none)"""
+    numeric = df.select_dtypes("number")
+    if numeric.columns.empty:
+        return pd.DataFrame(columns=["column", "min", "max", "mean"])
+    return numeric.describe().T[["min", "max", "mean"]].rename_axis("column").reset_index()
+
+
+def format_sql_output(result, max_rows: int = 20) -> str:
+    """
+    SQL output for a prompt: markdown table of the first `max_rows` rows and,
+    when there are more, the total row count plus numeric summary statistics.
+    """
+    if isinstance(result, PagedResult):
+        df, total = result.first_page, result.total_rows
+        summary = lambda: result.summary()
+    else:
+        df, total = result, len(result)
+        summary = lambda: _numeric_summary(result)
+    text = df.head(max_rows).to_markdown(index=False)
+    if total is None:  # the COUNT over the query failed (e.g. timed out)
+        error = result.aggregate_error.iloc[0]
+        text += (f"\n\n(first {min(len(df), max_rows)} rows shown; total unknown: "
+                 f"{error['error']} [{error['error_type']}] {error['hint']})")
+    elif total > max_rows:
+        text += f"\n\n(first {max_rows} of {total:,} rows shown)"
+        stats = summary()
+        if len(stats):
+            text += "\n\nNumeric columns over all rows:\n" + stats.to_markdown(index=False)
+    return text
+
+
+# ================================
+# Index advisor
+# ================================
+# Plan lines for a full scan look like "SCAN transactions" (SQLite >= 3.36) or
+# "SCAN TABLE transactions"; "SEARCH ... USING INDEX" without COVERING still
+# reads every matching row from the table
+_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?!.*\bUSING (?:COVERING )?INDEX\b)", re.IGNORECASE)
+_TABLE_LOOKUP = re.compile(r"^SEARCH (?:TABLE )?(\w+) USING INDEX\b", re.IGNORECASE)
+_CLAUSE_END = r"(?=\b(?:WHERE|GROUP|HAVING|ORDER|LIMIT|UNION|EXCEPT|INTERSECT)\b|\)|;|$)"
+_SQL_KEYWORDS = ("select", "from", "where", "join", "inner", "left", "right", "cross", "natural",
+                 "on", "using", "group", "order", "limit", "having", "union", "except", "intersect",
+                 "as", "and", "or", "asc", "desc")
+_TABLE_REF = re.compile(
+    r"(?:\bFROM|\bJOIN|,)\s*(\w+)(?:\s+(?:AS\s+)?(?!(?:%s)\b)(\w+))?" % "|".join(_SQL_KEYWORDS),
+    re.IGNORECASE,
+)
+_SELECT = re.compile(r"^\(*\s*(?:SELECT|WITH)\b", re.IGNORECASE)
+MAX_INDEX_COLUMNS = 6
+
+
+def explain_query_plan(query: str, db_path: str) -> pd.DataFrame:
+    """
+    EXPLAIN QUERY PLAN for `query` as a DataFrame (id, parent, detail).
+    """
+    with get_pool(db_path).connection() as conn:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + _strip_sql_fence(query)).fetchall()
+    return pd.DataFrame([(r[0], r[1], r[3]) for r in rows], columns=["id", "parent", "detail"])
+
+
+def _table_aliases(sql: str) -> dict:
+    """alias (or table name) -> table name for the FROM/JOIN clauses of `sql`"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+
+def _plan_tables(plan: pd.DataFrame, pattern: re.Pattern, aliases: dict) -> list:
+    """Tables whose plan line matches `pattern`, in plan order"""
+    tables = []
+    for detail in plan["detail"]:
+        m = pattern.match(detail)
+        if m:
+            table = aliases.get(m.group(1), m.group(1))
+            if table not in tables:
+                tables.append(table)
+    return tables
+
+
+def _referenced(columns: list, text: str, pattern: str = "") -> list:
+    """Columns (optionally alias-qualified) in `text`, followed by `pattern`, in order of appearance"""
+    hits = []
+    for col in columns:
+        m = re.search(rf"(?<![\w.])(?:\w+\.)?{col}\b\s*{pattern}", text, re.IGNORECASE)
+        if m:
+            hits.append((m.start(), col))
+    return [col for _, col in sorted(hits)]
+
+
+def _clause(keyword: str, sql: str) -> str:
+    m = re.search(rf"\b{keyword}\b(.*?){_CLAUSE_END}", sql, re.IGNORECASE | re.DOTALL)
+    return m.group(1) if m else ""
+
+
+def recommend_index_columns(query: str, columns: list) -> list:
+    """
+    Candidate index for one table: equality filters, then GROUP BY and ORDER BY
+    columns, then one range filter; the other referenced columns are appended
+    so the index covers the query (dropped if that gets too wide).
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "''", _strip_sql_fence(query))  # drop literals
+    columns = [c for c in columns if c != "id"]  # rowid is in every index
+    where = _clause("WHERE", sql)
+    equality = _referenced(columns, where, r"(?:==?|IS\b|IN\b)")
+    ranges = _referenced(columns, where, r"(?:<|>|BETWEEN\b|LIKE\b)")
+    group = _referenced(columns, _clause("GROUP BY", sql))
+    order = _referenced(columns, _clause("ORDER BY", sql))
+
+    key = []
+    for col in equality + group + order + ranges[:1]:
+        if col not in key:
+            key.append(col)
+    if re.search(r"SELECT\s+(?:DISTINCT\s+)?(?:\w+\.)?\*", sql, re.IGNORECASE):
+        return key
+    covering = key + [c for c in _referenced(columns, sql) if c not in key]
+    return covering if len(covering) <= MAX_INDEX_COLUMNS else key
+
+
+def _index_columns(conn: sqlite3.Connection, table: str) -> list:
+    return [
+        [r[2] for r in conn.execute(f"PRAGMA index_info({idx[1]})")]
+        for idx in conn.execute(f"PRAGMA index_list({table})")
+    ]
+
+
+def _best_time(conn: sqlite3.Connection, query: str, repeat: int, timeout_seconds: float | None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            with _deadline(conn, timeout_seconds):
+                conn.execute(query).fetchall()
+        except sqlite3.OperationalError as e:
+            if _error_type(str(e)) == "timeout":
+                raise TimeoutError(f"Query ran for more than {timeout_seconds}s") from e
+            raise
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def advise_indexes(query: str, db_path: str, create: bool = False, repeat: int = 3,
+                   timeout_seconds: float | None = 30.0) -> dict:
+    """
+    Run EXPLAIN QUERY PLAN on `query`, recommend an index for every table that
+    is fully scanned (or searched through a non-covering index) and time the
+    query before/after. With create=False the
+    indexes are built inside a transaction that is rolled back (SQLite DDL is
+    transactional), so the timing is real but the database is left unchanged.
+    Only SELECT queries are accepted; the baseline runs on a read-only
+    connection first, so a statement that writes fails before the writable
+    connection is opened. Each timed run is interrupted after
+    `timeout_seconds` (TimeoutError).
+    """
+    q = _strip_sql_fence(query)
+    if not _SELECT.match(q):
+        raise ValueError("advise_indexes only runs SELECT queries")
+    plan_before = explain_query_plan(q, db_path)
+    try:
+        with get_pool(db_path).connection() as conn:
+            before = _best_time(conn, q, repeat, timeout_seconds)
+    except sqlite3.OperationalError as e:
+        if _error_type(str(e)) == "read_only":
+            raise ValueError("advise_indexes only runs read-only queries") from e
+        raise
+    aliases = _table_aliases(q)
+    scans = _plan_tables(plan_before, _FULL_SCAN, aliases)
+    lookups = [t for t in _plan_tables(plan_before, _TABLE_LOOKUP, aliases) if t not in scans]
+
+    conn = sqlite3.connect(db_path, isolation_level=None)  # explicit BEGIN/COMMIT below
+    try:
+        recommendations = []
+        for table in scans + lookups:
+            columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+            cols = recommend_index_columns(q, columns)
+            if not cols or any(existing[:len(cols)] == cols for existing in _index_columns(conn, table)):
+                continue
+            name = f"idx_{table}_{'_'.join(cols)}"
+            recommendations.append(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(cols)})")
+
+        after, plan_after = None, plan_before
+        if recommendations:
+            conn.execute("BEGIN")
+            for ddl in recommendations:
+                conn.execute(ddl)
+            for table in scans + lookups:
+                conn.execute(f"ANALYZE {table}")
+            after = _best_time(conn, q, repeat, timeout_seconds)
+            plan_after = pd.DataFrame(
+                [(r[0], r[1], r[3]) for r in conn.execute("EXPLAIN QUERY PLAN " + q)],
+                columns=["id", "parent", "detail"],
+            )
+            conn.execute("COMMIT" if create else "ROLLBACK")
+    finally:
+        conn.close()
+
+    return {
+        "query": q,
+        "full_scans": scans,
+        "table_lookups": lookups,
+        "plan_before": plan_before["detail"].tolist(),
+        "recommendations": recommendations,
+        "created": create and bool(recommendations),
+        "before_seconds": round(before, 6),
+        "after_seconds": None if after is None else round(after, 6),
+        "speedup": None if not after else round(before / after, 2),
+        "plan_after": plan_after["detail"].tolist(),
+    }
+
+
+# ================================
+# Query guard
+# ================================
+# SQLite calls the progress handler every PROGRESS_OPCODES VM instructions
+# (a few ms); returning True interrupts the running statement
+PROGRESS_OPCODES = 10_000
+_LOOP = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\w+)(.*)$", re.IGNORECASE)
+_INDEX_USED = re.compile(r"USING (?:COVERING )?INDEX (\w+) \((.*)\)", re.IGNORECASE)
+
+ERROR_HINTS = {
+    "timeout": "The query ran for more than {timeout}s. Filter with WHERE, aggregate with GROUP BY, "
+               "and never join 'transactions' to itself without a join key.",
+    "too_expensive": "The query plan is too expensive (~{cost:,.0f} row visits). Look for a missing "
+                     "join condition (cartesian product) or a correlated subquery over 'transactions'.",
+    "unknown_table": "Use only the tables listed in the schema.",
+    "unknown_column": "Use only the columns listed in the schema and check table aliases.",
+    "syntax_error": "Return exactly one valid SQLite SELECT statement, without prose.",
+    "read_only": "The database is read-only: write a SELECT query.",
+    "execution_error": "Check the query against the schema.",
+}
+
+
+def sql_error_frame(error_type: str, error: str, **details) -> pd.DataFrame:
+    """
+    One-row (error, error_type, hint) frame that the refine step can act on.
+    """
+    hint = ERROR_HINTS.get(error_type, ERROR_HINTS["execution_error"]).format(**details)
+    return pd.DataFrame({"error": [error], "error_type": [error_type], "hint": [hint]})
+
+
+def _error_type(message: str) -> str:
+    message = message.lower()
+    if "interrupted" in message:
+        return "timeout"
+    if "no such table" in message:
+        return "unknown_table"
+    if "no such column" in message or "ambiguous column" in message:
+        return "unknown_column"
+    if "readonly" in message or "read-only" in message:
+        return "read_only"
+    if "syntax error" in message or "incomplete input" in message or "one statement" in message:
+        return "syntax_error"
+    return "execution_error"
+
+
+def _table_rows(conn: sqlite3.Connection, table: str, cache: dict):
+    """Row count estimate: ANALYZE statistics, else MAX(rowid); None if unknown"""
+    if table not in cache:
+        try:
+            stat = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)).fetchone()
+        except sqlite3.OperationalError:  # never analyzed
+            stat = None
+        try:
+            cache[table] = (int(stat[0].split()[0]) if stat else
+                            conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0])
+        except sqlite3.Error:  # CTE / subquery / WITHOUT ROWID
+            cache[table] = None
+    return cache[table]
+
+
+def _loop_rows(conn: sqlite3.Connection, detail: str, aliases: dict, cache: dict):
+    """Rows one plan loop visits per iteration, or None if `detail` is not a loop"""
+    m = _LOOP.match(detail)
+    if not m:
+        return None
+    kind, name, rest = m.group(1).upper(), m.group(2), m.group(3)
+    rows = _table_rows(conn, aliases.get(name, name), cache)
+    if kind == "SCAN":
+        return rows or 1
+    if "AUTOMATIC" in rest.upper():
+        return 10
+    index = _INDEX_USED.search(rest)
+    if not index:  # rowid / primary key lookup
+        return 1
+    equalities = index.group(2).count("=?")
+    ranged = ">" in index.group(2) or "<" in index.group(2)
+    try:
+        stat = conn.execute("SELECT stat FROM sqlite_stat1 WHERE idx = ?", (index.group(1),)).fetchone()
+    except sqlite3.OperationalError:
+        stat = None
+    per_key = [int(x) for x in stat[0].split() if x.isdigit()] if stat else []
+    if equalities and len(per_key) > equalities:
+        estimate = per_key[equalities]
+    elif equalities:
+        estimate = 10  # SQLite's own default guess
+    else:
+        estimate = rows or 1
+    return max(estimate / 4 if ranged else estimate, 1)
+
+
+def _plan_cost(conn: sqlite3.Connection, plan: list, aliases: dict, cache: dict, parent: int = 0) -> float:
+    """Nested loops multiply; subqueries add (correlated ones run once per outer row)"""
+    loops, nested, correlated = 1.0, 0.0, 0.0
+    for node_id, node_parent, _, detail in plan:
+        if node_parent != parent:
+            continue
+        rows = _loop_rows(conn, detail, aliases, cache)
+        if rows is not None:
+            loops *= rows
+        elif detail.upper().startswith("CORRELATED"):
+            correlated += _plan_cost(conn, plan, aliases, cache, node_id)
+        else:
+            nested += _plan_cost(conn, plan, aliases, cache, node_id)
+    return loops + nested + loops * correlated
+
+
+def estimate_query_cost(query: str, db_path: str) -> float:
+    """
+    Rough number of rows `query` visits, from EXPLAIN QUERY PLAN and the
+    table/index statistics (a cartesian self-join of N rows gives ~N*N).
+    """
+    with get_pool(db_path).connection() as conn:
+        return _query_cost(conn, _strip_sql_fence(query))
+
+
+def _query_cost(conn: sqlite3.Connection, query: str) -> float:
+    plan = conn.execute("EXPLAIN QUERY PLAN " + query).fetchall()
+    return _plan_cost(conn, plan, _table_aliases(query), {})
+
+
+@contextmanager
+def _deadline(conn: sqlite3.Connection, timeout_seconds: float | None):
+    """Interrupt statements running on `conn` after `timeout_seconds`"""
+    if timeout_seconds is None:
+        yield
+        return
+    deadline = time.perf_counter() + timeout_seconds
+    conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_OPCODES)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)  # pooled connection: leave it clean
+
+
+def _fetch_with_timeout(conn: sqlite3.Connection, query: str, timeout_seconds: float | None,
+                        max_rows: int | None) -> tuple:
+    """(DataFrame of at most max_rows rows, truncated flag)"""
+    with _deadline(conn, timeout_seconds):
+        cur = conn.execute(query)
+        columns = [d[0] for d in cur.description or ()]
+        rows = cur.fetchall() if max_rows is None else cur.fetchmany(max_rows + 1)
+        cur.close()
+    truncated = max_rows is not None and len(rows) > max_rows
+    if truncated:
+        rows = rows[:max_rows]
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True), truncated
+
+
+# ================================
+# LLM SQL generation
+# ================================
+# (model, temperature) per candidate: one greedy draft plus sampled variants
+DEFAULT_CANDIDATES = (
+    ("openai:gpt-4.1", 0.0),
+    ("openai:gpt-4.1", 0.7),
+    ("openai:gpt-4.1-mini", 0.0),
+)
+
+
+def _complete(client, model: str, prompt: str, temperature: float) -> tuple[str, int]:
+    """One chat completion -> (content, total tokens used)"""
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+    )
+    content = response.choices[0].message.content.strip()
+    usage = getattr(response, "usage", None)
+    tokens = getattr(usage, "total_tokens", 0) or (len(prompt) + len(content)) // 4  # rough fallback
+    return content, tokens
+
+
+def _parse_json(content: str) -> dict:
+    """JSON object in a model reply (tolerates ```json fences and surrounding prose)"""
+    text = content.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    start, end = text.find("{"), text.rfind("}")
+    return json.loads(text[start:end + 1])
+
+
+def _generate_sql(question: str, schema: str, model: str, client, temperature: float = 0.0) -> tuple[str, int]:
+    prompt = f"""
+    You are a SQL assistant. Given the schema and the user's question, write a SQL query for SQLite.
+
+    Schema:
+    {schema}
+
+    User question:
+    {question}
+
+    Respond with the SQL only.
+    """
+    sql, tokens = _complete(client, model, prompt, temperature)
+    return _strip_sql_fence(sql), tokens
+
+
+def generate_sql(question: str, schema: str, model: str, client, temperature: float = 0.0) -> str:
+    """
+    Ask `model` (through an aisuite/OpenAI-style `client`) for one SQLite query.
+    """
+    return _generate_sql(question, schema, model, client, temperature)[0]
+
+
+def _result_signature(df: pd.DataFrame) -> str | None:
+    """
+    Order-insensitive fingerprint of a result's values (column names and
+    order ignored, floats to 10 significant digits); None for error frames.
+    """
+    if "error_type" in df.columns:
+        return None
+    rows = sorted(
+        tuple(sorted(f"{v:.10g}" if isinstance(v, float) else str(v) for v in row))
+        for row in df.itertuples(index=False)
+    )
+    return hashlib.blake2b(repr(rows).encode(), digest_size=16).hexdigest()
+
+
+def _pick_by_evaluator(question: str, candidates: list, model: str, client) -> tuple[int | None, str, int]:
+    """One evaluator call over all candidates -> (index or None, reason, tokens)"""
+    listing = "\n\n".join(
+        f"Candidate {i}:\nSQL:\n{c['sql']}\n\nSQL Output:\n{format_sql_output(c['result'], max_rows=10)}"
+        for i, c in enumerate(candidates)
+    )
+    prompt = f"""
+    You are a SQL reviewer.
+
+    User asked:
+    {question}
+
+    {listing}
+
+    Pick the candidate whose output best answers the user's question.
+    Return a strict JSON object with two fields:
+    - "best": the candidate number
+    - "reason": one sentence
+    """
+    content, tokens = _complete(client, model, prompt, 0.0)
+    try:
+        obj = _parse_json(content)
+        best = int(obj["best"])
+        if 0 <= best < len(candidates):
+            return best, str(obj.get("reason", "")).strip(), tokens
+    except Exception:
+        pass
+    return None, content, tokens
+
+
+def run_sql_candidates(
+    question: str,
+    db_path: str,
+    client,
+    candidates: tuple = DEFAULT_CANDIDATES,
+    selection: str = "auto",
+    model_evaluation: str = "openai:gpt-4.1",
+    schema: str | None = None,
+    max_workers: int | None = None,
+) -> dict:
+    """
+    Generate one SQL query per (model, temperature) candidate concurrently,
+    execute each as soon as it is written, and pick one:
+    - selection="agreement": the largest group of candidates whose result
+      sets match (ties go to the earlier candidate);
+    - selection="evaluator": a single evaluator call that sees every SQL and
+      its output;
+    - selection="auto": agreement when a strict majority agrees, else the
+      evaluator.
+    Model calls are I/O-bound and SQLite releases the GIL while executing,
+    so worker threads are enough.
+    """
+    if selection not in ("agreement", "evaluator", "auto"):
+        raise ValueError(f"Unknown selection: {selection}")
+    start = time.perf_counter()
+    schema = schema or get_schema(db_path)
+
+    def attempt(model: str, temperature: float) -> dict:
+        t0 = time.perf_counter()
+        try:
+            sql, tokens = _generate_sql(question, schema, model, client, temperature)
+        except Exception as e:
+            sql, tokens = "", 0
+            result = sql_error_frame("execution_error", f"Generation failed: {e}")
+        t1 = time.perf_counter()
+        if sql:
+            result = execute_sql(sql, db_path)
+        return {
+            "model": model,
+            "temperature": temperature,
+            "sql": sql,
+            "result": result,
+            "tokens": tokens,
+            "generation_seconds": round(t1 - t0, 3),
+            "execution_seconds": round(time.perf_counter() - t1, 3),
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(candidates)) as pool:
+        runs = list(pool.map(lambda c: attempt(*c), candidates))
+
+    signatures = [_result_signature(r["result"]) for r in runs]
+    for run, signature in zip(runs, signatures):
+        run["agreement"] = signatures.count(signature) if signature else 0
+    ok = [i for i, sig in enumerate(signatures) if sig]
+
+    selected, method, reason, eval_tokens = None, selection, "", 0
+    if ok:
+        best = max(ok, key=lambda i: (runs[i]["agreement"], -i))
+        majority = runs[best]["agreement"] * 2 > len(runs)
+        if selection == "agreement" or (selection == "auto" and majority):
+            selected, method = best, "agreement"
+            reason = f"{runs[best]['agreement']} of {len(runs)} candidates returned the same result"
+        else:
+            selected, reason, eval_tokens = _pick_by_evaluator(question, runs, model_evaluation, client)
+            method = "evaluator"
+            if selected is None:  # unparseable verdict: fall back to agreement
+                selected, method = best, "agreement"
+
+    chosen = runs[selected] if selected is not None else None
+    return {
+        "sql": chosen["sql"] if chosen else None,
+        "result": chosen["result"] if chosen else runs[0]["result"],
+        "selected": selected,
+        "method": method,
+        "reason": reason,
+        "tokens": sum(r["tokens"] for r in runs) + eval_tokens,
+        "seconds": round(time.perf_counter() - start, 3),
+        "candidates": pd.DataFrame([_candidate_row(r) for r in runs]),
+    }
+
+
+def _candidate_row(run: dict) -> dict:
+    result = run["result"]
+    failed = "error_type" in result.columns
+    return {
+        "model": run["model"],
+        "temperature": run["temperature"],
+        "sql": run["sql"],
+        "rows": 0 if failed else len(result),
+        "error": result["error"].iloc[0] if failed else None,
+        "agreement": run["agreement"],
+        "tokens": run["tokens"],
+        "generation_seconds": run["generation_seconds"],
+        "execution_seconds": run["execution_seconds"],
+    }
+
+
+# ================================
+# Reflection loop
+# ================================
+def _refine_sql_external_feedback(question: str, sql_query: str, df_feedback: pd.DataFrame, schema: str,
+                                  model: str, client, temperature: float = 1.0) -> tuple[str, str, int]:
+    prompt = f"""
+    You are a SQL reviewer and refiner.
+
+    User asked:
+    {question}
+
+    Original SQL:
+    {sql_query}
+
+    SQL Output:
+    {format_sql_output(df_feedback)}
+
+    Table Schema:
+    {schema}
+
+    Step 1: Briefly evaluate if the SQL output answers the user's question.
+    Step 2: If the SQL could be improved, provide a refined SQL query.
+    If the original SQL is already correct, return it unchanged.
+
+    Return a strict JSON object with two fields:
+    - "feedback": brief evaluation and suggestions
+    - "refined_sql": the final SQL to run
+    """
+    content, tokens = _complete(client, model, prompt, temperature)
+    try:
+        obj = _parse_json(content)
+        feedback = str(obj.get("feedback", "")).strip()
+        refined_sql = _strip_sql_fence(str(obj.get("refined_sql", sql_query))) or sql_query
+    except Exception:
+        # Not valid JSON: keep the raw reply as feedback and the original SQL
+        feedback, refined_sql = content, sql_query
+    return feedback, refined_sql, tokens
+
+
+def refine_sql_external_feedback(question: str, sql_query: str, df_feedback: pd.DataFrame, schema: str,
+                                 model: str, client, temperature: float = 1.0) -> tuple[str, str]:
+    """
+    Evaluate whether the SQL result answers the user's question and,
+    if necessary, propose a refined version of the query.
+    Returns (feedback, refined_sql).
+    """
+    return _refine_sql_external_feedback(question, sql_query, df_feedback, schema,
+                                         model, client, temperature)[:2]
+
+
+def run_sql_workflow(
+    db_path: str,
+    question: str,
+    client,
+    model_generation: str = "openai:gpt-4.1",
+    model_evaluation: str = "openai:gpt-4.1",
+    max_rounds: int = 3,
+    time_budget_seconds: float = 120.0,
+    token_budget: int = 20_000,
+    candidates: tuple | None = None,
+    refine_temperature: float = 0.0,
+    include_projections: bool = False,
+    verbose: bool = True,
+) -> dict:
+    """
+    Generate -> execute -> evaluate -> refine until one of:
+    - "sql_unchanged": the evaluator returns the same (normalized) SQL;
+    - "result_stable": the refined SQL returns the same result set;
+    - "max_rounds": `max_rounds` refinements were made;
+    - "time_budget": the time budget is used up before the next model call;
+    - "token_budget": the next model call, assumed to cost as much as the
+      previous one, would exceed `token_budget` (a soft limit: the real
+      usage of a call is only known after it returns);
+    - "no_candidate": no SQL could be generated for V1;
+    - "round_error": a round failed outside SQL execution (e.g. the model
+      call); the error is in the trace.
+    With `candidates` (see run_sql_candidates) V1 is picked from parallel drafts.
+    Returns the final SQL and result (the last version that ran without
+    error, if any did), the stop reason and a per-version trace with timings.
+    """
+    start = time.perf_counter()
+    tokens, rounds, trace, results = 0, 0, [], []
+    schema = get_schema(db_path, include_projections=include_projections)
+
+    def remaining() -> float:
+        return time_budget_seconds - (time.perf_counter() - start)
+
+    def run_version(sql: str, produced_seconds: float, produced_tokens: int) -> None:
+        t0 = time.perf_counter()
+        try:
+            result = execute_sql(sql, db_path, timeout_seconds=max(min(30.0, remaining()), 1.0))
+        except Exception as e:
+            result = sql_error_frame(_error_type(str(e)), str(e))
+        failed = "error_type" in result.columns
+        trace.append({
+            "version": f"V{len(trace) + 1}",
+            "sql": sql,
+            "rows": 0 if failed else len(result),
+            "error_type": result["error_type"].iloc[0] if failed else None,
+            "feedback": None,
+            "round_error": None,
+            "llm_seconds": round(produced_seconds, 3),
+            "execution_seconds": round(time.perf_counter() - t0, 3),
+            "tokens": produced_tokens,
+        })
+        results.append(result)
+        if verbose:
+            print_html(sql, title=f"🧠 SQL ({trace[-1]['version']})")
+            print_html(result, title=f"🧪 Output of {trace[-1]['version']}")
+
+    # V1
+    t0 = time.perf_counter()
+    sql, step_tokens, call_tokens, generation_error = "", 0, 0, None
+    try:
+        if candidates:
+            drafts = run_sql_candidates(question, db_path, client, candidates,
+                                        model_evaluation=model_evaluation, schema=schema)
+            written = [q for q in drafts["candidates"]["sql"] if q]
+            sql, step_tokens = drafts["sql"] or (written[0] if written else ""), drafts["tokens"]
+            call_tokens = step_tokens // len(candidates)
+        else:
+            sql, step_tokens = _generate_sql(question, schema, model_generation, client)
+            call_tokens = step_tokens
+    except Exception as e:
+        generation_error = str(e)
+    tokens += step_tokens
+
+    if not sql:
+        error = generation_error or "The model returned no SQL"
+        if verbose:
+            print_html(error, title="⛔ No SQL candidate")
+        return {
+            "sql": None,
+            "result": sql_error_frame("execution_error", error),
+            "stop_reason": "no_candidate",
+            "rounds": 0,
+            "tokens": tokens,
+            "seconds": round(time.perf_counter() - start, 3),
+            "trace": pd.DataFrame(trace),
+        }
+    run_version(sql, time.perf_counter() - t0, step_tokens)
+
+    stop_reason = "max_rounds"
+    for _ in range(max_rounds):
+        if remaining() <= 0:
+            stop_reason = "time_budget"
+            break
+        if tokens + call_tokens > token_budget:
+            stop_reason = "token_budget"
+            break
+
+        t0 = time.perf_counter()
+        try:
+            feedback, refined, step_tokens = _refine_sql_external_feedback(
+                question, sql, results[-1], schema, model_evaluation, client, refine_temperature)
+        except Exception as e:
+            trace[-1]["round_error"] = f"{type(e).__name__}: {e}"
+            stop_reason = "round_error"
+            break
+        tokens += step_tokens
+        call_tokens = step_tokens
+        rounds += 1
+        trace[-1]["feedback"] = feedback
+        if verbose:
+            print_html(feedback, title=f"🧭 Feedback on {trace[-1]['version']}")
+
+        if normalize_sql(refined) == normalize_sql(sql):
+            trace[-1]["tokens"] += step_tokens
+            trace[-1]["llm_seconds"] = round(trace[-1]["llm_seconds"] + time.perf_counter() - t0, 3)
+            stop_reason = "sql_unchanged"
+            break
+
+        previous = _result_signature(results[-1])
+        sql = refined
+        run_version(sql, time.perf_counter() - t0, step_tokens)
+        if previous is not None and _result_signature(results[-1]) == previous:
+            stop_reason = "result_stable"
+            break
+
+    final = next((i for i in reversed(range(len(results)))
+                  if "error_type" not in results[i].columns), len(results) - 1)
+    trace_df = pd.DataFrame(trace)
+    if verbose:
+        print_html(trace_df.drop(columns=["sql", "feedback"]),
+                   title=f"✅ Final answer: {trace[final]['version']} (stopped: {stop_reason})")
+    return {
+        "sql": trace[final]["sql"],
+        "result": results[final],
+        "stop_reason": stop_reason,
+        "rounds": rounds,
+        "tokens": tokens,
+        "seconds": round(time.perf_counter() - start, 3),
+        "trace": trace_df,
+    }
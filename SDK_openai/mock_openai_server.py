@@ -0,0 +1,533 @@
+# =========================================
+# Local Mock OpenAI API Server
+# =========================================
+# Stand-in for the subset of the OpenAI API
+# used in this repo, for load and integration
+# testing without network access or quota:
+#   - POST /v1/responses          (function_call items, file_search, streaming)
+#   - POST /v1/chat/completions   (incl. streaming)
+#   - POST /v1/files, /v1/vector_stores, /v1/vector_stores/{id}/file_batches
+#
+# Existing clients only need a different base URL:
+#   python mock_openai_server.py --port 8089 --latency-ms 300 --error-rate 0.02
+#   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=mock python rag_demo_ui.py
+# =========================================
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Default routing mirrors the support agent instructions
+DEFAULT_ROUTES = [
+    {"match": r"ORD-\d+", "tool": "check_order_status", "argument": "order_id"},
+    {"match": r"MAEU\d{7}", "tool": "get_tracking_info", "argument": "container_number"},
+]
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, int(len(text.split()) * 1.3))
+
+
+def _input_text(value) -> str:
+    """Latest user text from a Responses `input` or chat `messages` payload"""
+    if isinstance(value, str):
+        return value
+    for item in reversed(value or []):
+        if isinstance(item, dict) and item.get("role") == "user":
+            content = item.get("content")
+            if isinstance(content, list):
+                return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content or ""
+    return ""
+
+
+class MockBehavior:
+    """
+    Scriptable responses plus latency and error injection
+
+    script: list of rules tried in order, e.g.
+        {"endpoint": "responses", "match": "refund", "text": "Refunds take 5 days"}
+        {"endpoint": "responses", "match": "ORD-\\\\d+", "function_call":
+            {"name": "check_order_status", "arguments": {"order_id": "ORD-1005"}}}
+        {"endpoint": "chat", "match": "resume", "text": "{\\"score\\": 80}"}
+        {"match": "overload", "error": 429}
+    A rule may also set "latency_ms" to override the global latency.
+    """
+
+    def __init__(
+        self,
+        script: Optional[List[Dict]] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        stream_chunk_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        seed: int = 0,
+    ):
+        self.script = script or []
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stream_chunk_ms = stream_chunk_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.stats = {"requests": 0, "errors_injected": 0}
+
+    def next_id(self, prefix: str) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"{prefix}_mock_{self._counter:06d}"
+
+    def rule_for(self, endpoint: str, text: str) -> Optional[Dict]:
+        for rule in self.script:
+            if rule.get("endpoint", "*") not in ("*", endpoint):
+                continue
+            if re.search(rule.get("match", ""), text, re.IGNORECASE):
+                return rule
+        return None
+
+    def delay(self, rule: Optional[Dict]):
+        with self._lock:
+            self.stats["requests"] += 1
+            jitter = self._rng.uniform(0, self.jitter_ms)
+        latency = rule["latency_ms"] if rule and "latency_ms" in rule else self.latency_ms + jitter
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def injected_error(self, rule: Optional[Dict]) -> Optional[int]:
+        if rule and rule.get("error"):
+            return int(rule["error"])
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.stats["errors_injected"] += 1
+                return self.error_status
+        return None
+
+
+# =========================================
+# RESPONSE BUILDERS
+# =========================================
+
+def _message_item(behavior: MockBehavior, text: str) -> Dict:
+    return {
+        "type": "message",
+        "id": behavior.next_id("msg"),
+        "status": "completed",
+        "role": "assistant",
+        "content": [{"type": "output_text", "text": text, "annotations": []}],
+    }
+
+
+def build_response(behavior: MockBehavior, body: Dict, rule: Optional[Dict]) -> Dict:
+    """Responses API object for a request body"""
+
+    text = _input_text(body.get("input"))
+    tools = body.get("tools") or []
+    function_names = {t.get("name") for t in tools if t.get("type") == "function"}
+    has_file_search = any(t.get("type") == "file_search" for t in tools)
+    tool_outputs = [
+        item.get("output", "") for item in (body.get("input") or [])
+        if isinstance(item, dict) and item.get("type") == "function_call_output"
+    ]
+
+    output = []
+    call = None
+    if rule and rule.get("function_call"):
+        call = rule["function_call"]
+    elif body.get("tool_choice") != "none" and not tool_outputs:
+        for route in DEFAULT_ROUTES:
+            found = re.search(route["match"], text, re.IGNORECASE)
+            if found and route["tool"] in function_names:
+                call = {"name": route["tool"], "arguments": {route["argument"]: found.group(0).upper()}}
+                break
+
+    if call:
+        arguments = call.get("arguments", {})
+        output.append({
+            "type": "function_call",
+            "id": behavior.next_id("fc"),
+            "call_id": behavior.next_id("call"),
+            "name": call["name"],
+            "arguments": arguments if isinstance(arguments, str) else json.dumps(arguments),
+            "status": "completed",
+        })
+        reply = ""
+    else:
+        if has_file_search and not tool_outputs:
+            output.append({
+                "type": "file_search_call",
+                "id": behavior.next_id("fs"),
+                "status": "completed",
+                "queries": [text],
+                "results": None,
+            })
+        if rule and "text" in rule:
+            reply = rule["text"]
+        elif tool_outputs:
+            reply = f"Here is the information you asked for: {tool_outputs[-1]}"
+        else:
+            reply = f"This is a mock answer to: {text[:200]}"
+        output.append(_message_item(behavior, reply))
+
+    input_tokens = _estimate_tokens(json.dumps(body.get("input", "")))
+    output_tokens = _estimate_tokens(reply or json.dumps(call or {}))
+    return {
+        "id": behavior.next_id("resp"),
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": body.get("model", "mock-model"),
+        "output": output,
+        "parallel_tool_calls": True,
+        "tool_choice": body.get("tool_choice", "auto"),
+        "tools": tools,
+        "instructions": body.get("instructions"),
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+def response_events(response: Dict) -> List[Dict]:
+    """Server-sent events for a streamed Responses API call"""
+
+    in_progress = dict(response, status="in_progress", output=[])
+    events = [{"type": "response.created", "response": in_progress},
+              {"type": "response.in_progress", "response": in_progress}]
+
+    for index, item in enumerate(response["output"]):
+        events.append({"type": "response.output_item.added", "output_index": index,
+                       "item": dict(item, status="in_progress")})
+        if item["type"] == "message":
+            text = item["content"][0]["text"]
+            events.append({"type": "response.content_part.added", "item_id": item["id"],
+                           "output_index": index, "content_index": 0,
+                           "part": {"type": "output_text", "text": "", "annotations": []}})
+            for word in re.findall(r"\S+\s*", text):
+                events.append({"type": "response.output_text.delta", "item_id": item["id"],
+                               "output_index": index, "content_index": 0, "delta": word})
+            events.append({"type": "response.output_text.done", "item_id": item["id"],
+                           "output_index": index, "content_index": 0, "text": text})
+            events.append({"type": "response.content_part.done", "item_id": item["id"],
+                           "output_index": index, "content_index": 0, "part": item["content"][0]})
+        elif item["type"] == "function_call":
+            events.append({"type": "response.function_call_arguments.done", "item_id": item["id"],
+                           "output_index": index, "arguments": item["arguments"]})
+        events.append({"type": "response.output_item.done", "output_index": index, "item": item})
+
+    events.append({"type": "response.completed", "response": response})
+    for sequence, event in enumerate(events):
+        event["sequence_number"] = sequence
+    return events
+
+
+def build_chat_completion(behavior: MockBehavior, body: Dict, rule: Optional[Dict]) -> Dict:
+    text = _input_text(body.get("messages"))
+    reply = rule["text"] if rule and "text" in rule else f"This is a mock answer to: {text[:200]}"
+    prompt_tokens = _estimate_tokens(json.dumps(body.get("messages", [])))
+    completion_tokens = _estimate_tokens(reply)
+    return {
+        "id": behavior.next_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock-model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply, "refusal": None},
+            "logprobs": None,
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def chat_chunks(completion: Dict) -> List[Dict]:
+    """chat.completion.chunk objects for a streamed chat completion"""
+    base = {k: completion[k] for k in ("id", "created", "model")}
+    base["object"] = "chat.completion.chunk"
+    text = completion["choices"][0]["message"]["content"]
+
+    chunks = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""},
+                                   "finish_reason": None}])]
+    for word in re.findall(r"\S+\s*", text):
+        chunks.append(dict(base, choices=[{"index": 0, "delta": {"content": word}, "finish_reason": None}]))
+    chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+    return chunks
+
+
+# =========================================
+# HTTP HANDLER
+# =========================================
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockOpenAI/1.0"
+    # Keep-alive responses are small writes: without TCP_NODELAY, Nagle plus
+    # delayed ACK adds ~40 ms to every call
+    disable_nagle_algorithm = True
+
+    # Set by MockOpenAIServer
+    behavior: MockBehavior = None
+    state: Dict = None
+
+    def log_message(self, format, *args):
+        pass  # keep load tests quiet
+
+    # --- helpers ---
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-request-id", self.behavior.next_id("req"))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str):
+        kinds = {
+            400: "invalid_request_error", 401: "authentication_error",
+            404: "invalid_request_error", 429: "rate_limit_exceeded",
+        }
+        self._send_json(status, {"error": {
+            "message": message,
+            "type": kinds.get(status, "server_error"),
+            "param": None,
+            "code": kinds.get(status, "server_error"),
+        }})
+
+    def _send_sse(self, events: List[Dict], named: bool, done_marker: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        for event in events:
+            prefix = f"event: {event['type']}\n" if named else ""
+            self.wfile.write(f"{prefix}data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.behavior.stream_chunk_ms:
+                time.sleep(self.behavior.stream_chunk_ms / 1000)
+        if done_marker:
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    # --- routing ---
+
+    def do_GET(self):
+        self._read_body()
+        path = self.path.split("?")[0].rstrip("/")
+
+        match = re.fullmatch(r"/v1/vector_stores/([^/]+)/file_batches/([^/]+)", path)
+        if match and match.group(2) in self.state["batches"]:
+            return self._send_json(200, self.state["batches"][match.group(2)])
+        match = re.fullmatch(r"/v1/vector_stores/([^/]+)", path)
+        if match and match.group(1) in self.state["vector_stores"]:
+            return self._send_json(200, self.state["vector_stores"][match.group(1)])
+        if path == "/v1/models":
+            return self._send_json(200, {"object": "list", "data": [
+                {"id": "mock-model", "object": "model", "created": 0, "owned_by": "mock"}]})
+        self._send_error(404, f"Unknown endpoint GET {path}")
+
+    def do_POST(self):
+        raw = self._read_body()
+        path = self.path.split("?")[0].rstrip("/")
+
+        if path == "/v1/files":
+            return self._create_file(raw)
+
+        try:
+            body = json.loads(raw) if raw else {}
+        except ValueError:
+            return self._send_error(400, "Request body is not valid JSON")
+
+        if path == "/v1/responses":
+            return self._responses(body)
+        if path == "/v1/chat/completions":
+            return self._chat_completions(body)
+        if path == "/v1/vector_stores":
+            return self._create_vector_store(body)
+        match = re.fullmatch(r"/v1/vector_stores/([^/]+)/file_batches", path)
+        if match:
+            return self._create_file_batch(match.group(1), body)
+        self._send_error(404, f"Unknown endpoint POST {path}")
+
+    # --- endpoints ---
+
+    def _responses(self, body: Dict):
+        rule = self.behavior.rule_for("responses", _input_text(body.get("input")))
+        self.behavior.delay(rule)
+        status = self.behavior.injected_error(rule)
+        if status:
+            return self._send_error(status, "Injected error from mock server")
+
+        response = build_response(self.behavior, body, rule)
+        if body.get("stream"):
+            return self._send_sse(response_events(response), named=True, done_marker=False)
+        self._send_json(200, response)
+
+    def _chat_completions(self, body: Dict):
+        rule = self.behavior.rule_for("chat", _input_text(body.get("messages")))
+        self.behavior.delay(rule)
+        status = self.behavior.injected_error(rule)
+        if status:
+            return self._send_error(status, "Injected error from mock server")
+
+        completion = build_chat_completion(self.behavior, body, rule)
+        if body.get("stream"):
+            return self._send_sse(chat_chunks(completion), named=False, done_marker=True)
+        self._send_json(200, completion)
+
+    def _create_file(self, raw: bytes):
+        filename = re.search(rb'filename="([^"]*)"', raw)
+        purpose = re.search(rb'name="purpose"\r\n\r\n([^\r]*)', raw)
+        file_obj = {
+            "id": self.behavior.next_id("file"),
+            "object": "file",
+            "bytes": len(raw),
+            "created_at": int(time.time()),
+            "filename": filename.group(1).decode("utf-8", "replace") if filename else "upload",
+            "purpose": purpose.group(1).decode() if purpose else "assistants",
+            "status": "processed",
+        }
+        self.state["files"][file_obj["id"]] = file_obj
+        self._send_json(200, file_obj)
+
+    def _create_vector_store(self, body: Dict):
+        store = {
+            "id": self.behavior.next_id("vs"),
+            "object": "vector_store",
+            "created_at": int(time.time()),
+            "name": body.get("name", ""),
+            "usage_bytes": 0,
+            "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
+            "status": "completed",
+            "last_active_at": int(time.time()),
+            "metadata": body.get("metadata") or {},
+        }
+        self.state["vector_stores"][store["id"]] = store
+        self._send_json(200, store)
+
+    def _create_file_batch(self, vector_store_id: str, body: Dict):
+        store = self.state["vector_stores"].get(vector_store_id)
+        if store is None:
+            return self._send_error(404, f"No vector store found with id '{vector_store_id}'")
+
+        count = len(body.get("file_ids") or body.get("files") or [])
+        store["file_counts"]["completed"] += count
+        store["file_counts"]["total"] += count
+        batch = {
+            "id": self.behavior.next_id("vsfb"),
+            "object": "vector_store.files_batch",
+            "created_at": int(time.time()),
+            "vector_store_id": vector_store_id,
+            "status": "completed",
+            "file_counts": {"in_progress": 0, "completed": count, "failed": 0,
+                            "cancelled": 0, "total": count},
+        }
+        self.state["batches"][batch["id"]] = batch
+        self._send_json(200, batch)
+
+
+# =========================================
+# SERVER
+# =========================================
+
+class MockOpenAIServer:
+    """
+    Mock OpenAI server that can run in a background thread
+
+    with MockOpenAIServer(latency_ms=200) as server:
+        client = OpenAI(base_url=server.base_url, api_key="mock")
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **behavior_kwargs):
+        self.behavior = MockBehavior(**behavior_kwargs)
+        handler = type("MockHandler", (_Handler,), {
+            "behavior": self.behavior,
+            "state": {"files": {}, "vector_stores": {}, "batches": {}},
+        })
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--script", help="JSON file with scripted response rules")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--stream-chunk-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    script = json.loads(Path(args.script).read_text(encoding="utf-8")) if args.script else None
+    server = MockOpenAIServer(
+        args.host, args.port,
+        script=script,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        stream_chunk_ms=args.stream_chunk_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    )
+    print(f"🧪 Mock OpenAI API listening on {server.base_url}")
+    print(f"   export OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"\n📊 {server.behavior.stats}")
+
+
+if __name__ == "__main__":
+    main()
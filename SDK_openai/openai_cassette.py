@@ -0,0 +1,363 @@
+# =========================================
+# OpenAI Record / Replay (Cassettes)
+# =========================================
+# Transport-level recording of OpenAI API
+# calls so scripts, the support agent and the
+# notebooks can run offline and be benchmarked
+# without network noise.
+# =========================================
+#
+# Programmatic use:
+#   from openai_cassette import cassette_client
+#   client = cassette_client("cassettes", mode="record")   # hits the API, saves responses
+#   client = cassette_client("cassettes", mode="replay",    # no network
+#                            latency="lognormal:0.8,0.3")
+#
+# Unmodified scripts (patches every OpenAI() created by the script):
+#   python openai_cassette.py --mode record --cassettes cassettes memory_bot.py
+#   python openai_cassette.py --mode replay --cassettes cassettes memory_bot.py
+#
+# In a notebook (aisuite also creates OpenAI clients internally):
+#   import openai_cassette; openai_cassette.install("cassettes", mode="replay")
+# =========================================
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import runpy
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+from urllib.parse import parse_qsl
+
+import httpx
+
+MODES = ("record", "replay", "auto")
+
+# Headers that never affect the response and must not end up on disk
+_SKIPPED_RESPONSE_HEADERS = {"set-cookie", "openai-organization", "openai-project"}
+_BOUNDARY = re.compile(rb"boundary=([^\s;]+)")
+
+
+class CassetteMissError(Exception):
+    """Raised in replay mode when no cassette matches a request"""
+
+
+# =========================================
+# LATENCY DISTRIBUTIONS
+# =========================================
+
+def parse_latency(spec: Union[None, str, float, Callable]) -> Optional[Callable[[random.Random], float]]:
+    """
+    Build a latency sampler from a spec
+
+    None / "none"          - no delay
+    "recorded"             - replay recorded timings (handled by the transport)
+    0.5 or "fixed:0.5"     - constant seconds
+    "uniform:0.2,1.0"      - uniform between bounds
+    "normal:0.8,0.2"       - gaussian (clipped at 0)
+    "lognormal:0.8,0.3"    - lognormal with given median (s) and sigma
+    callable               - f(rng) -> seconds
+    """
+
+    if spec is None or spec == "none" or spec == "recorded":
+        return None
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+# =========================================
+# REQUEST FINGERPRINT
+# =========================================
+
+def _canonical_body(request: httpx.Request) -> bytes:
+    body = request.content
+    content_type = request.headers.get("content-type", "")
+
+    if "application/json" in content_type and body:
+        try:
+            return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+        except ValueError:
+            return body
+    if "multipart/form-data" in content_type:
+        # Boundaries are random per request - remove them from the fingerprint
+        match = _BOUNDARY.search(content_type.encode())
+        if match:
+            return body.replace(match.group(1), b"BOUNDARY")
+    return body
+
+
+def request_key(request: httpx.Request) -> str:
+    """Content address of a request: method, path, sorted query and canonical body"""
+    query = sorted(parse_qsl(request.url.query.decode()))
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.url.path.encode())
+    digest.update(json.dumps(query).encode())
+    digest.update(_canonical_body(request))
+    return digest.hexdigest()
+
+
+# =========================================
+# TRANSPORT
+# =========================================
+
+class _ReplayStream(httpx.SyncByteStream):
+    """Yields recorded chunks, optionally waiting between them"""
+
+    def __init__(self, chunks: List[bytes], delays: List[float]):
+        self.chunks = chunks
+        self.delays = delays
+
+    def __iter__(self):
+        for chunk, delay in zip(self.chunks, self.delays):
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """
+    httpx transport that records responses to, and replays them from, cassette files
+
+    Cassettes are stored content-addressed as <dir>/<key[:2]>/<key>.json.
+    Every recorded response for a request is kept (including streamed
+    chunks and their timing); replay cycles through them in order, so
+    repeated identical requests get the same sequence as when recorded.
+    """
+
+    def __init__(
+        self,
+        cassette_dir: Union[str, Path] = "cassettes",
+        mode: str = "replay",
+        latency: Union[None, str, float, Callable] = None,
+        seed: int = 0,
+        inner: Optional[httpx.BaseTransport] = None,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.cassette_dir = Path(cassette_dir)
+        self.mode = mode
+        self.replay_recorded_timing = latency == "recorded"
+        self.latency = parse_latency(latency)
+        self._rng = random.Random(seed)
+        self._inner = inner
+        self._lock = threading.Lock()
+        self._replay_position: Dict[str, int] = {}
+        self._recorded_this_run: Dict[str, bool] = {}
+        self._cache: Dict[str, Optional[Dict]] = {}  # parsed cassettes, so replay skips disk I/O
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+
+    def _path(self, key: str) -> Path:
+        return self.cassette_dir / key[:2] / f"{key}.json"
+
+    def _load(self, key: str) -> Optional[Dict]:
+        if key not in self._cache:
+            path = self._path(key)
+            self._cache[key] = json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+        return self._cache[key]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        key = request_key(request)
+
+        with self._lock:
+            cassette = self._load(key)
+            replay = self.mode == "replay" or (self.mode == "auto" and cassette is not None)
+
+        if replay:
+            return self._replay(request, key, cassette)
+        return self._record(request, key, cassette)
+
+    # --- replay ---
+
+    def _replay(self, request: httpx.Request, key: str, cassette: Optional[Dict]) -> httpx.Response:
+        if cassette is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            raise CassetteMissError(
+                f"No cassette for {request.method} {request.url.path} (key {key[:12]}) "
+                f"in {self.cassette_dir}"
+            )
+
+        with self._lock:
+            position = self._replay_position.get(key, 0)
+            self._replay_position[key] = position + 1
+            self.stats["hits"] += 1
+            injected = self.latency(self._rng) if self.latency else 0.0
+
+        recorded = cassette["responses"][position % len(cassette["responses"])]
+        chunks = [base64.b64decode(c) for c in recorded["chunks"]]
+
+        if self.replay_recorded_timing:
+            offsets = recorded["chunk_offsets"]
+            delays = [b - a for a, b in zip([0.0] + offsets[:-1], offsets)]
+        else:
+            # Injected latency is spent before the first byte
+            delays = [injected] + [0.0] * (len(chunks) - 1)
+
+        return httpx.Response(
+            status_code=recorded["status"],
+            headers=recorded["headers"],
+            stream=_ReplayStream(chunks, delays),
+            request=request,
+        )
+
+    # --- record ---
+
+    def _record(self, request: httpx.Request, key: str, cassette: Optional[Dict]) -> httpx.Response:
+        if self._inner is None:
+            self._inner = httpx.HTTPTransport()
+
+        start = time.perf_counter()
+        response = self._inner.handle_request(request)
+
+        # Read raw (still encoded) chunks so replay is byte-identical
+        chunks, offsets = [], []
+        try:
+            for chunk in response.stream:
+                chunks.append(chunk)
+                offsets.append(round(time.perf_counter() - start, 6))
+        finally:
+            response.close()
+
+        recorded = {
+            "status": response.status_code,
+            "headers": [
+                [k, v] for k, v in response.headers.multi_items()
+                if k.lower() not in _SKIPPED_RESPONSE_HEADERS
+            ],
+            "chunks": [base64.b64encode(c).decode("ascii") for c in chunks],
+            "chunk_offsets": offsets,
+            "elapsed_seconds": round(time.perf_counter() - start, 6),
+        }
+
+        with self._lock:
+            # First recording of a key in this run replaces older cassettes
+            if cassette is None or not self._recorded_this_run.get(key):
+                cassette = {
+                    "request": {
+                        "method": request.method,
+                        "path": request.url.path,
+                        "body": _canonical_body(request).decode("utf-8", errors="replace")[:20000],
+                    },
+                    "responses": [],
+                }
+            cassette["responses"].append(recorded)
+            self._recorded_this_run[key] = True
+
+            path = self._path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(cassette, indent=1), encoding="utf-8")
+            self._cache[key] = cassette
+            self.stats["recorded"] += 1
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReplayStream(chunks, [0.0] * len(chunks)),
+            request=request,
+        )
+
+    def close(self):
+        if self._inner is not None:
+            self._inner.close()
+
+
+# =========================================
+# CLIENT HELPERS
+# =========================================
+
+def cassette_client(
+    cassette_dir: Union[str, Path] = "cassettes",
+    mode: str = "replay",
+    latency: Union[None, str, float, Callable] = None,
+    seed: int = 0,
+    **client_kwargs,
+):
+    """OpenAI client whose HTTP traffic goes through a CassetteTransport"""
+    from openai import OpenAI
+
+    transport = CassetteTransport(cassette_dir, mode=mode, latency=latency, seed=seed)
+    if mode == "replay":
+        # Misses are deterministic - retrying them only adds delay
+        client_kwargs.setdefault("max_retries", 0)
+        client_kwargs.setdefault("api_key", "replay")
+    return OpenAI(http_client=httpx.Client(transport=transport), **client_kwargs)
+
+
+def install(
+    cassette_dir: Union[str, Path] = "cassettes",
+    mode: str = "replay",
+    latency: Union[None, str, float, Callable] = None,
+    seed: int = 0,
+) -> CassetteTransport:
+    """
+    Route every OpenAI() client created afterwards through one shared cassette transport
+
+    Returns the transport so callers can inspect `transport.stats`.
+    """
+    import openai
+
+    transport = CassetteTransport(cassette_dir, mode=mode, latency=latency, seed=seed)
+    original_init = openai.OpenAI.__init__
+
+    def patched_init(self, *args, **kwargs):
+        kwargs.setdefault("http_client", httpx.Client(transport=transport))
+        if mode == "replay":
+            kwargs.setdefault("max_retries", 0)
+            kwargs.setdefault("api_key", "replay")
+        original_init(self, *args, **kwargs)
+
+    openai.OpenAI.__init__ = patched_init
+    return transport
+
+
+# =========================================
+# CLI: RUN A SCRIPT UNDER RECORD / REPLAY
+# =========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a script with OpenAI record/replay")
+    parser.add_argument("--mode", choices=MODES, default="replay")
+    parser.add_argument("--cassettes", default="cassettes")
+    parser.add_argument("--latency", default=None,
+                        help='e.g. "recorded", "fixed:0.5", "lognormal:0.8,0.3"')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("script")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    transport = install(args.cassettes, mode=args.mode, latency=args.latency, seed=args.seed)
+
+    sys.argv = [args.script] + args.script_args
+    sys.path.insert(0, str(Path(args.script).resolve().parent))
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        print(f"\n📼 Cassettes ({args.mode}): {transport.stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()